@@ -1,134 +1,288 @@
 import cv2
-import mediapipe as mp
-import xgboost as xgb
 import numpy as np
 import json
+import logging
 import base64
 import uuid
 import os
 import sys
+import threading
+import time
+from collections import namedtuple
 from datetime import datetime
-from flask import Flask, render_template, send_from_directory, request, jsonify, Response, session, redirect, url_for
+from flask import Flask, render_template, send_from_directory, request, jsonify, Response, session, redirect, url_for, g
 from flask import Response, after_this_request
 
 # atexit 모듈 추가
 import atexit 
-from urllib.parse import urlparse # URL 파싱을 위해 추가
 
-# Firebase 관련 임포트
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import storage
-from firebase_admin import firestore
+from face_pipeline import analyze_image, create_static_face_mesh, create_tracking_face_mesh, StageTimer
+from upload_queue import BackgroundUploader
+from au_features import AUFeatureExtractor
+from face_mesh_pool import FaceMeshPool
+from inference_server import InferenceServer, InferenceQueueFull, InferenceTimeout
+from score_batcher import ScoreBatcher
+from tree_scorer import TreeEnsembleScorer
+from teacher_reference import DEFAULT_REFERENCE_PATH, load_if_current, model_fingerprint
+from reference_index import METRICS as NEAREST_METRICS, ExpressionIndex
+from video_stream import FrameBroadcaster, StreamProfile, SyntheticFrameSource, parse_stream_profile
+from live_scoring import LiveScorer
+from session_history import ROUND_FIELDS
+from session_store import create_session_store
+from storage_reaper import StorageReaper
+from result_cache import AnalysisCache, cache_namespace
+from local_bucket import LocalBucket
+from local_firestore import LocalFirestore
+from log_config import setup_logging
+from metrics import Counter, Gauge, HistogramVec, MetricsRegistry
+from lazy_init import LazyComponent, LazyProxy, warm_up as warm_up_components
+
+# MediaPipe / Firebase(firebase_admin) / 점수 모델은 모듈 import 시점이 아니라 처음 사용할 때 초기화됩니다.
+# 정적 페이지는 무거운 의존성 없이 바로 응답하고, 나머지는 warm_up() (기본: 백그라운드) 또는 첫 요청에서 준비됩니다.
 
 app = Flask(__name__, static_url_path='/static', static_folder='static')
 app.secret_key = 'your_strong_secret_key_here' # 세션 사용을 위한 secret key 설정 (보안상 강력한 키로 변경 필요)
 
-# --- Firebase 초기화 ---
-service_account_key_path = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
-if not firebase_admin._apps:
+# --- 로깅 ---
+# SMILEFIT_LOG_LEVEL (DEBUG / INFO / WARNING / ERROR). 요청별 기록은 DEBUG 이므로 기본(INFO)에서는 포맷팅 비용도 들지 않음
+# 출력은 큐 리스너 스레드가 처리하므로 요청 스레드가 stderr 쓰기를 기다리지 않음
+# 백그라운드 스레드를 가진 모듈들은 각자 logging.getLogger(__name__) 로 기록하고, 여기서 같은 큐/레벨로 묶음
+MODULE_LOGGERS = ('live_scoring', 'result_cache', 'session_store', 'storage_reaper', 'upload_queue', 'video_stream')
+logger, log_listener = setup_logging('smilefit', os.environ.get('SMILEFIT_LOG_LEVEL', 'INFO'), module_names=MODULE_LOGGERS)
+atexit.register(log_listener.stop) # atexit 은 역순 실행 -> 다른 종료 작업의 기록까지 출력한 뒤 멈춤
+
+# --- Firebase 초기화 (처음 사용할 때) ---
+# SMILEFIT_FIREBASE=local 이면 네트워크 없이 메모리 기반 가짜 Storage/Firestore 사용 (개발/부하 테스트용)
+# 서비스 계정 키가 없거나 초기화에 실패해도 프로세스를 종료하지 않고, /ready 에 오류로 표시됩니다 (업로드는 실패로 기록).
+def init_firebase():
+    """(db, bucket) 을 반환합니다."""
+    if os.environ.get('SMILEFIT_FIREBASE') == 'local':
+        logger.info("[Firebase] 로컬 가짜 Storage/Firestore 를 사용합니다.")
+        return LocalFirestore(), LocalBucket('smilefit-local')
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore, storage
+    service_account_key_path = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
+    if not firebase_admin._apps:
+        try:
+            cred = credentials.Certificate(service_account_key_path)
+            firebase_admin.initialize_app(cred, {
+                'storageBucket': 'smilefit-350ea.firebasestorage.app'
+            })
+            logger.info("[Firebase] Firebase 앱이 성공적으로 초기화되었습니다.")
+        except Exception as e:
+            logger.error("[Firebase] Firebase 앱 초기화 실패: %s", e)
+            raise
+    return firestore.client(), storage.bucket()
+
+firebase = LazyComponent('firebase', init_firebase)
+bucket = LazyProxy(lambda: firebase.get()[1]) # 업로더/정리기는 실제로 Storage 를 쓸 때 Firebase 를 초기화
+
+# 업로드 이미지 디코딩 설정
+# 긴 변 기준 최대 해상도 (0이면 원본 해상도로 디코딩). FaceMesh 는 내부적으로 192~256px 입력을 사용하므로
+# 640 정도로 줄여도 랜드마크 품질에는 영향이 거의 없습니다. 랜드마크는 원본 해상도 기준으로 환산됩니다.
+MAX_DECODE_SIDE = int(os.environ.get('SMILEFIT_MAX_DECODE_SIDE', '0'))
+
+# Storage 업로드는 백그라운드 업로더가 처리 (응답은 업로드 완료를 기다리지 않음)
+storage_uploader = BackgroundUploader(
+    bucket,
+    max_workers=int(os.environ.get('SMILEFIT_UPLOAD_WORKERS', '4')),
+    max_pending=int(os.environ.get('SMILEFIT_UPLOAD_MAX_PENDING', '64')),
+    max_retries=int(os.environ.get('SMILEFIT_UPLOAD_RETRIES', '3'))
+)
+
+# --- MediaPipe 및 점수 모델 초기화 ---
+# 요청 스레드들이 하나의 FaceMesh 그래프를 공유하지 않도록 인스턴스 풀 사용 (기본 크기: CPU 코어 수)
+# 인스턴스(및 mediapipe import)는 처음 빌릴 때 만들어짐
+face_mesh_pool = FaceMeshPool(
+    create_static_face_mesh,
+    size=int(os.environ.get('SMILEFIT_FACE_MESH_POOL_SIZE', '0')) or None
+)
+
+def warm_face_mesh():
+    """FaceMesh 인스턴스 하나를 만들고 빈 이미지로 한 번 실행해 그래프 초기화 비용을 미리 치릅니다."""
+    with face_mesh_pool.acquire() as face_mesh:
+        face_mesh.process(np.zeros((192, 192, 3), dtype=np.uint8))
+
+face_mesh_warm = LazyComponent('face_mesh', warm_face_mesh)
+
+# 점수 모델과 그에 딸린 구성 요소들 (특징 추출기, 모델 해시, 결과 캐시, 점수 병합기)
+Scoring = namedtuple('Scoring', ['model', 'feature_cols', 'au_extractor', 'model_hash', 'score_batcher', 'score_model', 'result_cache'])
+
+# 같은 사진(내용 해시)이 다시 들어오면 (재시도, 더블 클릭 등) 분석 없이 이전 결과를 반환
+# 키에 모델 해시/특징 설정/디코딩 크기를 포함하므로 모델이 바뀌면 이전 결과는 쓰이지 않음
+# SMILEFIT_RESULT_CACHE_SIZE=0 이면 사용 안 함, SMILEFIT_RESULT_CACHE_DIR 를 주면 디스크에도 저장
+RESULT_CACHE_SIZE = int(os.environ.get('SMILEFIT_RESULT_CACHE_SIZE', '512'))
+# 동시에 끝난 라운드들의 특징 행을 잠깐 모아 한 번의 model.predict 로 처리 (배치 크기 1이면 사용 안 함)
+SCORE_BATCH_SIZE = int(os.environ.get('SMILEFIT_SCORE_BATCH_SIZE', '16'))
+
+def init_scoring():
+    model = None
+    feature_cols = []
     try:
-        cred = credentials.Certificate(service_account_key_path)
-        firebase_admin.initialize_app(cred, {
-            'storageBucket': 'smilefit-350ea.firebasestorage.app'
-        })
-        print("[Firebase] Firebase 앱이 성공적으로 초기화되었습니다.")
+        # XGBoost JSON 모델을 NumPy 노드 배열로 직접 평가 (xgboost 패키지 import 불필요)
+        model = TreeEnsembleScorer.load('expression_similarity_model.json')
+        with open('feature_cols.json', 'r', encoding='utf-8') as f:
+            feature_cols = json.load(f)
+        logger.info("XGBoost 모델 및 특징 파일 로드 완료.")
     except Exception as e:
-        print(f"[Firebase] Firebase 앱 초기화 실패: {e}")
-        sys.exit(1)
-
-db = firestore.client()
-bucket = storage.bucket()
-
-# 임시 파일 저장 디렉토리 설정
-UPLOAD_FOLDER = 'temp_uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-# --- MediaPipe 및 XGBoost 모델 초기화 ---
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(
-    static_image_mode=True, 
-    max_num_faces=1,
-    refine_landmarks=True,
-    min_detection_confidence=0.5
-)
+        logger.error("XGBoost 모델 또는 특징 파일 로드 실패: %s", e)
 
-stream_face_mesh_instance = None 
-
-model = None
-feature_cols = []
-try:
-    model = xgb.XGBRegressor()
-    model.load_model('expression_similarity_model.json')
-    with open('feature_cols.json', 'r', encoding='utf-8') as f:
-        feature_cols = json.load(f)
-    print("XGBoost 모델 및 특징 파일 로드 완료.")
-except Exception as e:
-    print(f"XGBoost 모델 또는 특징 파일 로드 실패: {e}")
-
-# --- AU 계산을 위한 랜드마크 인덱스 (FACS 기준, MediaPipe 랜드마크 기반) ---
-AU_LANDMARKS = {
-    'AU01': [336, 296], 
-    'AU02': [334, 298], 
-    'AU04': [9, 8],     
-    'AU05': [159, 144], 
-    'AU06': [205, 206], 
-    'AU07': [159, 145], 
-    'AU09': [19, 219],  
-    'AU10': [11, 10],   
-    'AU11': [61, 291],  
-    'AU12': [308, 78],  
-    'AU14': [41, 13],   
-    'AU15': [84, 17],   
-    'AU17': [13, 15],   
-    'AU20': [32, 262],  
-    'AU23': [13, 14],   
-    'AU24': [13, 14],   
-    'AU25': [13, 14],   
-    'AU26': [10, 152],  
-    'AU28': [13, 14],   
-    'AU43': [145, 374]  
-}
+    # AU 특징 추출기 (feature_cols 순서의 float32 행을 벡터 연산으로 계산)
+    au_extractor = AUFeatureExtractor(feature_cols)
 
-def calculate_au(landmarks):
-    au_dict = {}
-    if not landmarks.any():
-        for col in feature_cols: au_dict[col] = 0.0
-        return au_dict
-    for au, indices in AU_LANDMARKS.items():
-        if indices[0] < len(landmarks) and indices[1] < len(landmarks):
-            p1 = landmarks[indices[0]]
-            p2 = landmarks[indices[1]]
-            au_dict[au] = np.linalg.norm(p1 - p2)
-        else: au_dict[au] = 0.0
-    for au_key in AU_LANDMARKS.keys():
-        au_dict[f"{au_key}_w"] = au_dict.get(au_key, 0.0) * 0.8
-    final_au_features = {}
-    for col in feature_cols: final_au_features[col] = au_dict.get(col, 0.0)
-    return final_au_features
-
-global_cap = None
-def generate_frames():
-    global global_cap, stream_face_mesh_instance
-    if global_cap is None or not global_cap.isOpened():
-        global_cap = cv2.VideoCapture(0)
-        if not global_cap.isOpened():
-            print("웹캠을 열 수 없습니다.")
-            return
-    if stream_face_mesh_instance is None:
-        stream_face_mesh_instance = mp_face_mesh.FaceMesh(
-            static_image_mode=False, 
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.5
+    # 모델 JSON + feature_cols 해시 (모델 파일이 바뀌면 선생님 기준 데이터/결과 캐시가 무효화됨)
+    model_hash = None
+    try:
+        model_hash = model_fingerprint('expression_similarity_model.json', feature_cols)
+    except OSError as e:
+        logger.error("[Model] 모델 해시 계산 실패: %s", e)
+
+    result_cache = None
+    if RESULT_CACHE_SIZE > 0 and model_hash is not None:
+        result_cache = AnalysisCache(
+            cache_namespace(model_hash, au_extractor.feature_cols, au_extractor.pair_index.tolist(), MAX_DECODE_SIDE),
+            max_entries=RESULT_CACHE_SIZE,
+            disk_dir=os.environ.get('SMILEFIT_RESULT_CACHE_DIR') or None,
+            disk_max_entries=int(os.environ.get('SMILEFIT_RESULT_CACHE_DISK_MAX', '10000'))
+        )
+
+    score_batcher = None
+    if model is not None and SCORE_BATCH_SIZE > 1:
+        score_batcher = ScoreBatcher(
+            model,
+            max_batch_size=SCORE_BATCH_SIZE,
+            max_wait_ms=float(os.environ.get('SMILEFIT_SCORE_BATCH_WAIT_MS', '2'))
         )
-    while global_cap.isOpened():
-        success, frame = global_cap.read()
-        if not success: break
-        frame = cv2.flip(frame, 1)
-        ret, buffer = cv2.imencode('.jpg', frame)
-        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+    return Scoring(model, feature_cols, au_extractor, model_hash, score_batcher, score_batcher or model, result_cache)
+
+scoring = LazyComponent('model', init_scoring)
+
+# --- 선생님 AU 기준 데이터 (python teacher_reference.py 로 미리 생성한 .npz) ---
+def init_teacher_references():
+    model_hash = scoring.get().model_hash
+    if model_hash is None:
+        return None
+    try:
+        teacher_references = load_if_current(
+            os.environ.get('SMILEFIT_TEACHER_REFERENCES', DEFAULT_REFERENCE_PATH),
+            model_hash
+        )
+    except Exception as e:
+        logger.error("[Teacher Reference] 선생님 기준 데이터 로드 실패: %s", e)
+        return None
+    if teacher_references is not None:
+        logger.info("[Teacher Reference] 선생님 기준 데이터 %d개 로드 완료.", len(teacher_references))
+    return teacher_references
+
+teacher_refs = LazyComponent('teacher_references', init_teacher_references, required=False)
+
+# --- 가장 가까운 기준 표정 인덱스 (선생님 + e_game + expression 세트) ---
+def init_expression_index():
+    teacher_references = teacher_refs.get()
+    if teacher_references is None:
+        return None
+    index = ExpressionIndex.from_table(teacher_references)
+    logger.info("[Expression Index] 기준 표정 %d개 (얼굴 없음 %d개 제외): %s", len(index), index.skipped,
+                ", ".join(f"{name}={len(groups)}그룹" for name, groups in index.sets().items()))
+    return index
+
+expression_index = LazyComponent('expression_index', init_expression_index, required=False)
+NEAREST_MAX_K = int(os.environ.get('SMILEFIT_NEAREST_MAX_K', '50'))
+
+# --- 추론 서버 모드 (선택) ---
+# SMILEFIT_INFERENCE_WORKERS > 0 이면 디코딩/FaceMesh/AU 계산/예측을 워커 프로세스 풀에서 실행하고,
+# 웹 프로세스는 업로드 수신과 응답만 담당합니다. 워커는 forkserver (SMILEFIT_INFERENCE_START_METHOD 로 변경) 로 시작하며,
+# 이 파일을 직접 실행한 경우 워커에서 '__mp_main__' 으로 다시 import 되므로 그때는 워밍업/종료 정리를 하지 않습니다.
+INFERENCE_WORKERS = int(os.environ.get('SMILEFIT_INFERENCE_WORKERS', '0'))
+
+def init_inference_server():
+    server = InferenceServer(
+        'expression_similarity_model.json',
+        'feature_cols.json',
+        workers=INFERENCE_WORKERS,
+        max_queue=int(os.environ.get('SMILEFIT_INFERENCE_MAX_QUEUE', '0')) or None,
+        timeout=float(os.environ.get('SMILEFIT_INFERENCE_TIMEOUT', '10')),
+        max_side=MAX_DECODE_SIDE,
+        start_method=os.environ.get('SMILEFIT_INFERENCE_START_METHOD') or None
+    )
+    server.start()
+    logger.info("[Inference Server] 워커 프로세스 %d개 준비 완료.", INFERENCE_WORKERS)
+    return server
+
+inference = LazyComponent('inference_server', init_inference_server) if INFERENCE_WORKERS > 0 else None
+
+# --- 웹캠 스트리밍 ---
+# 카메라 캡처/JPEG 인코딩은 브로드캐스터 스레드 하나가 담당하고, /video_feed 클라이언트들은 결과만 나눠 받음
+# SMILEFIT_SYNTHETIC_CAMERA=1 이면 실제 웹캠 대신 합성 프레임 사용 (카메라 없는 환경에서 테스트용)
+CAMERA_INDEX = int(os.environ.get('SMILEFIT_CAMERA_INDEX', '0'))
+
+def open_camera():
+    if os.environ.get('SMILEFIT_SYNTHETIC_CAMERA') == '1':
+        return SyntheticFrameSource()
+    return cv2.VideoCapture(CAMERA_INDEX)
+
+# 스트림 기본 출력 설정 (클라이언트는 /video_feed?w=&h=&q=&fps= 로 덮어쓸 수 있음)
+# complex_fit.html 이 320x240 으로 표시하므로 기본값도 그 크기에 맞춰 인코딩 (0 이면 원본 크기 / FPS 제한 없음)
+DEFAULT_STREAM_PROFILE = StreamProfile(
+    width=int(os.environ.get('SMILEFIT_STREAM_WIDTH', '320')),
+    height=int(os.environ.get('SMILEFIT_STREAM_HEIGHT', '240')),
+    quality=int(os.environ.get('SMILEFIT_STREAM_JPEG_QUALITY', '70')),
+    max_fps=int(os.environ.get('SMILEFIT_STREAM_MAX_FPS', '15')),
+)
+STREAM_ADAPTIVE = os.environ.get('SMILEFIT_STREAM_ADAPTIVE', '1') != '0' # 소켓 쓰기가 밀리면 품질/FPS 자동 감소
+
+frame_broadcaster = FrameBroadcaster(open_camera, default_profile=DEFAULT_STREAM_PROFILE, adaptive=STREAM_ADAPTIVE)
+
+def generate_frames(profile=None):
+    for jpeg in frame_broadcaster.frames(profile):
+        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+
+# --- 실시간 AU 점수 (서버 측 분석) ---
+# 브로드캐스터의 프레임을 추적 모드 FaceMesh 로 초당 LIVE_ANALYSIS_FPS 번 분석. /live_au_stream 으로 결과를 푸시하고
+# /submit_live_snapshot 은 최신 결과를 그대로 라운드 기록으로 저장 (클라이언트 캡처/업로드 왕복 없음)
+LIVE_ANALYSIS_FPS = float(os.environ.get('SMILEFIT_LIVE_ANALYSIS_FPS', '10'))
+LIVE_SNAPSHOT_MAX_AGE = float(os.environ.get('SMILEFIT_LIVE_SNAPSHOT_MAX_AGE', '2.0')) # 이보다 오래된 결과는 캡처에 쓰지 않음(초)
+# FaceMesh 는 SMILEFIT_TRACK_EVERY_K 프레임마다 (또는 화면 변화가 SMILEFIT_TRACK_MOTION_THRESHOLD 를 넘을 때) 실행하고,
+# AU 거리는 SMILEFIT_AU_SMOOTHING (one_euro / ema / none) 으로 프레임 간 떨림을 줄임
+LIVE_TRACKER_OPTIONS = {
+    'every_k': int(os.environ.get('SMILEFIT_TRACK_EVERY_K', '2')),
+    'motion_threshold': float(os.environ.get('SMILEFIT_TRACK_MOTION_THRESHOLD', '6.0')),
+    'smoothing': os.environ.get('SMILEFIT_AU_SMOOTHING', 'one_euro'),
+    'min_cutoff': float(os.environ.get('SMILEFIT_ONE_EURO_MIN_CUTOFF', '1.0')),
+    'beta': float(os.environ.get('SMILEFIT_ONE_EURO_BETA', '0.05')),
+    'alpha': float(os.environ.get('SMILEFIT_EMA_ALPHA', '0.5')),
+}
+
+def init_live_scorer():
+    components = scoring.get()
+    return LiveScorer(frame_broadcaster, create_tracking_face_mesh, components.au_extractor, components.score_model,
+                      rate_hz=LIVE_ANALYSIS_FPS, tracker_options=LIVE_TRACKER_OPTIONS)
+
+live_scoring = LazyComponent('live_scoring', init_live_scorer, required=False)
+
+# --- 준비 상태 / 워밍업 ---
+# SMILEFIT_WARMUP: 'background' (기본, 서버는 바로 요청을 받고 별도 스레드에서 준비), 'sync' (import 시 모두 준비), 'off'
+# gunicorn 등에서 워커별로 직접 준비하려면 SMILEFIT_WARMUP=off 로 두고 post_fork 훅에서 app.warm_up() 을 호출
+WARMUP_MODE = os.environ.get('SMILEFIT_WARMUP', 'background')
+IN_WORKER_PROCESS = __name__ == '__mp_main__' # multiprocessing 워커가 실행 스크립트로서의 app.py 를 다시 import 한 경우
+# 추론 서버 모드에서는 업로드 분석을 워커의 FaceMesh 가 하므로 웹 프로세스의 FaceMesh 는 미리 만들지 않음
+LAZY_COMPONENTS = [component for component in (firebase, scoring, teacher_refs, expression_index,
+                                                face_mesh_warm if inference is None else None, inference, live_scoring)
+                   if component is not None]
+
+def warm_up():
+    """모든 무거운 구성 요소를 지금 초기화합니다. 실패한 구성 요소는 기록만 하고 계속 진행하며, 모두 준비됐으면 True."""
+    start = time.perf_counter()
+    ok = warm_up_components(LAZY_COMPONENTS, on_error=lambda component, e: logger.error("[Warm-up] %s 초기화 실패: %s", component.name, e))
+    logger.info("[Warm-up] %s (%.0fms): %s", "완료" if ok else "일부 실패", (time.perf_counter() - start) * 1000.0,
+                ", ".join(f"{c.name}={c.status()['init_ms']}ms" for c in LAZY_COMPONENTS if c.ready))
+    return ok
+
+def start_background_warm_up():
+    thread = threading.Thread(target=warm_up, name='smilefit-warm-up', daemon=True)
+    thread.start()
+    return thread
 
 # --- Flask 라우팅 ---
 @app.route('/')
@@ -164,7 +318,36 @@ def video_feed():
         response.headers['Access-Control-Allow-Origin'] = '*'
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
         return response
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    profile = parse_stream_profile(request.args, DEFAULT_STREAM_PROFILE)
+    return Response(generate_frames(profile), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/stats')
+def server_stats():
+    """업로드 큐 / FaceMesh 풀 / 추론 서버 / 점수 병합기 상태를 JSON 으로 반환합니다. 아직 초기화되지 않은 구성 요소는 null."""
+    components = scoring.peek()
+    inference_server = inference.peek() if inference is not None else None
+    live_scorer = live_scoring.peek()
+    return jsonify({
+        'storage_uploader': storage_uploader.stats(),
+        'face_mesh_pool': face_mesh_pool.stats(),
+        'inference_server': inference_server.stats() if inference_server is not None else None,
+        'score_batcher': components.score_batcher.stats() if components and components.score_batcher else None,
+        'video_stream': frame_broadcaster.stats(),
+        'live_scoring': live_scorer.stats() if live_scorer is not None else None,
+        'session_store': session_store.stats(),
+        'storage_reaper': storage_reaper.stats(),
+        'result_cache': components.result_cache.stats() if components and components.result_cache else None,
+        'startup': {component.name: component.status() for component in LAZY_COMPONENTS},
+    }), 200
+@app.route('/ready')
+def readiness():
+    """필수 구성 요소(Firebase, 점수 모델, FaceMesh, 추론 서버)가 모두 준비되면 200, 아니면 503 (로드 밸런서 readiness 검사용)."""
+    components = {component.name: component.status() for component in LAZY_COMPONENTS}
+    ready = all(status['ready'] for status in components.values() if status['required'])
+    return jsonify({"ready": ready, "components": components}), 200 if ready else 503
+@app.route('/metrics')
+def prometheus_metrics():
+    """요청 수 / 단계별 시간 / 오류 분류 / 세션 저장소 게이지를 Prometheus 텍스트 형식으로 반환합니다."""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
 # ==================================================
 # 👇 타워 디펜스 게임 페이지 추가
 # ==================================================
@@ -179,246 +362,563 @@ def play_tower_page():
 # 게임 페이지 추가 완료 
 # ==================================================
 
-# --- 사용자별 임시 데이터 저장을 위한 전역 딕셔너리 (메모리 기반) ---
-user_session_data = {} 
+# --- 사용자별 임시 데이터 저장소 ---
+# SMILEFIT_SESSION_STORE: 'memory' (기본, 프로세스 메모리 LRU + TTL) 또는 'sqlite:///<경로>' (WAL, 여러 워커 프로세스가 공유)
+# 접근이 없는 세션은 SMILEFIT_SESSION_TTL 초 뒤 만료되고, 세션 수/메모리 한도를 넘으면 오래된 세션부터 축출됨
+# 만료/축출된 세션의 사진은 StorageReaper 가 백그라운드에서 동시에 삭제 (SMILEFIT_REAPER_INTERVAL 초마다 만료 검사)
+storage_reaper = StorageReaper(
+    bucket,
+    max_workers=int(os.environ.get('SMILEFIT_REAPER_WORKERS', '8')),
+    interval=float(os.environ.get('SMILEFIT_REAPER_INTERVAL', '60'))
+)
+CLEANUP_TIMEOUT = float(os.environ.get('SMILEFIT_CLEANUP_TIMEOUT', '10')) # 종료 시 사진 삭제를 기다리는 최대 시간(초)
+
+def reap_session_photos(session_id, rounds):
+    scheduled = storage_reaper.schedule_rounds(rounds)
+    if scheduled:
+        logger.info("[Session Store] 만료 세션 %s: 사진 %d개 삭제 예약", session_id, scheduled)
+
+session_store = create_session_store(
+    os.environ.get('SMILEFIT_SESSION_STORE', 'memory'),
+    max_sessions=int(os.environ.get('SMILEFIT_SESSION_MAX_SESSIONS', '10000')),
+    max_bytes=int(os.environ.get('SMILEFIT_SESSION_MAX_BYTES', str(64 * 1024 * 1024))),
+    ttl_seconds=float(os.environ.get('SMILEFIT_SESSION_TTL', '7200')),
+    on_evict=reap_session_photos,
+)
+storage_reaper.expire = session_store.expire
+storage_reaper.start()
+
+# --- 지표 (/metrics, Prometheus 텍스트 형식) ---
+# 단계별 시간은 StageTimer 의 ms 값을 그대로 관측하고 출력할 때 초 단위로 환산
+LATENCY_BUCKETS_MS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+metrics_registry = MetricsRegistry()
+REQUESTS = metrics_registry.register(Counter(
+    'smilefit_requests_total', '처리한 HTTP 요청 수', ('endpoint', 'method', 'status')))
+REQUEST_LATENCY = metrics_registry.register(HistogramVec(
+    'smilefit_request_duration_seconds', 'HTTP 요청 처리 시간 (스트리밍 응답은 응답 객체 생성까지)',
+    LATENCY_BUCKETS_MS, ('endpoint',), scale=0.001))
+STAGE_LATENCY = metrics_registry.register(HistogramVec(
+    'smilefit_stage_duration_seconds',
+    '사진 제출 처리 단계별 시간 (parse, cache, decode, landmark_wait, landmark, au, predict, session_write, storage_upload 등)',
+    LATENCY_BUCKETS_MS, ('stage',), scale=0.001))
+ERRORS = metrics_registry.register(Counter(
+    'smilefit_errors_total', '분류별 오류 수 (no_face, decode_failed, upload_failed, upload_rejected, inference_busy, internal)',
+    ('category',)))
+metrics_registry.register(Gauge(
+    'smilefit_session_store_sessions', '세션 저장소의 세션 수', lambda: session_store.stats()['sessions']))
+metrics_registry.register(Gauge(
+    'smilefit_session_store_rounds', '세션 저장소의 라운드 기록 수', lambda: session_store.stats()['rounds']))
+metrics_registry.register(Gauge(
+    'smilefit_session_store_bytes', '세션 저장소가 차지하는 크기 (memory: 열 단위 기록의 메모리 추정치, sqlite: DB 파일 크기)',
+    lambda: session_store.stats()['bytes']))
+metrics_registry.register(Gauge(
+    'smilefit_storage_uploads_in_flight', '대기 중이거나 진행 중인 Storage 업로드 수', lambda: storage_uploader.stats()['in_flight']))
+metrics_registry.register(Gauge(
+    'smilefit_storage_deletes_pending', '대기 중인 Storage 사진 삭제 수', lambda: storage_reaper.stats()['pending']))
+metrics_registry.register(Gauge(
+    'smilefit_face_mesh_in_use', '사용 중인 FaceMesh 인스턴스 수', lambda: face_mesh_pool.stats()['in_use']))
+metrics_registry.register(Gauge(
+    'smilefit_result_cache_entries', '결과 캐시 메모리 항목 수',
+    lambda: scoring.peek().result_cache.stats()['memory_entries'] if scoring.ready and scoring.peek().result_cache else None))
+
+def observe_stages(timer):
+    for stage, ms in timer.timings.items():
+        STAGE_LATENCY.observe(ms, stage=stage)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    endpoint = request.endpoint or 'not_found' # 등록되지 않은 경로를 라벨로 쓰지 않도록 (라벨 수 제한)
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if start is not None:
+        REQUEST_LATENCY.observe((time.perf_counter() - start) * 1000.0, endpoint=endpoint)
+    return response
 
 # 서버 시작 시 또는 사용자가 특정 세션을 시작할 때 생성되는 고유 ID를 세션에 저장
+# (저장소 항목은 첫 라운드 기록 시 만들어지므로, 제출하지 않는 방문자는 저장소를 차지하지 않음)
 @app.before_request
 def make_session_id():
     if 'user_session_id' not in session:
         session['user_session_id'] = str(uuid.uuid4())
-        user_session_data[session['user_session_id']] = [] 
 
 # 서버 종료 시 (Ctrl+C) 실행될 함수
 def cleanup_user_data():
-    global user_session_data
-    print("\n[Cleanup] 서버 종료 감지: 임시 사용자 데이터 삭제를 시작합니다.")
-    
-    # 각 세션의 데이터를 순회하며 photo_url을 추출하여 Storage에서 삭제
-    for session_id, rounds_data in list(user_session_data.items()):
-        for round_data in rounds_data:
-            photo_url = round_data.get('photo_url')
-            if photo_url and photo_url != "no_image_provided" and photo_url != "upload_failed":
-                try:
-                    # Storage URL에서 파일 경로를 정확하게 추출
-                    # bucket.blob()은 'au_captures/teacher_id/filename.jpg'와 같은 버킷 내 경로를 기대
-                    
-                    # public URL에서 버킷 이름과 파일 경로를 분리하여 추출
-                    # 예: https://storage.googleapis.com/YOUR_BUCKET_NAME/path/to/file.jpg
-                    # 또는 https://firebasestorage.googleapis.com/v0/b/YOUR_BUCKET_NAME/o/path%2Fto%2Ffile.jpg?...
-                    
-                    # 가장 간단하고 일반적인 public URL에서 경로 추출 (bucket.name을 사용)
-                    if bucket.name in photo_url: # 버킷 이름이 URL에 포함되어 있는지 확인
-                        # URL에서 버킷 이름 뒤의 경로만 추출
-                        # 예: "smilefit-350ea.firebasestorage.app/au_captures/sophia/..."
-                        # 또는 "storage.googleapis.com/smilefit-350ea.appspot.com/au_captures/sophia/..."
-                        
-                        # Firebase Storage의 일반적인 URL 형식:
-                        # https://firebasestorage.googleapis.com/v0/b/{bucket_name}/o/{path_to_file}?alt=media
-                        # 또는 레거시 GCS URL:
-                        # https://storage.googleapis.com/{bucket_name}/{path_to_file}
-                        
-                        # urlparse를 사용하여 path를 추출한 후, 버킷 이름을 제거
-                        parsed_url = urlparse(photo_url)
-                        full_path_in_url = parsed_url.path.lstrip('/') # /v0/b/bucket_name/o/path/to/file
-                        
-                        # path_to_file 부분만 추출
-                        # 예: 'v0/b/smilefit-350ea.firebasestorage.app/o/au_captures/sophia/...'
-                        # 버킷 이름 이후 'o/' 부분을 찾아 그 뒤부터 경로로 사용
-                        if '/o/' in full_path_in_url:
-                            file_path_in_storage = full_path_in_url.split('/o/', 1)[1]
-                        else: # 구글 스토리지 레거시 URL 또는 다른 형식
-                            file_path_in_storage = full_path_in_url.replace(f"{bucket.name}/", '', 1)
-                        
-                        # URL 인코딩된 슬래시 '%2F'를 다시 '/'로 디코딩
-                        file_path_in_storage = file_path_in_storage.replace('%2F', '/')
-
-                        blob = bucket.blob(file_path_in_storage)
-                        if blob.exists(): 
-                            blob.delete()
-                            print(f"[Cleanup] Storage 파일 삭제 성공: {file_path_in_storage}")
-                        else:
-                            print(f"[Cleanup] Storage 파일 없음 (이미 삭제되었거나 경로 오류): {file_path_in_storage}")
-                    else:
-                        print(f"[Cleanup] Storage 파일 삭제 실패: URL 형식 불일치 (버킷 이름 없음) {photo_url}")
-
-                except Exception as e:
-                    print(f"[Cleanup] Storage 파일 삭제 실패 ({file_path_in_storage if 'file_path_in_storage' in locals() else photo_url}): {e}")
-    
-    user_session_data = {} 
-    print("[Cleanup] 모든 임시 사용자 데이터가 메모리에서 삭제되었습니다.")
-# 앱 종료 시 cleanup_user_data 함수를 실행하도록 등록
-atexit.register(cleanup_user_data)
-
-
-# --- AU 데이터 제출을 위한 라우트 (Firebase 저장 대신 메모리 임시 저장) ---
+    logger.info("[Cleanup] 서버 종료 감지: 임시 사용자 데이터 삭제를 시작합니다.")
+
+    # 진행 중인 업로드가 끝나야 photo_url 이 채워지므로 먼저 업로더를 정리
+    storage_uploader.shutdown(wait=True)
+
+    if session_store.shared:
+        # 다른 워커 프로세스가 같은 저장소를 쓰고 있으므로 이 프로세스 종료만으로 지우지 않음 (TTL 만료 시 정리)
+        logger.info("[Cleanup] 공유 세션 저장소는 유지합니다.")
+    else:
+        # 모든 세션의 사진 삭제를 한꺼번에 예약하고 스레드 풀에서 동시에 삭제 (exists 확인 없이 delete 한 번)
+        # Firebase 를 한 번도 초기화하지 않았다면 업로드된 사진도 없으므로 종료 중에 초기화하지 않음
+        scheduled = 0
+        if firebase.ready:
+            for session_id, rounds_data in session_store.sessions():
+                scheduled += storage_reaper.schedule_rounds(rounds_data)
+        session_store.clear()
+        logger.info("[Cleanup] Storage 사진 %d개 삭제 요청, 메모리의 임시 사용자 데이터 삭제 완료.", scheduled)
+
+    remaining = storage_reaper.shutdown(timeout=CLEANUP_TIMEOUT)
+    stats = storage_reaper.stats()
+    logger.info("[Cleanup] 삭제 %d개, 이미 없음 %d개, 실패 %d개, 시간 초과로 취소 %d개",
+                stats['deleted'], stats['not_found'], stats['failed'], remaining)
+# 앱 종료 시 cleanup_user_data 함수를 실행하도록 등록 (추론 워커로 다시 import 된 경우 제외)
+if not IN_WORKER_PROCESS:
+    atexit.register(cleanup_user_data)
+
+
+class PhotoUpload:
+    """
+    백그라운드 사진 업로드 하나. 분석이 끝나기 전에 업로드를 시작하고, 라운드 기록이 저장되면 attach() 로 연결합니다.
+    업로드가 먼저 끝나면 결과를 보관했다가 연결할 때 반영하고, 기록을 저장하지 못하면 discard() 로 업로드된 사진을 지웁니다.
+    """
+
+    def __init__(self, storage_path):
+        self.storage_path = storage_path
+        self.submitted = time.perf_counter()
+        self.status = 'pending' # pending / failed (대기열이 가득 참)
+        self._lock = threading.Lock()
+        self._target = None # (session_id, round_id) 또는 'discarded'
+        self._result = None # (public_url, error)
+
+    def on_done(self, public_url, error):
+        # 대기열 대기 + 재시도를 포함한 업로드 완료까지의 시간
+        STAGE_LATENCY.observe((time.perf_counter() - self.submitted) * 1000.0, stage='storage_upload')
+        if error is None:
+            logger.debug("[Firebase Storage] 이미지 업로드 성공: %s", public_url)
+        else:
+            ERRORS.inc(category='upload_failed')
+            logger.warning("[Firebase Storage] 이미지 업로드 실패 (%s): %s", self.storage_path, error)
+        with self._lock:
+            target = self._target
+            if target is None:
+                self._result = (public_url, error)
+                return
+        self._apply(target, public_url, error)
+
+    def attach(self, session_id, round_id):
+        """라운드 기록과 연결합니다. 업로드가 이미 끝났으면 기록을 갱신하고 (photo_url, photo_status) 를 반환 (아니면 None)."""
+        with self._lock:
+            self._target = (session_id, round_id)
+            result = self._result
+        if result is None:
+            return None
+        return self._apply(self._target, *result)
+
+    def discard(self):
+        """기록을 저장하지 않는 경우 (분석 혼잡, 오류). 이미 연결된 업로드에는 아무 일도 하지 않습니다."""
+        with self._lock:
+            if self._target is not None:
+                return
+            self._target = 'discarded'
+            result = self._result
+        if result is not None:
+            self._apply('discarded', *result)
+
+    def _apply(self, target, public_url, error):
+        if target == 'discarded':
+            if error is None:
+                storage_reaper.schedule_paths([self.storage_path])
+            return None
+        session_id, round_id = target
+        if error is None:
+            if not session_store.update_round(session_id, round_id, {'photo_url': public_url, 'photo_status': "uploaded"}):
+                # 업로드 도중 세션이 만료/축출됨 -> 아무도 참조하지 않는 사진이므로 바로 삭제
+                storage_reaper.schedule_paths([self.storage_path])
+            return public_url, "uploaded"
+        session_store.update_round(session_id, round_id, {'photo_url': "upload_failed", 'photo_status': "failed"})
+        return "upload_failed", "failed"
+
+def start_photo_upload(storage_path, photo_bytes, content_type):
+    """사진 업로드를 바로 백그라운드 큐에 넣고 PhotoUpload 를 반환합니다 (대기열이 가득 차면 status='failed')."""
+    upload = PhotoUpload(storage_path)
+    if not storage_uploader.submit(storage_path, photo_bytes, content_type, upload.on_done):
+        ERRORS.inc(category='upload_rejected')
+        logger.warning("[Firebase Storage] 업로드 대기열이 가득 차 이미지 업로드를 건너뜁니다.")
+        upload.status = 'failed'
+    return upload
+
+def store_round(session_id, round_data, photo=None):
+    """
+    라운드 기록을 세션 저장소에 추가합니다. photo 는 (storage_path, bytes, content_type) 또는 이미 시작한 PhotoUpload 이며,
+    업로드가 끝나면 저장소에 있는 기록의 photo_url / photo_status 를 갱신합니다. round_data 에는 응답용 현재 상태가 남습니다.
+    """
+    if photo is None:
+        return session_store.append_round(session_id, round_data)
+
+    upload = photo if isinstance(photo, PhotoUpload) else start_photo_upload(*photo)
+    if upload.status == 'failed':
+        round_data['photo_url'] = "upload_failed"
+        round_data['photo_status'] = "failed"
+        return session_store.append_round(session_id, round_data)
+
+    round_data['photo_url'] = "upload_pending"
+    round_data['photo_status'] = "pending"
+    round_id = session_store.append_round(session_id, round_data)
+    done = upload.attach(session_id, round_id)
+    if done is not None:
+        round_data['photo_url'], round_data['photo_status'] = done
+    return round_id
+
+def analyze_photo(photo_bytes, timer):
+    """업로드 사진 분석 결과 ((au_row, score, status), cached). 추론 서버가 혼잡하면 InferenceQueueFull/Timeout."""
+    components = scoring.get()
+    result_cache = components.result_cache
+
+    def compute():
+        if inference is not None:
+            inference_server = inference.get()
+            with timer.stage('inference'):
+                au_row, score, status, worker_timings = inference_server.analyze(photo_bytes)
+            timer.timings.update(worker_timings)
+            return au_row, score, status
+        return analyze_image(photo_bytes, face_mesh_pool, components.au_extractor, components.score_model, MAX_DECODE_SIDE, timer)
+
+    if result_cache is None:
+        return compute(), False
+    with timer.stage('cache'):
+        key = result_cache.key(photo_bytes)
+    return result_cache.get_or_compute(key, compute)
+
+# --- AU 데이터 제출 (Firebase 저장 대신 메모리 임시 저장) ---
+# Flask 라우트와 ASGI 모드(asgi.py)가 같이 쓰는 단계: 업로드 시작 -> 분석 (실행기에서 await 가능) -> 라운드 기록 저장
+def begin_submission(teacher_id, photo_bytes, filename, content_type):
+    """사진이 있으면 분석을 기다리지 않고 Storage 업로드를 바로 시작해 PhotoUpload 를 반환합니다 (분석과 전송이 동시에 진행)."""
+    if not photo_bytes:
+        logger.debug("[app.py] 이미지 파일이 전달되지 않았습니다.")
+        return None
+    unique_filename = f"au_capture_temp_{uuid.uuid4()}{os.path.splitext(filename or '')[1]}"
+    return start_photo_upload(f"au_captures/{teacher_id}/{unique_filename}", photo_bytes, content_type or 'image/jpeg')
+
+def run_submission_analysis(photo_bytes, timer):
+    """
+    ((au_row, score, status), cached). 사진이 없으면 ((None, 0.0, None), False).
+    결과 캐시 -> 추론 서버 모드면 워커 프로세스, 아니면 이 프로세스에서 MediaPipe + 점수 모델 실행.
+    추론 서버가 혼잡하면 InferenceQueueFull / InferenceTimeout 을 그대로 던집니다.
+    """
+    if not photo_bytes:
+        return (None, 0.0, None), False
+    try:
+        analysis, cached = analyze_photo(photo_bytes, timer)
+    except (InferenceQueueFull, InferenceTimeout) as e:
+        ERRORS.inc(category='inference_busy')
+        logger.warning("[Inference Server] %s", e)
+        raise
+    analysis_status = analysis[2]
+    if analysis_status in ('no_face', 'decode_failed'):
+        ERRORS.inc(category=analysis_status)
+        logger.debug("[app.py] 이미지 분석 실패: %s", analysis_status)
+    return analysis, cached
+
+def busy_response(error):
+    return {"status": "error", "message": f"서버가 혼잡합니다. 잠시 후 다시 시도해주세요. ({error})"}, 503
+
+def complete_submission(session_id, teacher_id, round_number, analysis, upload, timer):
+    """분석 결과를 라운드 기록으로 저장하고 (응답 dict, HTTP 상태) 를 반환합니다."""
+    (current_au_row, current_score, _), cached = analysis
+    au_extractor = scoring.get().au_extractor
+    if current_au_row is None:
+        current_au_row = np.zeros(len(au_extractor.feature_cols), dtype=np.float32)
+    au_values_for_db = au_extractor.detail_values(current_au_row)
+    overall_score_for_db = float(f"{current_score:.4f}")
+
+    if not session_id:
+        logger.warning("[submit_au_data_with_image] 경고: 세션 ID 없음, 데이터 저장 불가.")
+        if upload is not None:
+            upload.discard()
+        return {"status": "error", "message": "세션 ID가 없어 데이터를 저장할 수 없습니다."}, 500
+
+    # 데이터 저장 로직을 메모리 기반으로 변경
+    round_data = {
+        'teacher_id': teacher_id,
+        'round_number': round_number,
+        'overall_score': overall_score_for_db,
+        'au_detail_values': au_values_for_db,
+        'photo_url': "no_image_provided",
+        'photo_status': "none", # none / pending / uploaded / failed
+        'timestamp': datetime.now().isoformat() # 서버 시간 기록 (Firebase Timestamp 대신)
+    }
+
+    # 세션 저장소에 기록하고 업로드와 연결. 업로드가 끝나면 저장소 기록의 photo_url 이 채워짐
+    with timer.stage('session_write'):
+        store_round(session_id, round_data, upload)
+    observe_stages(timer)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[Memory Storage] 사용자 데이터 저장 성공: 세션 %s, 라운드 %s, 점수 %s (%s)",
+                     session_id, round_number, overall_score_for_db, timer.summary())
+
+    return {
+        "status": "success",
+        "message": "데이터가 메모리에 임시 저장되었습니다.",
+        "photo_url": round_data['photo_url'],
+        "photo_status": round_data['photo_status'],
+        "au_detail": au_values_for_db,
+        "overall_score": overall_score_for_db,
+        "cached": cached,
+        "timings_ms": timer.as_dict()
+    }, 200
+
+def internal_error_response(error):
+    ERRORS.inc(category='internal')
+    logger.exception("[app.py] 요청 처리 중 예상치 못한 오류 발생: %s", error)
+    return {"status": "error", "message": f"서버 처리 중 오류 발생: {error}"}, 500
+
 @app.route('/submit_au_data_with_image', methods=['POST'])
 def submit_au_data_with_image():
-    temp_photo_path = None
-    teacher_id_from_form = "unspecified_teacher" 
-    photo_storage_url = "upload_failed" 
-    
-    current_au_features = {}
-    current_score = 0.0
+    timer = StageTimer()
+    upload = None
+    try:
+        with timer.stage('parse'):
+            teacher_id_from_form = request.form.get('teacher_id')
+            round_number_from_form = request.form.get('round_number', type=int)
+
+            photo_file = request.files.get('photo')
+
+            # 업로드 스트림을 메모리로 한 번만 읽어 디코딩과 Storage 업로드에 같이 사용 (임시 파일 없음)
+            photo_bytes = b''
+            if photo_file and photo_file.filename != '':
+                photo_bytes = photo_file.read()
+
+        upload = begin_submission(teacher_id_from_form, photo_bytes, photo_file.filename if photo_bytes else None,
+                                  photo_file.mimetype if photo_bytes else None)
+        try:
+            analysis = run_submission_analysis(photo_bytes, timer)
+        except (InferenceQueueFull, InferenceTimeout) as e:
+            if upload is not None:
+                upload.discard()
+            payload, status = busy_response(e)
+            return jsonify(payload), status
+
+        payload, status = complete_submission(session.get('user_session_id'), teacher_id_from_form, round_number_from_form,
+                                              analysis, upload, timer)
+        return jsonify(payload), status
 
+    except Exception as e:
+        if upload is not None:
+            upload.discard()
+        payload, status = internal_error_response(e)
+        return jsonify(payload), status
+
+# --- 실시간 AU 점수 스트림 (Server-Sent Events) ---
+# 실시간 분석기를 시작할 수 없으면 (FaceMesh 생성 실패 등) unavailable 이벤트 하나를 보내고 스트림을 끝냄
+@app.route('/live_au_stream')
+def live_au_stream():
     try:
-        teacher_id_from_form = request.form.get('teacher_id')
-        round_number_from_form = request.form.get('round_number', type=int)
-
-        photo_file = request.files.get('photo')
-
-        # Firebase Storage에 이미지 업로드 (데이터는 메모리에만 저장되지만, 이미지는 Storage에 임시로 업로드)
-        if photo_file and photo_file.filename != '':
-            unique_filename = f"au_capture_temp_{uuid.uuid4()}{os.path.splitext(photo_file.filename)[1]}"
-            temp_photo_path = os.path.join(UPLOAD_FOLDER, unique_filename) 
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-            photo_file.save(temp_photo_path)
-            
-            try:
-                blob = bucket.blob(f"au_captures/{teacher_id_from_form}/{unique_filename}")
-                blob.upload_from_filename(temp_photo_path)
-                blob.make_public() # 공개적으로 접근 가능하게 설정
-                photo_storage_url = blob.public_url
-                print(f"[Firebase Storage] 이미지 업로드 성공: {photo_storage_url}")
-            except Exception as e:
-                print(f"[Firebase Storage] 이미지 업로드 실패: {e}")
-                photo_storage_url = "upload_failed"
-        else:
-            print("[app.py] 이미지 파일이 전달되지 않았습니다.")
-            photo_storage_url = "no_image_provided"
-
-        # MediaPipe 및 XGBoost 로직은 그대로 유지
-        img = cv2.imread(temp_photo_path) # 임시 저장된 파일에서 읽어옴
-        if img is not None:
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            results = face_mesh.process(img_rgb) 
-            if results.multi_face_landmarks:
-                landmarks = np.array([(lm.x * img.shape[1], lm.y * img.shape[0]) for lm in results.multi_face_landmarks[0].landmark], dtype=np.float32)
-                current_au_features = calculate_au(landmarks)
-                if model is not None and feature_cols:
-                    user_X = [[current_au_features.get(col, 0.0) for col in feature_cols]]
-                    current_score = model.predict(user_X)[0]
-                else: current_score = 0.0
-            else: print("[app.py] 이미지에서 얼굴 랜드mark를 찾을 수 없습니다.")
-        else: print("[app.py] 임시 저장된 이미지를 읽을 수 없습니다.")
-
-        au_values_for_db = {k: float(f"{current_au_features.get(k, 0.0):.4f}") for k in feature_cols if not k.endswith('_w')}
-        overall_score_for_db = float(f"{current_score:.4f}")
-
-        # 사용자 세션 ID를 가져와 데이터 저장
-        current_session_id = session.get('user_session_id')
-        if not current_session_id:
-            print("[submit_au_data_with_image] 경고: 세션 ID 없음, 데이터 저장 불가.")
-            return jsonify({"status": "error", "message": "세션 ID가 없어 데이터를 저장할 수 없습니다."}), 500
-
-        # 데이터 저장 로직을 메모리 기반으로 변경
-        round_data = {
-            'teacher_id': teacher_id_from_form,
-            'round_number': round_number_from_form,
-            'overall_score': overall_score_for_db,
-            'au_detail_values': au_values_for_db,
-            'photo_url': photo_storage_url, 
-            'timestamp': datetime.now().isoformat() # 서버 시간 기록 (Firebase Timestamp 대신)
-        }
-        
-        if current_session_id not in user_session_data:
-             user_session_data[current_session_id] = []
-        user_session_data[current_session_id].append(round_data)
-        
-        print(f"[Memory Storage] 사용자 데이터 저장 성공: 세션 {current_session_id}, 라운드 {round_number_from_form}, 점수 {overall_score_for_db}")
-
-        return jsonify({
-            "status": "success",
-            "message": "데이터가 메모리에 임시 저장되었습니다.",
-            "photo_url": photo_storage_url,
-            "au_detail": au_values_for_db,
-            "overall_score": overall_score_for_db
-        }), 200
+        live_scorer = live_scoring.get()
+    except Exception as e:
+        logger.warning("[Live Scoring] 실시간 분석을 시작할 수 없습니다: %s", e)
+        live_scorer = None
+
+    def generate():
+        if live_scorer is None:
+            yield f"event: unavailable\ndata: {json.dumps({'message': '실시간 분석을 사용할 수 없습니다.'}, ensure_ascii=False)}\n\n"
+            return
+        for result in live_scorer.results():
+            if result is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: au\ndata: {json.dumps(result, ensure_ascii=False)}\n\n"
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # 프록시 버퍼링 끄기
+    return response
+
+# --- 최신 실시간 분석 결과를 라운드 기록으로 저장 (사진은 서버가 가진 프레임을 업로드) ---
+@app.route('/submit_live_snapshot', methods=['POST'])
+def submit_live_snapshot():
+    teacher_id = request.form.get('teacher_id')
+    round_number = request.form.get('round_number', type=int)
+
+    current_session_id = session.get('user_session_id')
+    if not current_session_id:
+        logger.warning("[submit_live_snapshot] 경고: 세션 ID 없음, 데이터 저장 불가.")
+        return jsonify({"status": "error", "message": "세션 ID가 없어 데이터를 저장할 수 없습니다."}), 500
 
+    try:
+        live_scorer = live_scoring.get()
     except Exception as e:
-        print(f"[app.py] 요청 처리 중 예상치 못한 오류 발생: {e}")
-        return jsonify({"status": "error", "message": f"서버 처리 중 오류 발생: {e}"}), 500
-    finally:
-        if temp_photo_path and os.path.exists(temp_photo_path):
-            os.remove(temp_photo_path)
-            # print(f"[app.py] 임시 사진 파일 삭제됨: {temp_photo_path}") # 디버그 로그 필요시 활성화
+        logger.warning("[Live Scoring] 실시간 분석을 시작할 수 없습니다: %s", e)
+        return jsonify({"status": "error", "message": "실시간 분석을 사용할 수 없습니다. 사진 업로드로 저장해주세요."}), 503
+    latest = live_scorer.latest(max_age=LIVE_SNAPSHOT_MAX_AGE, wait=LIVE_SNAPSHOT_MAX_AGE)
+    if latest is None:
+        return jsonify({"status": "error", "message": "실시간 분석 결과가 아직 없습니다. 카메라를 확인해주세요."}), 503
+    result, frame, au_row = latest
+
+    au_extractor = scoring.get().au_extractor
+    if au_row is None:
+        au_row = np.zeros(len(au_extractor.feature_cols), dtype=np.float32)
+    round_data = {
+        'teacher_id': teacher_id,
+        'round_number': round_number,
+        'overall_score': result['overall_score'],
+        'au_detail_values': au_extractor.detail_values(au_row),
+        'photo_url': "no_image_provided",
+        'photo_status': "none",
+        'timestamp': datetime.now().isoformat()
+    }
+    if result['status'] == 'no_face':
+        ERRORS.inc(category='no_face')
+    ret, buffer = cv2.imencode('.jpg', frame)
+    photo = (f"au_captures/{teacher_id}/au_capture_temp_{uuid.uuid4()}.jpg", buffer.tobytes(), 'image/jpeg') if ret else None
+    timer = StageTimer()
+    with timer.stage('session_write'):
+        store_round(current_session_id, round_data, photo)
+    observe_stages(timer)
+    logger.debug("[Memory Storage] 실시간 캡처 저장: 세션 %s, 라운드 %s, 점수 %s (%s)",
+                 current_session_id, round_number, round_data['overall_score'], result['status'])
+
+    return jsonify({
+        "status": "success",
+        "message": "데이터가 메모리에 임시 저장되었습니다.",
+        "photo_url": round_data['photo_url'],
+        "photo_status": round_data['photo_status'],
+        "au_detail": round_data['au_detail_values'],
+        "overall_score": round_data['overall_score'],
+        "analysis_status": result['status'],
+        "timings_ms": result['timings_ms']
+    }), 200
 
 # --- 피드백 페이지에서 임시 데이터를 가져오는 새로운 라우트 추가 ---
+FEEDBACK_MAX_LIMIT = int(os.environ.get('SMILEFIT_FEEDBACK_MAX_LIMIT', '100'))
+
+def _name_list(value):
+    return [name.strip() for name in value.split(',') if name.strip()] if value else None
+
+def parse_feedback_query(args):
+    """
+    피드백 조회 파라미터 (Flask request.args 또는 dict). 잘못된 값이면 ValueError.
+    fields=round_number,overall_score  au=AU01,AU12  offset=0  limit=10  summary=1
+    """
+    fields = _name_list(args.get('fields'))
+    if fields is not None:
+        unknown = [field for field in fields if field not in ROUND_FIELDS]
+        if unknown:
+            raise ValueError(f"알 수 없는 필드: {', '.join(unknown)} (가능: {', '.join(ROUND_FIELDS)})")
+    try:
+        offset = max(int(args.get('offset') or 0), 0)
+        limit = args.get('limit')
+        limit = min(max(int(limit), 0), FEEDBACK_MAX_LIMIT) if limit not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError("offset / limit 은 정수여야 합니다.")
+    summary = str(args.get('summary', '')).lower() in ('1', 'true', 'yes')
+    return {'fields': fields, 'au_names': _name_list(args.get('au')), 'offset': offset, 'limit': limit, 'summary': summary}
+
+def json_text(value):
+    """jsonify 와 같은 형식의 JSON 텍스트 (키 정렬, 공백 없음)."""
+    return app.json.dumps(value, separators=(',', ':'))
+
+def feedback_payload(session_id, fields=None, au_names=None, offset=0, limit=None, summary=False):
+    """
+    세션의 라운드 기록 (round_number 순서) 과 업로드 진행 상태 응답 dict (Flask 라우트와 ASGI 모드가 같이 사용).
+    fields / au_names / offset / limit 으로 필요한 부분만, summary 면 AU 별 평균/최소/최대/진행도 요약도 함께 반환합니다.
+    라운드 dict 와 요약은 저장소 잠금 밖에서 열 단위 기록의 사본으로 만듭니다.
+    """
+    if not session_id:
+        return {"user_data": [], "total": 0}
+
+    def read(history):
+        payload = {
+            "user_data": history.rounds(fields, offset, limit, au_names),
+            "total": len(history),
+            # 백그라운드 업로드 진행 상태 (pending 이 남아 있으면 클라이언트가 다시 조회할 수 있음)
+            "upload_status": history.upload_status(),
+        }
+        if summary:
+            payload["summary"] = history.summary(au_names)
+        return payload
+
+    return session_store.read_history(session_id, read)
+
 @app.route('/get_user_feedback_data')
 def get_user_feedback_data():
-    current_session_id = session.get('user_session_id')
-    if not current_session_id or current_session_id not in user_session_data:
-        return jsonify({"user_data": []}), 200 
-    
-    user_data = user_session_data.get(current_session_id, [])
-    user_data.sort(key=lambda x: x.get('round_number', 0))
-    
-    return jsonify({"user_data": user_data}), 200
-
-# --- 선생님 데이터 업로드 함수 (기존과 동일) ---
-def upload_teacher_au_data():
-    """선생님 이미지 파일에서 AU 값을 추출하여 Firestore 'teacher_au_references' 컬렉션에 저장합니다."""
-    teachers = ['emma', 'olivia', 'sophia']
-    total_rounds_per_teacher = 10 
-
-    print("\n--- 선생님 AU 데이터 업로드 시작 ---")
-    for teacher_id in teachers:
-        for i in range(1, total_rounds_per_teacher + 1):
-            image_path = os.path.join(app.static_folder, 'images', 'teachers', teacher_id, f'{teacher_id}{i}.png')
-            
-            if not os.path.exists(image_path):
-                print(f"경고: {image_path} 파일을 찾을 수 없습니다. 건너뜁니다.")
-                continue
-
-            try:
-                img = cv2.imread(image_path)
-                if img is None:
-                    print(f"경고: {image_path} 이미지를 읽을 수 없습니다. 건너뜁니다.")
-                    continue
-
-                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                results = face_mesh.process(img_rgb) 
-
-                au_features = {}
-                score = 0.0
-
-                if results.multi_face_landmarks:
-                    landmarks = np.array([
-                        (lm.x * img.shape[1], lm.y * img.shape[0])
-                        for lm in results.multi_face_landmarks[0].landmark
-                    ], dtype=np.float32)
-                    
-                    au_features = calculate_au(landmarks)
-                    
-                    if model is not None and feature_cols:
-                        teacher_X = [[au_features.get(col, 0.0) for col in feature_cols]]
-                        score = model.predict(teacher_X)[0]
-                    else: score = 0.0
-                else: print(f"경고: {teacher_id}의 {i} 라운드 이미지에서 얼굴 랜드mark를 찾을 수 없습니다.")
-                    
-                au_values_for_db = {k: float(f"{au_features.get(k, 0.0):.4f}") for k in feature_cols if not k.endswith('_w')}
-
-                doc_ref = db.collection('teacher_au_references').add({
-                    'teacher_id': teacher_id,
-                    'round_number': i, 
-                    'overall_score': float(f"{score:.4f}"),
-                    'au_detail_values': au_values_for_db,
-                    'image_path_static': f'/static/images/teachers/{teacher_id}/{teacher_id}{i}.png',
-                    'timestamp': firestore.SERVER_TIMESTAMP 
-                })
-                print(f"성공: {teacher_id} 라운드 {i} AU 데이터 저장 완료. 점수: {score:.4f}")
-
-            except Exception as e:
-                print(f"오류: {teacher_id} 라운드 {i} AU 데이터 처리 중 오류 발생: {e}")
-    print("--- 선생님 AU 데이터 업로드 완료 ---")
+    try:
+        query = parse_feedback_query(request.args)
+        payload = feedback_payload(session.get('user_session_id'), **query)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(payload), 200
+
+# --- 선생님 기준 AU 데이터 (로컬 캐시) ---
+@app.route('/teacher_au_references')
+def get_teacher_au_references():
+    """미리 계산된 선생님 AU 기준 데이터를 반환합니다. 내용이 바뀌지 않으면 ETag 로 304 응답."""
+    teacher_references = teacher_refs.get()
+    if teacher_references is None:
+        return jsonify({"status": "error", "message": "선생님 기준 데이터가 준비되지 않았습니다."}), 404
+    teacher_id = request.args.get('teacher_id')
+    response = jsonify({"teacher_data": teacher_references.records(teacher_id)})
+    response.set_etag(f"{teacher_references.etag}-{teacher_id or 'all'}")
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response.make_conditional(request)
+
+# --- 가장 가까운 기준 표정 ---
+@app.route('/nearest_expression', methods=['GET', 'POST'])
+def nearest_expression():
+    """
+    사용자 AU 값과 가장 가까운 기준 표정(선생님 라운드, e_game, expression 이미지) top-k 와 AU 별 차이를 반환합니다.
+
+    POST JSON: {"au_detail_values": {AU: 값} 또는 [{AU: 값}, ...], "k": 3, "metric": "cosine"|"l2", "set": ..., "group": ...}
+    au_detail_values 가 없으면 (GET 포함) 현재 세션의 라운드 기록을 질의로 사용합니다 (round_number 로 한 라운드만 선택 가능).
+    """
+    index = expression_index.get()
+    if index is None:
+        return jsonify({"status": "error", "message": "기준 표정 데이터가 준비되지 않았습니다."}), 404
+    params = dict(request.args.items())
+    params.update(request.get_json(silent=True) or {})
+    metric = params.get('metric', 'cosine')
+    if metric not in NEAREST_METRICS:
+        return jsonify({"status": "error", "message": f"metric 은 {', '.join(NEAREST_METRICS)} 중 하나여야 합니다."}), 400
+    try:
+        k = min(max(int(params.get('k', 3)), 1), NEAREST_MAX_K)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "k 는 정수여야 합니다."}), 400
 
+    values = params.get('au_detail_values')
+    labels = None
+    if values is None:
+        current_session_id = session.get('user_session_id')
+        rounds = session_store.read_history(current_session_id, lambda history: history.rounds(
+            ('round_number', 'au_detail_values'))) if current_session_id else [] # round_number 순서
+        round_number = params.get('round_number')
+        rounds = [r for r in rounds if r.get('au_detail_values')
+                  and (round_number is None or str(r.get('round_number')) == str(round_number))]
+        if not rounds:
+            return jsonify({"status": "error", "message": "질의할 AU 값이 없습니다 (au_detail_values 또는 세션 라운드 기록 필요)."}), 400
+        values = [r['au_detail_values'] for r in rounds]
+        labels = [r.get('round_number') for r in rounds]
+    elif isinstance(values, dict):
+        values = [values]
+    if not isinstance(values, list) or not all(isinstance(v, dict) for v in values):
+        return jsonify({"status": "error", "message": "au_detail_values 는 {AU: 값} 또는 그 목록이어야 합니다."}), 400
+
+    timer = StageTimer()
+    try:
+        with timer.stage('nearest_search'):
+            queries = np.array([index.vector_from_values(v) for v in values], dtype=np.float32).reshape(len(values), -1)
+            results = index.matches(queries, k=k, metric=metric, reference_set=params.get('set'), group=params.get('group'))
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    observe_stages(timer)
+    response = [{'round_number': labels[i] if labels else None, 'matches': matches} for i, matches in enumerate(results)]
+    return jsonify({"status": "success", "metric": metric, "k": k, "references": len(index),
+                    "results": response, "timings_ms": timer.as_dict()}), 200
+
+# 모든 라우트/저장소 설정이 끝난 뒤 워밍업 시작 (정적 페이지와 /ready 는 그동안에도 응답)
+if not IN_WORKER_PROCESS:
+    if WARMUP_MODE == 'sync':
+        warm_up()
+    elif WARMUP_MODE == 'background':
+        start_background_warm_up()
 
 # --- 앱 실행 ---
 if __name__ == '__main__':
-    if global_cap is not None and global_cap.isOpened():
-        global_cap.release() 
-        global_cap = None 
-
-    # upload_teacher_au_data() # <-- 실행 후 주석 처리하거나 제거하세요!
-
+    # 선생님 AU 기준 데이터 업로드는 upload_teacher_au_data.py 로 따로 실행합니다.
     app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
\ No newline at end of file
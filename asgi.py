@@ -0,0 +1,272 @@
+# asgi.py
+# ASGI 서빙 모드: 사진 제출 / 피드백 조회 / 비디오 스트림은 이벤트 루프에서 직접 처리하고,
+# 나머지 라우트는 a2wsgi 의 WSGIMiddleware 로 기존 Flask(WSGI) 앱에 넘깁니다 (스레드 풀에서 실행).
+# 실행: python serve.py --mode asgi --workers 4   (또는 uvicorn asgi:application --workers 4)
+# 필요 패키지: pip install "uvicorn[standard]" a2wsgi
+#
+# - /submit_au_data_with_image: 본문을 비동기로 받고, 분석(디코딩/FaceMesh/점수)은 분석 실행기에서, Storage 업로드 시작은
+#   I/O 실행기에서 동시에 await 합니다. 분석 대기열이 SMILEFIT_ASGI_MAX_PENDING 을 넘으면 바로 503.
+# - /get_user_feedback_data: 메모리 세션 저장소는 이벤트 루프에서 바로, SQLite 저장소는 I/O 실행기에서 읽습니다.
+# - /video_feed: FrameBroadcaster.async_frames() 를 그대로 스트리밍 (클라이언트마다 스레드를 쓰지 않음).
+# 세션은 Flask 앱의 session_interface 로 열고 저장하므로 두 경로(비동기 라우트 / Flask 라우트)가 같은 user_session_id 를 봅니다.
+import asyncio
+import io
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.formparser import parse_form_data
+from werkzeug.wrappers import Request, Response
+
+import app
+from face_pipeline import StageTimer
+from inference_server import InferenceQueueFull, InferenceTimeout
+from video_stream import parse_stream_profile
+
+# Flask 라우트 (WSGIMiddleware) / SQLite 세션 저장소 / 업로드 큐 대기 등 블로킹 작업용 스레드 수 (각각)
+ASGI_THREADS = int(os.environ.get('SMILEFIT_ASGI_THREADS', '32'))
+# 사진 분석 스레드 수 (기본: FaceMesh 풀 크기의 2배 (최소 4), 추론 서버 모드면 워커 수의 2배).
+# 풀 크기와 같으면 디코딩/AU/예측 동안 FaceMesh 가 놀고 점수 배치도 모이지 않아, 스레드마다 요청을 받는 개발 서버보다 느림
+ANALYSIS_THREADS = int(os.environ.get('SMILEFIT_ASGI_ANALYSIS_THREADS', '0')) or (
+    max(4, app.face_mesh_pool.size * 2) if app.INFERENCE_WORKERS <= 0 else app.INFERENCE_WORKERS * 2)
+# 분석 중 + 대기 중인 제출 수 한도 (넘으면 대기열에 쌓지 않고 503)
+MAX_PENDING_ANALYSES = int(os.environ.get('SMILEFIT_ASGI_MAX_PENDING', '64'))
+MAX_BODY_BYTES = int(os.environ.get('SMILEFIT_MAX_UPLOAD_BYTES', str(16 * 1024 * 1024)))
+
+blocking_executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='smilefit-asgi')
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_THREADS, thread_name_prefix='smilefit-analysis')
+_pending_analyses = 0 # 이벤트 루프 스레드에서만 변경
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+# --- 세션 (Flask session_interface) ---
+def open_session(cookie_header):
+    """쿠키의 Flask 세션. user_session_id 가 없으면 app.make_session_id 와 같이 만듭니다."""
+    flask_app = app.app
+    interface = flask_app.session_interface
+    request = Request({'HTTP_COOKIE': cookie_header or ''})
+    session = interface.open_session(flask_app, request)
+    if session is None:
+        session = interface.make_null_session(flask_app)
+    if 'user_session_id' not in session:
+        session['user_session_id'] = str(uuid.uuid4())
+    return session
+
+
+def session_headers(session):
+    """Flask 가 응답에 붙이는 세션 헤더 (Set-Cookie, Vary) 를 session_interface.save_session 으로 만듭니다."""
+    flask_app = app.app
+    response = Response()
+    flask_app.session_interface.save_session(flask_app, session, response)
+    return [(name, value) for name, value in response.headers.items() if name.lower() in ('set-cookie', 'vary')]
+
+
+# --- 요청 / 응답 ---
+class AsyncRequest:
+    """비동기 라우트 하나의 요청. 응답을 시작할 때 Flask after_request 와 같은 요청 지표를 기록합니다."""
+
+    def __init__(self, scope, receive, send, endpoint):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.query = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = open_session(self.headers.get('cookie'))
+        return self._session
+
+    async def body(self, limit=MAX_BODY_BYTES):
+        length = self.headers.get('content-length')
+        if length is not None and length.isdigit() and int(length) > limit:
+            raise BodyTooLarge()
+        chunks, size = [], 0
+        while True:
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionError("클라이언트 연결 끊김")
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > limit:
+                raise BodyTooLarge()
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    async def start(self, status, headers):
+        if self._session is not None:
+            headers = list(headers) + session_headers(self._session)
+        headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        await self.send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        app.REQUESTS.inc(endpoint=self.endpoint, method=self.scope['method'], status=status)
+        app.REQUEST_LATENCY.observe((time.perf_counter() - self.started) * 1000.0, endpoint=self.endpoint)
+
+    async def send_json(self, payload, status=200):
+        body = app.json_text(payload).encode('utf-8') + b'\n' # jsonify 와 같은 형식
+        await self.start(status, [('content-type', 'application/json'), ('content-length', str(len(body)))])
+        await self.send({'type': 'http.response.body', 'body': body})
+
+
+async def wait_for_disconnect(receive):
+    """요청 본문을 다 읽은 뒤 호출. 클라이언트가 연결을 끊으면 반환합니다."""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+def run_blocking(fn, *args):
+    return asyncio.get_running_loop().run_in_executor(blocking_executor, fn, *args)
+
+
+# --- 비동기 라우트 ---
+async def submit_au_data_with_image(request):
+    global _pending_analyses
+    timer = StageTimer()
+    try:
+        body = await request.body()
+    except BodyTooLarge:
+        return await request.send_json({"status": "error", "message": "업로드 크기 제한을 넘었습니다."}, 413)
+    except ConnectionError:
+        app.logger.debug("[asgi] 사진 제출 본문을 받는 중 클라이언트 연결이 끊겼습니다.")
+        return # 응답을 받을 클라이언트가 없고, 업로드/분석도 시작하지 않았음
+
+    upload_task = None
+    try:
+        with timer.stage('parse'):
+            _, form, files = parse_form_data({
+                'REQUEST_METHOD': 'POST',
+                'CONTENT_TYPE': request.headers.get('content-type', ''),
+                'CONTENT_LENGTH': str(len(body)),
+                'wsgi.input': io.BytesIO(body),
+            })
+            teacher_id = form.get('teacher_id')
+            round_number = form.get('round_number', type=int)
+            photo_file = files.get('photo')
+            photo_bytes = photo_file.read() if photo_file and photo_file.filename != '' else b''
+        session_id = request.session['user_session_id']
+
+        if photo_bytes and _pending_analyses >= MAX_PENDING_ANALYSES:
+            app.ERRORS.inc(category='inference_busy')
+            payload, status = app.busy_response(f"분석 대기 {_pending_analyses}건")
+            return await request.send_json(payload, status)
+
+        # Storage 업로드 시작(대기열이 차면 잠시 블로킹)과 분석을 동시에 진행
+        upload_task = run_blocking(app.begin_submission, teacher_id, photo_bytes,
+                                   photo_file.filename if photo_bytes else None, photo_file.mimetype if photo_bytes else None)
+        _pending_analyses += 1
+        try:
+            analysis = await asyncio.get_running_loop().run_in_executor(
+                analysis_executor, app.run_submission_analysis, photo_bytes, timer)
+        finally:
+            _pending_analyses -= 1
+        upload = await upload_task
+        upload_task = None
+
+        if app.session_store.shared:
+            payload, status = await run_blocking(app.complete_submission, session_id, teacher_id, round_number, analysis, upload, timer)
+        else:
+            payload, status = app.complete_submission(session_id, teacher_id, round_number, analysis, upload, timer)
+        return await request.send_json(payload, status)
+
+    except (InferenceQueueFull, InferenceTimeout) as e:
+        payload, status = app.busy_response(e)
+    except Exception as e:
+        payload, status = app.internal_error_response(e)
+    if upload_task is not None:
+        upload_task.add_done_callback(_discard_upload)
+    return await request.send_json(payload, status)
+
+
+def _discard_upload(task):
+    """분석 실패: 이미 시작한 업로드는 라운드 기록과 연결되지 않으므로 지웁니다."""
+    if not task.cancelled() and task.exception() is None and task.result() is not None:
+        task.result().discard()
+
+
+async def get_user_feedback_data(request):
+    session_id = request.session['user_session_id']
+    try:
+        query = app.parse_feedback_query(request.query)
+        if app.session_store.shared:
+            payload = await run_blocking(lambda: app.feedback_payload(session_id, **query))
+        else:
+            payload = app.feedback_payload(session_id, **query)
+    except ValueError as e:
+        return await request.send_json({"status": "error", "message": str(e)}, 400)
+    await request.send_json(payload)
+
+
+async def video_feed(request):
+    profile = parse_stream_profile(request.query, app.DEFAULT_STREAM_PROFILE)
+    await request.start(200, [
+        ('content-type', 'multipart/x-mixed-replace; boundary=frame'),
+        ('access-control-allow-origin', '*'),
+        ('access-control-allow-headers', 'Content-Type'),
+    ])
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request.receive))
+    frames = app.frame_broadcaster.async_frames(profile)
+    try:
+        async for jpeg in frames:
+            if disconnected.done():
+                break
+            await request.send({'type': 'http.response.body', 'more_body': True,
+                                'body': b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'})
+        if not disconnected.done():
+            await request.send({'type': 'http.response.body', 'body': b''})
+    except OSError:
+        pass # 전송 중 연결 끊김
+    finally:
+        disconnected.cancel()
+        await frames.aclose()
+
+
+ASYNC_ROUTES = {
+    ('POST', '/submit_au_data_with_image'): ('submit_au_data_with_image', submit_au_data_with_image),
+    ('GET', '/get_user_feedback_data'): ('get_user_feedback_data', get_user_feedback_data),
+    ('GET', '/video_feed'): ('video_feed', video_feed),
+}
+
+
+# --- 나머지 라우트: Flask(WSGI) 앱으로 전달 ---
+flask_application = WSGIMiddleware(app.app, workers=ASGI_THREADS)
+
+
+# --- ASGI 진입점 ---
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            analysis_executor.shutdown(wait=False)
+            blocking_executor.shutdown(wait=False)
+            flask_application.executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return # websocket 은 사용하지 않음
+    route = ASYNC_ROUTES.get((scope['method'], scope['path']))
+    if route is None:
+        return await flask_application(scope, receive, send)
+    endpoint, handler = route
+    try:
+        await handler(AsyncRequest(scope, receive, send, endpoint))
+    except ConnectionError:
+        pass # 다른 비동기 라우트에서 전송 중 연결 끊김
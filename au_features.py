@@ -0,0 +1,168 @@
+# au_features.py
+# MediaPipe 랜드마크로부터 AU(거리 기반) 특징 행을 벡터 연산으로 계산
+import numpy as np
+
+# --- AU 계산을 위한 랜드마크 인덱스 (FACS 기준, MediaPipe 랜드마크 기반) ---
+AU_LANDMARKS = {
+    'AU01': [336, 296],
+    'AU02': [334, 298],
+    'AU04': [9, 8],
+    'AU05': [159, 144],
+    'AU06': [205, 206],
+    'AU07': [159, 145],
+    'AU09': [19, 219],
+    'AU10': [11, 10],
+    'AU11': [61, 291],
+    'AU12': [308, 78],
+    'AU14': [41, 13],
+    'AU15': [84, 17],
+    'AU17': [13, 15],
+    'AU20': [32, 262],
+    'AU23': [13, 14],
+    'AU24': [13, 14],
+    'AU25': [13, 14],
+    'AU26': [10, 152],
+    'AU28': [13, 14],
+    'AU43': [145, 374]
+}
+
+# '_w' 컬럼은 기본 AU 값에 이 가중치를 곱한 값
+AU_WEIGHT = 0.8
+
+
+def landmarks_to_array(face_landmarks, image_size, indices=None):
+    """
+    MediaPipe 랜드마크(NormalizedLandmarkList 또는 그 .landmark 필드)를 픽셀 좌표 (K, 2) float32 배열로 변환합니다.
+
+    indices 가 주어지면 해당 인덱스의 랜드마크만 읽습니다 (AU 계산에 필요한 ~40개만 접근).
+    정규화 좌표를 한 번에 읽어 들인 뒤 (width, height) 배율은 벡터 연산 한 번으로 적용합니다.
+    """
+    landmark = getattr(face_landmarks, 'landmark', face_landmarks)
+    if indices is None:
+        count = len(landmark)
+        coords = np.fromiter((value for lm in landmark for value in (lm.x, lm.y)), dtype=np.float32, count=2 * count)
+    else:
+        count = len(indices)
+        coords = np.fromiter((value for i in indices for value in (landmark[i].x, landmark[i].y)), dtype=np.float32, count=2 * count)
+    points = coords.reshape(count, 2)
+    points *= np.array(image_size[:2], dtype=np.float32)
+    return points
+
+
+class AUFeatureExtractor:
+    """
+    feature_cols 순서 그대로의 float32 특징 행을 만듭니다.
+
+    AU 별 랜드마크 쌍의 인덱스를 미리 배열로 만들어 두고, (478, 2) 한 장 또는 (N, 478, 2) 배치를
+    한 번의 fancy indexing 으로 거리 계산합니다. '_w' 컬럼과 AU_LANDMARKS 에 없는 컬럼(0.0)은
+    컬럼별 원본 인덱스/배율 배열로 처리합니다.
+
+    normalize_pair 를 주면 모든 거리를 해당 랜드마크 쌍의 거리(예: 눈 안쪽 사이 거리)로 나눕니다.
+    """
+
+    def __init__(self, feature_cols, au_landmarks=None, weight=AU_WEIGHT, normalize_pair=None):
+        au_landmarks = AU_LANDMARKS if au_landmarks is None else au_landmarks
+        self.feature_cols = list(feature_cols)
+        self.au_names = list(au_landmarks.keys())
+        self.pair_index = np.array([au_landmarks[au] for au in self.au_names], dtype=np.intp).reshape(-1, 2)
+        self.normalize_pair = None if normalize_pair is None else np.array(normalize_pair, dtype=np.intp)
+        self.max_index = int(self.pair_index.max()) if len(self.pair_index) else -1
+
+        # MediaPipe 결과에서 실제로 읽어야 하는 랜드마크 인덱스와, 그 압축 배열 기준의 쌍 인덱스
+        used = [self.pair_index.ravel()]
+        if self.normalize_pair is not None:
+            used.append(self.normalize_pair)
+        self.landmark_indices = np.unique(np.concatenate(used)).astype(np.intp)
+        self.compact_pair_index = np.searchsorted(self.landmark_indices, self.pair_index)
+        self.compact_normalize_pair = (None if self.normalize_pair is None
+                                       else np.searchsorted(self.landmark_indices, self.normalize_pair))
+
+        au_position = {au: i for i, au in enumerate(self.au_names)}
+        column_source = []
+        column_scale = []
+        for col in self.feature_cols:
+            base, scale = (col[:-2], weight) if col.endswith('_w') else (col, 1.0)
+            if base in au_position:
+                column_source.append(au_position[base])
+                column_scale.append(scale)
+            else:
+                column_source.append(0)
+                column_scale.append(0.0)
+        self.column_source = np.array(column_source, dtype=np.intp)
+        self.column_scale = np.array(column_scale, dtype=np.float32)
+        # JSON 응답용: '_w' 가 아닌 컬럼 위치
+        self.detail_columns = [i for i, col in enumerate(self.feature_cols) if not col.endswith('_w')]
+
+    def compute(self, landmarks):
+        """전체 랜드마크 (478, 2) -> (F,) 또는 (N, 478, 2) -> (N, F) float32 특징 배열."""
+        return self.rows_from_distances(self.distances(landmarks))
+
+    def distances(self, landmarks):
+        """전체 랜드마크 (478, 2) -> (K,) 또는 (N, 478, 2) -> (N, K) AU 별 거리 (au_names 순서, 정규화 포함)."""
+        points = np.asarray(landmarks, dtype=np.float32)
+        num_points = points.shape[-2] if points.ndim >= 2 else 0
+        pair_index = self.pair_index
+        in_range = None
+        if self.max_index >= num_points:
+            # 랜드마크 수가 부족한 경우 (refine_landmarks=False 등) 범위를 벗어난 AU 는 0.0
+            in_range = (pair_index < num_points).all(axis=1)
+            pair_index = np.where(in_range[:, np.newaxis], pair_index, 0)
+        normalize_pair = self.normalize_pair
+        if normalize_pair is not None and normalize_pair.max() >= num_points:
+            normalize_pair = None # 눈 랜드마크가 없으면 정규화하지 않음
+        return self._compute_distances(points, pair_index, in_range, normalize_pair)
+
+    def compute_from_face_landmarks(self, face_landmarks, image_size):
+        """MediaPipe 결과에서 필요한 랜드마크만 읽어 바로 특징 행을 계산합니다. image_size = (width, height)."""
+        return self.rows_from_distances(self.distances_from_face_landmarks(face_landmarks, image_size))
+
+    def distances_from_face_landmarks(self, face_landmarks, image_size):
+        """MediaPipe 결과 -> (K,) AU 별 거리. 프레임 간 필터링은 이 거리에 적용한 뒤 rows_from_distances 로 특징 행을 만듭니다."""
+        landmark = getattr(face_landmarks, 'landmark', face_landmarks)
+        if not len(self.landmark_indices) or len(landmark) <= self.landmark_indices[-1]:
+            return self.distances(landmarks_to_array(landmark, image_size))
+        points = landmarks_to_array(landmark, image_size, self.landmark_indices)
+        return self._compute_distances(points, self.compact_pair_index, None, self.compact_normalize_pair)
+
+    def rows_from_distances(self, distances):
+        """(K,) -> (F,) 또는 (N, K) -> (N, F) feature_cols 순서 특징 행 ('_w' 는 배율 적용, 없는 컬럼은 0.0)."""
+        distances = np.asarray(distances, dtype=np.float32)
+        single = distances.ndim == 1
+        if single:
+            distances = distances[np.newaxis]
+        rows = np.zeros((distances.shape[0], len(self.feature_cols)), dtype=np.float32)
+        if distances.shape[1] and self.feature_cols:
+            np.multiply(distances[:, self.column_source], self.column_scale, out=rows)
+        return rows[0] if single else rows
+
+    def _compute_distances(self, points, pair_index, in_range, normalize_pair):
+        single = points.ndim == 2
+        if single:
+            points = points[np.newaxis]
+        count = points.shape[0]
+        distances = np.zeros((count, len(pair_index)), dtype=np.float32)
+        if count == 0 or points.shape[1] == 0 or not len(pair_index):
+            return distances[0] if single else distances
+
+        diff = points[:, pair_index[:, 0]] - points[:, pair_index[:, 1]]
+        distances = np.sqrt(np.einsum('nkd,nkd->nk', diff, diff))
+        if in_range is not None:
+            distances *= in_range
+        if normalize_pair is not None:
+            reference = np.linalg.norm(points[:, normalize_pair[0]] - points[:, normalize_pair[1]], axis=-1)
+            distances /= np.where(reference > 0.01, reference, 1.0)[:, np.newaxis] # 0으로 나누는 것 방지
+
+        # 랜드마크가 전부 0인 입력은 기존 로직과 같이 0 벡터
+        empty = ~points.reshape(count, -1).any(axis=1)
+        if empty.any():
+            distances[empty] = 0.0
+        return distances[0] if single else distances
+
+    def to_dict(self, row):
+        """특징 행 -> {컬럼: 값} (전체 컬럼)."""
+        return dict(zip(self.feature_cols, np.asarray(row, dtype=np.float32).tolist()))
+
+    def detail_values(self, row, decimals=4):
+        """JSON 응답/DB 저장용 {AU: 값} ('_w' 제외, 소수점 반올림)."""
+        values = np.asarray(row, dtype=np.float32)
+        return {self.feature_cols[i]: round(float(values[i]), decimals) for i in self.detail_columns}
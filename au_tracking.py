@@ -0,0 +1,169 @@
+# au_tracking.py
+# 연속 프레임(웹캠/영상) 분석용 추적 레이어: FaceMesh 를 k 프레임마다(또는 움직임이 클 때만) 실행하고,
+# 그 사이에는 마지막 랜드마크 거리를 유지하며, 20개 AU 거리에 One-Euro / EMA 필터를 적용합니다.
+import math
+import time
+from contextlib import nullcontext
+
+import cv2
+import numpy as np
+
+SMOOTHING_METHODS = ('one_euro', 'ema', 'none')
+
+
+class EMAFilter:
+    """지수 이동 평균. alpha 가 클수록 새 값 비중이 큼 (1.0 이면 필터 없음)."""
+
+    def __init__(self, alpha=0.5):
+        self.alpha = float(alpha)
+        self.value = None
+
+    def reset(self):
+        self.value = None
+
+    def __call__(self, x, timestamp=None):
+        x = np.asarray(x, dtype=np.float32)
+        if self.value is None:
+            self.value = x.copy()
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value.copy()
+
+
+class OneEuroFilter:
+    """
+    One-Euro 필터 (Casiez et al., 2012) 를 값 벡터 전체에 한 번에 적용합니다.
+    천천히 변할 때는 min_cutoff(Hz) 로 강하게 떨림을 줄이고, 빠르게 변할수록 beta 에 비례해 차단 주파수를 올려 지연을 줄입니다.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.05, d_cutoff=1.0):
+        self.min_cutoff = float(min_cutoff)
+        self.beta = float(beta)
+        self.d_cutoff = float(d_cutoff)
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.derivative = None
+        self.timestamp = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2.0 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, x, timestamp):
+        x = np.asarray(x, dtype=np.float32)
+        if self.value is None:
+            self.value = x.copy()
+            self.derivative = np.zeros_like(x)
+            self.timestamp = timestamp
+            return self.value.copy()
+        dt = max(timestamp - self.timestamp, 1e-3)
+        self.timestamp = timestamp
+
+        derivative = (x - self.value) / dt
+        self.derivative += self._alpha(self.d_cutoff, dt) * (derivative - self.derivative)
+        cutoff = self.min_cutoff + self.beta * np.abs(self.derivative)
+        tau = 1.0 / (2.0 * np.pi * cutoff)
+        alpha = 1.0 / (1.0 + tau / dt)
+        self.value += alpha * (x - self.value)
+        return self.value.copy()
+
+
+def create_filter(method, min_cutoff=1.0, beta=0.05, alpha=0.5):
+    if method == 'one_euro':
+        return OneEuroFilter(min_cutoff=min_cutoff, beta=beta)
+    if method == 'ema':
+        return EMAFilter(alpha=alpha)
+    if method == 'none':
+        return None
+    raise ValueError(f"알 수 없는 smoothing 방식: {method} (가능: {', '.join(SMOOTHING_METHODS)})")
+
+
+class TrackedAUAnalyzer:
+    """
+    한 스트림(한 사람)의 연속 프레임을 처리합니다. 스레드 하나에서만 사용해야 합니다.
+
+    - every_k 프레임마다 FaceMesh 를 실행하고, 그 사이에는 마지막 AU 거리를 유지(hold)합니다.
+    - motion_threshold > 0 이면 마지막 추론 이후 축소 흑백 프레임의 평균 밝기 차이(0~255)가 그보다 클 때 즉시 다시 추론합니다.
+    - 유지된 값을 포함한 모든 프레임의 AU 거리에 필터를 적용한 뒤 특징 행/점수를 계산합니다.
+    """
+
+    MOTION_SIZE = (32, 24) # 움직임 측정용 축소 크기
+
+    def __init__(self, face_mesh, au_extractor, model, every_k=1, motion_threshold=0.0,
+                 smoothing='one_euro', min_cutoff=1.0, beta=0.05, alpha=0.5):
+        if every_k < 1:
+            raise ValueError("every_k 는 1 이상이어야 합니다.")
+        self.face_mesh = face_mesh
+        self.au_extractor = au_extractor
+        self.model = model
+        self.every_k = int(every_k)
+        self.motion_threshold = float(motion_threshold)
+        self.filter = create_filter(smoothing, min_cutoff=min_cutoff, beta=beta, alpha=alpha)
+        self._distances = None # 마지막 추론의 AU 거리 (얼굴 없음이면 None)
+        self._reference = None # 마지막 추론 프레임의 축소 흑백 이미지
+        self._since_inference = 0
+        self.frames = 0
+        self.inferences = 0
+
+    def reset(self):
+        self._distances = None
+        self._reference = None
+        self._since_inference = 0
+        if self.filter is not None:
+            self.filter.reset()
+
+    def _thumbnail(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, self.MOTION_SIZE, interpolation=cv2.INTER_AREA)
+
+    def _needs_inference(self, frame):
+        if self._reference is None or self._since_inference >= self.every_k:
+            return True, None
+        if self.motion_threshold <= 0:
+            return False, None
+        thumbnail = self._thumbnail(frame)
+        motion = float(cv2.absdiff(thumbnail, self._reference).mean())
+        return motion > self.motion_threshold, thumbnail
+
+    def process(self, frame, timestamp=None, timer=None):
+        """
+        BGR 프레임 하나 -> (au_row, score, status, inferred).
+        status 는 'ok' / 'no_face', inferred 는 이번 프레임에서 FaceMesh 를 실행했는지 여부.
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        self.frames += 1
+        self._since_inference += 1
+        inferred, thumbnail = self._needs_inference(frame)
+        if inferred:
+            height, width = frame.shape[:2]
+            with timer.stage('landmark') if timer is not None else nullcontext():
+                results = self.face_mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            self.inferences += 1
+            self._since_inference = 0
+            self._reference = thumbnail if thumbnail is not None else self._thumbnail(frame)
+            if results.multi_face_landmarks:
+                self._distances = self.au_extractor.distances_from_face_landmarks(results.multi_face_landmarks[0], (width, height))
+            else:
+                self._distances = None
+                if self.filter is not None:
+                    self.filter.reset() # 얼굴을 놓치면 다음 얼굴부터 다시 필터링
+
+        if self._distances is None:
+            return None, 0.0, 'no_face', inferred
+
+        with timer.stage('au') if timer is not None else nullcontext():
+            distances = self._distances if self.filter is None else self.filter(self._distances, timestamp)
+            au_row = self.au_extractor.rows_from_distances(distances)
+        with timer.stage('predict') if timer is not None else nullcontext():
+            score = float(self.model.predict(au_row[np.newaxis])[0]) if self.model is not None and self.au_extractor.feature_cols else 0.0
+        return au_row, score, 'ok', inferred
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'inferences': self.inferences,
+            'inference_ratio': round(self.inferences / self.frames, 3) if self.frames else 0.0,
+        }
@@ -0,0 +1,1212 @@
+# benchmark.py
+# 얼굴 분석 파이프라인 벤치마크 (핫패스 마이크로 벤치마크 + 번들 이미지 단계별/전체 지연 + Flask 부하 테스트)
+# 사용법: python benchmark.py [au ...] [--repeat N] [--json results.json]
+#   tracking: SMILEFIT_BENCH_VIDEO=<녹화 영상> 이면 실제 FaceMesh 로 영상 프레임을, 아니면 합성 프레임/랜드마크 시퀀스를 사용
+#   pipeline: static/images 의 번들 이미지로 decode / FaceMesh / 랜드마크 변환 / calculate_au / predict 단계별 p50/p95/p99
+#   load:     python benchmark.py load --concurrency 8 --requests 200  (Flask 테스트 클라이언트로 /submit_au_data_with_image 호출)
+#   http:     python benchmark.py http [--http-modes dev,wsgi,asgi]  실제 서버 프로세스를 띄워 피드백 조회 / 비디오 스트림 +
+#             사진 제출 부하를 비교 (serve.py 의 각 모드, uvicorn/gunicorn 이 없으면 해당 모드는 건너뜀)
+#   nearest:  가장 가까운 기준 표정 인덱스 (reference_index) 의 단건/묶음 top-k 질의 시간 (기준 표정 110 ~ 20000 개)
+#   session:  세션 기록 (dict 목록 vs 열 단위 SessionHistory) 의 세션당 메모리와 피드백 JSON 생성 시간 (전체 / 필드·페이지 / 요약)
+#   video:    영상 분석기(video_analysis) 의 stride / 묶음 예측 크기별 초당 프레임 수와 영상 디코딩 속도
+#             (SMILEFIT_BENCH_VIDEO=<녹화 영상> 이면 실제 FaceMesh 로 그 영상을 분석)
+#   startup:  새 프로세스에서 app import / 첫 정적 페이지 응답 / warm_up() (구성 요소별 초기화 시간) 을 측정
+# --json 으로 결과(지연 백분위수, 처리량, 최대 RSS, 커밋)를 저장해 커밋 간 회귀를 비교할 수 있습니다.
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from au_features import AU_LANDMARKS, AU_WEIGHT, AUFeatureExtractor, landmarks_to_array
+from tree_scorer import TreeEnsembleScorer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NUM_LANDMARKS = 478 # refine_landmarks=True 기준
+MODEL_PATH = os.path.join(BASE_DIR, 'expression_similarity_model.json')
+TEACHERS_DIR = os.path.join(BASE_DIR, 'static', 'images', 'teachers')
+# pipeline / load 벤치마크에 쓰는 번들 이미지 폴더 (하위 폴더 포함)
+BUNDLED_IMAGE_DIRS = [
+    TEACHERS_DIR,
+    os.path.join(BASE_DIR, 'static', 'images', 'e_game'),
+    os.path.join(BASE_DIR, 'static', 'images', 'expression'),
+]
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# 벤치마크 이름 -> 측정 결과 목록 (--json 출력용)
+RESULTS = {}
+_current = {'benchmark': None}
+
+
+def record(name, **values):
+    RESULTS.setdefault(_current['benchmark'], []).append(dict(name=name, **values))
+
+
+def load_feature_cols():
+    with open(os.path.join(BASE_DIR, 'feature_cols.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def legacy_calculate_au(landmarks, feature_cols):
+    """벡터화 이전 app.py 의 calculate_au (비교 기준)."""
+    au_dict = {}
+    if not landmarks.any():
+        for col in feature_cols: au_dict[col] = 0.0
+        return au_dict
+    for au, indices in AU_LANDMARKS.items():
+        if indices[0] < len(landmarks) and indices[1] < len(landmarks):
+            p1 = landmarks[indices[0]]
+            p2 = landmarks[indices[1]]
+            au_dict[au] = np.linalg.norm(p1 - p2)
+        else: au_dict[au] = 0.0
+    for au_key in AU_LANDMARKS.keys():
+        au_dict[f"{au_key}_w"] = au_dict.get(au_key, 0.0) * 0.8
+    final_au_features = {}
+    for col in feature_cols: final_au_features[col] = au_dict.get(col, 0.0)
+    return final_au_features
+
+
+def random_landmarks(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.random((count, NUM_LANDMARKS, 2)) * np.array([640.0, 480.0])).astype(np.float32)
+
+
+def fake_face_landmarks(seed=0):
+    """MediaPipe NormalizedLandmarkList 대용 (mediapipe protobuf 가 있으면 그것을 사용)."""
+    rng = np.random.default_rng(seed)
+    coords = rng.random((NUM_LANDMARKS, 2))
+    try:
+        from mediapipe.framework.formats import landmark_pb2
+        face = landmark_pb2.NormalizedLandmarkList()
+        for x, y in coords:
+            face.landmark.add(x=float(x), y=float(y), z=0.0)
+        return face
+    except ImportError:
+        return SimpleNamespace(landmark=[SimpleNamespace(x=float(x), y=float(y), z=0.0) for x, y in coords])
+
+
+def time_per_call(fn, repeat):
+    fn() # 워밍업
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def report(name, seconds, baseline=None):
+    line = f"  {name:<40s} {seconds * 1e6:10.2f} us"
+    if baseline:
+        line += f"   x{baseline / seconds:6.1f}"
+    print(line)
+    record(name, mean_us=round(seconds * 1e6, 3), speedup=round(baseline / seconds, 2) if baseline else None)
+
+
+def latency_stats(samples, items_per_sample=1):
+    """초 단위 측정값 목록 -> 평균/p50/p95/p99(ms) 와 처리량(초당 항목 수)."""
+    samples = np.asarray(samples, dtype=np.float64)
+    if not len(samples):
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000.0
+    return {
+        'count': int(len(samples)),
+        'mean_ms': round(float(samples.mean()) * 1000.0, 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'throughput_per_s': round(len(samples) * items_per_sample / float(samples.sum()), 1) if samples.sum() else None,
+    }
+
+
+def report_latency(name, samples, items_per_sample=1):
+    stats = latency_stats(samples, items_per_sample)
+    if not stats['count']:
+        return stats
+    print(f"  {name:<40s} p50 {stats['p50_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms"
+          f"  {stats['throughput_per_s'] or 0:10.1f}/s")
+    record(name, **stats)
+    return stats
+
+
+def report_cold_start(name, samples):
+    """새 프로세스마다 한 번씩만 재는 시간 (초 단위 목록): 백분위/처리량 대신 실행 횟수에 걸친 중앙값과 최소~최대."""
+    samples = np.asarray(samples, dtype=np.float64) * 1000.0
+    if not len(samples):
+        return
+    median, low, high = float(np.median(samples)), float(samples.min()), float(samples.max())
+    spread = f"최소 {low:.1f} ~ 최대 {high:.1f} ms, {len(samples)}회" if len(samples) > 1 else "1회"
+    print(f"  {name:<40s} {median:9.1f} ms  ({spread})")
+    record(name, runs=int(len(samples)), median_ms=round(median, 3), min_ms=round(low, 3), max_ms=round(high, 3))
+
+
+def peak_rss_mb():
+    # Linux 는 KB, macOS 는 바이트 단위
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0, 1)
+
+
+def bundled_images(limit=None):
+    """번들 이미지 [(경로, 바이트)]."""
+    images = []
+    for directory in BUNDLED_IMAGE_DIRS:
+        for root, _, files in sorted(os.walk(directory)):
+            for filename in sorted(files):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(root, filename)
+                    with open(path, 'rb') as f:
+                        images.append((path, f.read()))
+    return images[:limit] if limit else images
+
+
+def bench_au(args):
+    """calculate_au: 기존 dict 루프 vs 벡터화 특징 행 (단건/배치)."""
+    repeat = args.repeat
+    feature_cols = load_feature_cols()
+    extractor = AUFeatureExtractor(feature_cols)
+    single = random_landmarks(1)[0]
+    batch = random_landmarks(256, seed=1)
+
+    # 결과 일치 확인
+    legacy = legacy_calculate_au(single, feature_cols)
+    expected = np.array([legacy[col] for col in feature_cols], dtype=np.float32)
+    assert np.allclose(extractor.compute(single), expected, rtol=1e-5, atol=1e-4), "벡터화 결과가 기존 결과와 다릅니다."
+
+    print("[calculate_au] 단건 (478x2 -> 40 특징 + predict 입력 행)")
+    def legacy_row():
+        au_dict = legacy_calculate_au(single, feature_cols)
+        return [[au_dict.get(col, 0.0) for col in feature_cols]]
+    legacy_time = time_per_call(legacy_row, repeat)
+    report("legacy dict loop + list row", legacy_time)
+    report("AUFeatureExtractor.compute", time_per_call(lambda: extractor.compute(single), repeat), legacy_time)
+
+    print(f"[calculate_au] 배치 {len(batch)}장 (1장당)")
+    legacy_batch = time_per_call(lambda: [legacy_calculate_au(lm, feature_cols) for lm in batch], max(1, repeat // 100)) / len(batch)
+    report("legacy dict loop", legacy_batch)
+    report("AUFeatureExtractor.compute (N,478,2)", time_per_call(lambda: extractor.compute(batch), max(1, repeat // 10)) / len(batch), legacy_batch)
+
+
+def bench_landmarks(args):
+    """MediaPipe 랜드마크 -> 특징 행: 478개 리스트 컴프리헨션 vs 필요한 인덱스만 읽는 어댑터."""
+    repeat = args.repeat
+    feature_cols = load_feature_cols()
+    extractor = AUFeatureExtractor(feature_cols)
+    face = fake_face_landmarks()
+    width, height = 640, 480
+
+    def legacy():
+        landmarks = np.array([(lm.x * width, lm.y * height) for lm in face.landmark], dtype=np.float32)
+        au_dict = legacy_calculate_au(landmarks, feature_cols)
+        return [[au_dict.get(col, 0.0) for col in feature_cols]]
+
+    expected = np.array(legacy()[0], dtype=np.float32)
+    assert np.allclose(extractor.compute_from_face_landmarks(face, (width, height)), expected, rtol=1e-5, atol=1e-4), "어댑터 결과가 기존 결과와 다릅니다."
+
+    print(f"[landmarks] 프레임당 비용 ({len(face.landmark)}개 랜드마크, 필요한 인덱스 {len(extractor.landmark_indices)}개)")
+    legacy_time = time_per_call(legacy, repeat)
+    report("list comprehension + legacy calculate_au", legacy_time)
+    report("landmarks_to_array (전체 478개)", time_per_call(lambda: landmarks_to_array(face, (width, height)), repeat), legacy_time)
+    report("compute_from_face_landmarks", time_per_call(lambda: extractor.compute_from_face_landmarks(face, (width, height)), repeat), legacy_time)
+
+
+def teacher_feature_rows(extractor):
+    """선생님 이미지에서 실제 AU 특징 행을 추출합니다 (mediapipe 가 없으면 빈 배열)."""
+    try:
+        from face_mesh_pool import FaceMeshPool
+        from face_pipeline import analyze_image, create_static_face_mesh
+        pool = FaceMeshPool(create_static_face_mesh, size=1)
+        rows = []
+        for teacher in sorted(os.listdir(TEACHERS_DIR)):
+            for filename in sorted(os.listdir(os.path.join(TEACHERS_DIR, teacher))):
+                with open(os.path.join(TEACHERS_DIR, teacher, filename), 'rb') as f:
+                    au_row, _, status = analyze_image(f.read(), pool, extractor, None)
+                if status == 'ok':
+                    rows.append(au_row)
+        return np.array(rows, dtype=np.float32).reshape(-1, len(extractor.feature_cols))
+    except (ImportError, AttributeError) as e:
+        print(f"  (실제 AU 행 생략: mediapipe 사용 불가 - {e})")
+        return np.zeros((0, len(extractor.feature_cols)), dtype=np.float32)
+
+
+def bench_scorer(args):
+    """TreeEnsembleScorer 와 XGBRegressor.predict 의 결과 일치 확인 및 속도 비교."""
+    repeat = args.repeat
+    feature_cols = load_feature_cols()
+    scorer = TreeEnsembleScorer.load(MODEL_PATH)
+    extractor = AUFeatureExtractor(feature_cols)
+    rng = np.random.default_rng(0)
+
+    random_rows = (rng.random((2000, len(feature_cols))) * np.linspace(1.0, 300.0, len(feature_cols))).astype(np.float32)
+    # 분할 임계값과 정확히 같은 값 (경계 조건) 과 결측값(NaN)도 포함
+    internal = scorer.left_child != np.arange(len(scorer.left_child))
+    split_features, split_thresholds = scorer.feature_index[internal], scorer.threshold[internal]
+    edge_rows = random_rows[:500].copy()
+    for row in edge_rows:
+        picks = rng.integers(len(split_features), size=10)
+        row[split_features[picks]] = split_thresholds[picks]
+    edge_rows[::5, 0] = np.nan
+    landmark_rows = extractor.compute(random_landmarks(500, seed=2))
+    real_rows = teacher_feature_rows(extractor)
+
+    try:
+        import xgboost as xgb
+        xgb_model = xgb.XGBRegressor()
+        xgb_model.load_model(MODEL_PATH)
+    except ImportError as e:
+        print(f"[scorer] xgboost 를 사용할 수 없어 일치 검사를 건너뜁니다: {e}")
+        xgb_model = None
+
+    if xgb_model is not None:
+        print(f"[scorer] XGBRegressor.predict 일치 검사 (트리 {scorer.num_trees}개, 최대 깊이 {scorer.max_depth})")
+        for name, rows in (('random', random_rows), ('threshold/NaN', edge_rows), ('landmark', landmark_rows), ('teacher images', real_rows)):
+            if not len(rows):
+                continue
+            max_error = float(np.abs(xgb_model.predict(rows) - scorer.predict(rows)).max())
+            print(f"  {name:<16s} {len(rows):5d} rows  max |diff| = {max_error:.2e}")
+            assert max_error < 1e-4, f"{name} 행에서 점수가 다릅니다."
+
+    single = random_rows[:1]
+    batch = random_rows[:256]
+    print("[scorer] 단건 / 256행 배치 predict")
+    baseline = None
+    if xgb_model is not None:
+        baseline = time_per_call(lambda: xgb_model.predict(single), repeat)
+        report("XGBRegressor.predict (1 row)", baseline)
+    report("TreeEnsembleScorer.predict (1 row)", time_per_call(lambda: scorer.predict(single), repeat), baseline)
+    batch_baseline = None
+    if xgb_model is not None:
+        batch_baseline = time_per_call(lambda: xgb_model.predict(batch), max(1, repeat // 10))
+        report("XGBRegressor.predict (256 rows)", batch_baseline)
+    report("TreeEnsembleScorer.predict (256 rows)", time_per_call(lambda: scorer.predict(batch), max(1, repeat // 10)), batch_baseline)
+
+
+def bench_nearest(args):
+    """기준 표정 인덱스: 기준 표정 수별 단건 / 64건 묶음 top-5 질의 (cosine, l2) 와 파이썬 반복문 기준."""
+    from reference_index import ExpressionIndex
+
+    feature_cols = load_feature_cols()
+    extractor = AUFeatureExtractor(feature_cols)
+    repeat = max(10, args.repeat // 10)
+    queries = extractor.compute(random_landmarks(64, seed=7))
+    for size in (110, 1000, 5000, 20000):
+        rows = extractor.compute(random_landmarks(size, seed=size))
+        labels = np.arange(size)
+        index = ExpressionIndex(rows, feature_cols, np.where(labels % 3, 'teachers', 'expression'), labels % 7, labels,
+                                np.full(size, '/static/images/benchmark.png'))
+        print(f"[nearest] 기준 표정 {size}개 x AU {len(index.au_names)}개")
+        baseline = None
+        if size <= 1000:
+            # 기준 표정마다 파이썬에서 코사인 유사도를 계산하는 방식 (비교 기준)
+            values = [index.values[i] for i in range(size)]
+
+            def loop_search(query=queries[0, index.columns]):
+                sims = [float(np.dot(query, v) / (np.linalg.norm(query) * np.linalg.norm(v))) for v in values]
+                return sorted(range(size), key=lambda i: -sims[i])[:5]
+            baseline = time_per_call(loop_search, max(1, repeat // 10))
+            report(f"python loop cosine top-5 (M={size})", baseline)
+        for metric in ('cosine', 'l2'):
+            report(f"search {metric} top-5 1 query (M={size})",
+                   time_per_call(lambda: index.search(queries[0], 5, metric), repeat), baseline if metric == 'cosine' else None)
+            per_query = time_per_call(lambda: index.search(queries, 5, metric), max(1, repeat // 4)) / len(queries)
+            report(f"search {metric} top-5 x64, per query (M={size})", per_query)
+        report(f"search cosine top-5 set filter (M={size})",
+               time_per_call(lambda: index.search(queries[0], 5, 'cosine', reference_set='expression'), repeat))
+        report(f"matches cosine top-5 + AU delta (M={size})", time_per_call(lambda: index.matches(queries[0], 5), repeat))
+
+
+def bench_session(args):
+    """세션 라운드 기록: 예전 방식 (라운드 dict 목록, 조회마다 복사/정렬) 과 SessionHistory 의 메모리 / 피드백 JSON 생성 시간."""
+    import tracemalloc
+    from datetime import datetime, timedelta
+    from session_history import SessionHistory
+
+    feature_cols = load_feature_cols()
+    extractor = AUFeatureExtractor(feature_cols)
+    repeat = max(10, args.repeat // 10)
+    sessions = 500
+    dumps = lambda value: json.dumps(value, sort_keys=True, separators=(',', ':')) # jsonify 와 같은 형식
+    page_fields = ('round_number', 'au_detail_values', 'photo_url', 'photo_status') # feedback.html 이 쓰는 필드
+    for rounds_per_session in (10, 30):
+        rows = extractor.compute(random_landmarks(rounds_per_session, seed=rounds_per_session))
+        start = datetime(2026, 1, 1, 9, 0, 0)
+        rounds = [{
+            'teacher_id': 'emma', 'round_number': n + 1, 'overall_score': round(float(n * 3.1415 % 100), 4),
+            'au_detail_values': extractor.detail_values(rows[n]),
+            'photo_url': f"https://storage.googleapis.com/smilefit/au_captures/emma/au_capture_temp_{n:032d}.jpg",
+            'photo_status': 'uploaded', 'timestamp': (start + timedelta(seconds=n * 7.25)).isoformat(),
+        } for n in range(rounds_per_session)]
+        order = list(reversed(rounds)) # 도착 순서와 round_number 순서가 다른 경우
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        dict_sessions = [[dict(r, au_detail_values=dict(r['au_detail_values'])) for r in order] for _ in range(sessions)]
+        dict_bytes = (tracemalloc.get_traced_memory()[0] - before) / sessions
+        before = tracemalloc.get_traced_memory()[0]
+        histories = [SessionHistory.from_rounds(order) for _ in range(sessions)]
+        history_bytes = (tracemalloc.get_traced_memory()[0] - before) / sessions
+        tracemalloc.stop()
+        print(f"[session] 라운드 {rounds_per_session}개: 세션당 메모리 dict {dict_bytes / 1024:.1f} KB -> "
+              f"SessionHistory {history_bytes / 1024:.1f} KB (x{dict_bytes / history_bytes:.1f})")
+        record(f"session memory per session (rounds={rounds_per_session})", dict_kb=round(dict_bytes / 1024, 2),
+               history_kb=round(history_bytes / 1024, 2))
+
+        stored, history = dict_sessions[0], histories[0]
+
+        def dict_feedback():
+            # 예전 경로: 잠금 안에서 dict 복사, 조회마다 정렬, jsonify 형식으로 직렬화
+            user_data = [dict(r) for r in stored]
+            user_data.sort(key=lambda x: x.get('round_number', 0))
+            return dumps({'user_data': user_data})
+        baseline = time_per_call(dict_feedback, repeat)
+        report(f"dict list copy+sort+json (rounds={rounds_per_session})", baseline)
+        # 새 경로: 잠금 안에서 열 사본, 잠금 밖에서 rounds() dict -> JSON (feedback_payload + jsonify 와 같은 방식)
+        report(f"history copy+json full (rounds={rounds_per_session})",
+               time_per_call(lambda: dumps({'user_data': history.copy().rounds()}), repeat), baseline)
+        report(f"history copy+json page fields (rounds={rounds_per_session})",
+               time_per_call(lambda: dumps({'user_data': history.copy().rounds(page_fields)}), repeat), baseline)
+        report(f"history copy+json limit=5 scores (rounds={rounds_per_session})",
+               time_per_call(lambda: dumps({'user_data': history.copy().rounds(('round_number', 'overall_score'), 0, 5)}), repeat), baseline)
+        report(f"history summary (rounds={rounds_per_session})", time_per_call(history.summary, repeat))
+
+
+class SyntheticFaceSequence:
+    """
+    녹화 영상 대용: 표정 키프레임을 hold_s 초씩 유지하고 transition_s 초에 걸쳐 다음 표정으로 바꾸는 AU 거리(정답)로
+    랜드마크를 만들고, 관측 랜드마크에는 떨림(jitter: AU 거리 범위 대비 비율)을 더합니다.
+
+    - AU 거리 범위는 점수 모델의 분할 임계값 범위 (AU 와 AU_w 컬럼) 에서 가져오므로 표정이 바뀌면 점수도 바뀝니다.
+      AU 랜드마크 쌍들은 사이클 없는 그래프라 모든 쌍의 거리를 정확히 맞춰 배치할 수 있습니다.
+    - 표정이 바뀌는 동안 고개도 옆으로 움직이고 (얼굴 원 위치), 입/눈 크기가 표정을 따라 그려져 움직임 감지에 쓰입니다.
+    - 프레임 이미지의 첫 픽셀에 인덱스를 넣어 가짜 FaceMesh 가 해당 프레임의 관측 랜드마크를 돌려줍니다.
+    """
+
+    def __init__(self, extractor, scorer, count=450, fps=30.0, size=(320, 240), hold_s=1.0, transition_s=0.4,
+                 jitter=0.05, seed=0):
+        rng = np.random.default_rng(seed)
+        self.count = count
+        self.fps = fps
+        self.size = size
+        width, height = size
+        pairs = [tuple(int(i) for i in pair) for pair in extractor.pair_index]
+        edges = sorted(set(pairs))
+        low, high = self._distance_ranges(extractor, scorer, pairs, edges)
+
+        # 표정 키프레임 사이 진행도: 유지 구간은 0, 전환 구간은 smoothstep 으로 0 -> 1
+        t = np.arange(count) / fps
+        period = hold_s + transition_s
+        key = (t // period).astype(np.intp)
+        phase = np.clip((t - key * period - hold_s) / transition_s, 0.0, 1.0)
+        blend = (phase * phase * (3.0 - 2.0 * phase))[:, None]
+        keyframes = rng.uniform(low, high, size=(key.max() + 2, len(edges)))
+        distances = keyframes[key] * (1.0 - blend) + keyframes[key + 1] * blend # (count, 쌍)
+        self.expression = (distances - low) / (high - low) # 쌍별 0~1 표정 강도 (그리기용)
+        self.edge_index = {edge: i for i, edge in enumerate(edges)}
+
+        # 고개 위치: 표정을 바꾸는 동안 새 위치로 이동 (+ 작은 흔들림)
+        head_keys = rng.uniform(-0.2, 0.2, size=key.max() + 2) * width
+        self.head_x = (width / 2 + head_keys[key] * (1.0 - blend[:, 0]) + head_keys[key + 1] * blend[:, 0]
+                       + 2.0 * np.sin(2 * np.pi * 0.7 * t))
+
+        # 랜드마크 (픽셀): 쌍 그래프를 따라 부모 위치 + 고정 방향 * 거리 로 배치
+        directions = rng.normal(size=(len(edges), 2))
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+        points = np.zeros((count, NUM_LANDMARKS, 2), dtype=np.float64)
+        points[:, :, 0] = self.head_x[:, None]
+        points[:, :, 1] = height / 2
+        placed = set()
+        for root in sorted({i for edge in edges for i in edge}):
+            if root in placed:
+                continue
+            placed.add(root)
+            frontier = [root]
+            while frontier:
+                node = frontier.pop()
+                for e, (a, b) in enumerate(edges):
+                    if node not in (a, b):
+                        continue
+                    other = b if node == a else a
+                    if other in placed:
+                        continue
+                    points[:, other] = points[:, node] + distances[:, e, None] * directions[e]
+                    placed.add(other)
+                    frontier.append(other)
+        scale = np.array([width, height], dtype=np.float64)
+        noise = rng.normal(0.0, jitter * float(np.median(high - low)), points.shape)
+        self.clean = (points / scale).astype(np.float32)
+        self.observed = ((points + noise) / scale).astype(np.float32)
+
+    @staticmethod
+    def _distance_ranges(extractor, scorer, pairs, edges):
+        """쌍별 거리 범위: 그 쌍을 쓰는 AU (와 AU_w / 가중치) 컬럼의 분할 임계값 최소~최대를 20% 넓힌 범위."""
+        split = scorer.left_child != np.arange(len(scorer.left_child))
+        columns = {name: i for i, name in enumerate(extractor.feature_cols)}
+        low = np.full(len(edges), np.inf)
+        high = np.full(len(edges), -np.inf)
+        for au, pair in zip(extractor.au_names, pairs):
+            e = edges.index(pair)
+            for name, factor in ((au, 1.0), (f"{au}_w", AU_WEIGHT)):
+                if name in columns:
+                    thresholds = scorer.threshold[split & (scorer.feature_index == columns[name])] / factor
+                    if len(thresholds):
+                        low[e] = min(low[e], float(thresholds.min()))
+                        high[e] = max(high[e], float(thresholds.max()))
+        unused = ~np.isfinite(low)
+        low[unused], high[unused] = 0.5, 1.0 # 모델이 쓰지 않는 쌍
+        spread = np.maximum(high - low, 0.1 * np.maximum(high, 0.1))
+        return np.maximum(low - 0.2 * spread, 0.01), high + 0.2 * spread
+
+    def _intensity(self, index, *aus):
+        return float(np.mean([self.expression[index, self.edge_index[tuple(AU_LANDMARKS[au])]] for au in aus]))
+
+    def frame(self, index):
+        width, height = self.size
+        frame = np.full((height, width, 3), 40, dtype=np.uint8)
+        center = (int(self.head_x[index]), height // 2)
+        radius = height // 4
+        cv2.circle(frame, center, radius, (200, 180, 160), -1)
+        eye = max(1, int(2 + 8 * self._intensity(index, 'AU43', 'AU05')))
+        for side in (-1, 1):
+            cv2.ellipse(frame, (center[0] + side * radius // 2, center[1] - radius // 3), (radius // 5, eye), 0, 0, 360, (60, 40, 30), -1)
+        mouth = (int(radius * (0.2 + 0.5 * self._intensity(index, 'AU12', 'AU11'))), max(1, int(2 + radius * 0.4 * self._intensity(index, 'AU25', 'AU26'))))
+        cv2.ellipse(frame, (center[0], center[1] + radius // 2), mouth, 0, 0, 360, (90, 40, 60), -1)
+        frame[0, 0] = (index % 256, index // 256, 0)
+        return frame
+
+    def face_mesh(self):
+        sequence = self
+
+        class FakeFaceMesh:
+            def process(self, rgb):
+                index = int(rgb[0, 0, 2]) + int(rgb[0, 0, 1]) * 256 # BGR -> RGB 변환으로 채널 순서가 반대
+                points = sequence.observed[index]
+                face = SimpleNamespace(landmark=[SimpleNamespace(x=float(x), y=float(y), z=0.0) for x, y in points])
+                return SimpleNamespace(multi_face_landmarks=[face])
+
+        return FakeFaceMesh()
+
+
+def recorded_frames(path, limit=900):
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = []
+    while len(frames) < limit:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames, fps
+
+
+def bench_tracking(args):
+    """추적 레이어: 프레임 건너뛰기 / AU 거리 필터 설정별 FaceMesh 호출 수, 프레임당 시간, 점수 안정성."""
+    from au_tracking import TrackedAUAnalyzer
+
+    feature_cols = load_feature_cols()
+    extractor = AUFeatureExtractor(feature_cols)
+    scorer = TreeEnsembleScorer.load(MODEL_PATH)
+    video_path = os.environ.get('SMILEFIT_BENCH_VIDEO')
+
+    if video_path:
+        from face_pipeline import create_tracking_face_mesh
+        frames, fps = recorded_frames(video_path)
+        get_frame = frames.__getitem__
+        count = len(frames)
+        make_face_mesh = create_tracking_face_mesh
+        reference = reference_scores = None # 매 프레임 추론 + 필터 없음 결과(AU 행, 점수)를 기준으로 사용
+        print(f"[tracking] 녹화 영상 {video_path}: {count} 프레임 @ {fps:.1f}fps")
+    else:
+        sequence = SyntheticFaceSequence(extractor, scorer)
+        get_frame, count, fps = sequence.frame, sequence.count, sequence.fps
+        make_face_mesh = sequence.face_mesh
+        width, height = sequence.size
+        reference = extractor.compute(sequence.clean * np.array([width, height], dtype=np.float32))
+        reference_scores = scorer.predict(reference)
+        print(f"[tracking] 합성 시퀀스 {count} 프레임 @ {fps:.0f}fps (표정 변화 + 고개 이동, 기준 = 떨림 없는 AU 값/점수: "
+              f"점수 평균 {float(reference_scores.mean()):.4f}, 표준편차 {float(reference_scores.std()):.4f})")
+        record("reference", score_mean=round(float(reference_scores.mean()), 4), score_std=round(float(reference_scores.std()), 4))
+    if not count:
+        print("  프레임이 없습니다.")
+        return
+
+    configs = [
+        (1, 0.0, 'none'), (1, 0.0, 'ema'), (1, 0.0, 'one_euro'),
+        (2, 0.0, 'one_euro'), (3, 0.0, 'one_euro'), (3, 6.0, 'one_euro'), (5, 6.0, 'one_euro'), (5, 6.0, 'ema'),
+    ]
+    # AU/score jitter: 프레임 간 변화의 표준편차 (떨림), RMSE: 기준 대비 오차 (지연/유지로 인한 오차 포함),
+    # score std: 점수 자체의 표준편차 (표정 변화를 따라가는지)
+    detail = extractor.detail_columns
+    print(f"  {'every_k':>7s} {'motion':>6s} {'smoothing':>9s} {'FaceMesh':>9s} {'ms/frame':>9s} {'AU jitter':>10s} {'AU RMSE':>8s} "
+          f"{'score std':>9s} {'score jit':>9s} {'score RMSE':>10s}")
+    for every_k, motion, smoothing in configs:
+        analyzer = TrackedAUAnalyzer(make_face_mesh(), extractor, scorer, every_k=every_k, motion_threshold=motion, smoothing=smoothing)
+        rows = np.zeros((count, len(feature_cols)), dtype=np.float32)
+        scores = np.zeros(count, dtype=np.float32)
+        elapsed = 0.0
+        for i in range(count):
+            frame = get_frame(i)
+            start = time.perf_counter()
+            au_row, scores[i], status, _ = analyzer.process(frame, timestamp=i / fps)
+            elapsed += time.perf_counter() - start
+            if status == 'ok':
+                rows[i] = au_row
+        if reference is None:
+            reference, reference_scores = rows.copy(), scores.copy()
+        jitter = float(np.std(np.diff(rows[:, detail], axis=0), axis=0).mean())
+        rmse = float(np.sqrt(np.mean((rows[:, detail] - reference[:, detail]) ** 2)))
+        score_std = float(np.std(scores))
+        score_jitter = float(np.std(np.diff(scores)))
+        score_rmse = float(np.sqrt(np.mean((scores - reference_scores) ** 2)))
+        print(f"  {every_k:7d} {motion:6.1f} {smoothing:>9s} {analyzer.stats()['inference_ratio'] * 100:8.1f}% "
+              f"{elapsed / count * 1000:9.3f} {jitter:10.4f} {rmse:8.4f} {score_std:9.4f} {score_jitter:9.4f} {score_rmse:10.4f}")
+        record(f"every_k={every_k} motion={motion} smoothing={smoothing}", inference_ratio=analyzer.stats()['inference_ratio'],
+               ms_per_frame=round(elapsed / count * 1000, 4), au_jitter=round(jitter, 4), au_rmse=round(rmse, 4),
+               score_std=round(score_std, 4), score_jitter=round(score_jitter, 4), score_rmse=round(score_rmse, 4))
+
+
+class SequenceCapture:
+    """SyntheticFaceSequence 를 VideoCapture 처럼 읽는 어댑터 (isOpened/read/grab/get)."""
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.position = 0
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return self.sequence.fps if prop == cv2.CAP_PROP_FPS else 0.0
+
+    def grab(self):
+        if self.position >= self.sequence.count:
+            return False
+        self.position += 1
+        return True
+
+    def read(self):
+        if self.position >= self.sequence.count:
+            return False, None
+        frame = self.sequence.frame(self.position)
+        self.position += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def bench_video(args):
+    """영상 분석: stride / 묶음 예측 크기별 초당 분석 프레임 수 (CPU), 그리고 영상 파일 디코딩(read / grab) 속도."""
+    import tempfile
+    from video_analysis import VideoAnalyzer
+
+    feature_cols = load_feature_cols()
+    extractor = AUFeatureExtractor(feature_cols)
+    scorer = TreeEnsembleScorer.load(MODEL_PATH)
+    sequence = SyntheticFaceSequence(extractor, scorer, count=900)
+    configs = [(1, 1), (1, 64), (2, 64), (3, 64)]
+
+    print(f"[video] 합성 시퀀스 {sequence.count} 프레임 (가짜 FaceMesh: 디코딩/추론 제외, 분석기 자체 비용)")
+    for stride, batch_size in configs:
+        analyzer = VideoAnalyzer(sequence.face_mesh, extractor, scorer, stride=stride, batch_size=batch_size)
+        analysis = analyzer.analyze(SequenceCapture(sequence))
+        fps = len(analysis) / analysis.elapsed
+        print(f"  stride {stride} batch {batch_size:3d}: {len(analysis)} 프레임 분석, {fps:9.1f} 분석 프레임/초, "
+              f"{analysis.source_frames / analysis.elapsed:9.1f} 영상 프레임/초")
+        record(f"synthetic stride={stride} batch={batch_size}", analyzed_frames=len(analysis),
+               analyzed_fps=round(fps, 1), source_fps=round(analysis.source_frames / analysis.elapsed, 1))
+
+    # 영상 파일 디코딩: 전체 read() 와 stride 3 (grab 으로 건너뛰기)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'synthetic.avi')
+        width, height = sequence.size
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), sequence.fps, (width, height))
+        for i in range(sequence.count):
+            writer.write(sequence.frame(i))
+        writer.release()
+        for label, stride in (('decode read()', 1), ('decode stride 3 (grab)', 3)):
+            capture = cv2.VideoCapture(path)
+            start = time.perf_counter()
+            frames = 0
+            while True:
+                ok = capture.grab() if frames % stride else capture.read()[0]
+                if not ok:
+                    break
+                frames += 1
+            elapsed = time.perf_counter() - start
+            capture.release()
+            print(f"  {label:<24s} {frames} 프레임, {frames / elapsed:9.1f} 영상 프레임/초 ({width}x{height} MJPG)")
+            record(label, frames=frames, source_fps=round(frames / elapsed, 1))
+
+    video_path = os.environ.get('SMILEFIT_BENCH_VIDEO')
+    if video_path:
+        from face_pipeline import create_tracking_face_mesh
+        print(f"[video] 녹화 영상 {video_path} (실제 FaceMesh 추적 모드)")
+        for stride in (1, 2, 3):
+            try:
+                analysis = VideoAnalyzer(create_tracking_face_mesh, extractor, scorer, stride=stride, max_side=args.max_side).analyze(video_path)
+            except (ImportError, AttributeError, IOError) as e:
+                print(f"  분석 불가: {e}")
+                return
+            fps = len(analysis) / analysis.elapsed
+            print(f"  stride {stride}: {len(analysis)} 프레임 분석, {fps:7.1f} 분석 프레임/초, "
+                  f"{analysis.source_frames / analysis.elapsed:7.1f} 영상 프레임/초, 얼굴 {analysis.face.mean() * 100:.0f}%")
+            record(f"video stride={stride}", analyzed_frames=len(analysis), analyzed_fps=round(fps, 1),
+                   source_fps=round(analysis.source_frames / analysis.elapsed, 1))
+
+
+def create_benchmark_face_mesh():
+    """정지 이미지용 FaceMesh. mediapipe 를 쓸 수 없으면 None."""
+    try:
+        from face_pipeline import create_static_face_mesh
+        return create_static_face_mesh()
+    except (ImportError, AttributeError) as e:
+        print(f"  (FaceMesh 단계 생략: mediapipe 사용 불가 - {e}. 이후 단계는 합성 랜드마크로 측정)")
+        return None
+
+
+def bench_pipeline(args):
+    """번들 이미지로 단계별(decode / FaceMesh / 랜드마크 변환 / calculate_au / predict) 및 전체 지연, 배치 처리량."""
+    import cv2
+    from face_mesh_pool import FaceMeshPool
+    from face_pipeline import analyze_image, decode_image_bytes
+
+    feature_cols = load_feature_cols()
+    extractor = AUFeatureExtractor(feature_cols)
+    scorer = TreeEnsembleScorer.load(MODEL_PATH)
+    images = bundled_images(args.images)
+    passes = max(1, args.passes)
+    print(f"[pipeline] 번들 이미지 {len(images)}장 x {passes}회, max_side={args.max_side}")
+    if not images:
+        return
+
+    face_mesh = create_benchmark_face_mesh()
+    stages = {name: [] for name in ('decode', 'face_mesh', 'landmarks', 'calculate_au', 'predict', 'end_to_end')}
+    rows = []
+    no_face = 0
+    for _ in range(passes):
+        for i, (_, data) in enumerate(images):
+            total = time.perf_counter()
+            start = time.perf_counter()
+            img, original_size = decode_image_bytes(data, args.max_side)
+            stages['decode'].append(time.perf_counter() - start)
+            if img is None:
+                continue
+
+            if face_mesh is not None:
+                start = time.perf_counter()
+                results = face_mesh.process(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+                stages['face_mesh'].append(time.perf_counter() - start)
+                if not results.multi_face_landmarks:
+                    no_face += 1
+                    continue
+                face = results.multi_face_landmarks[0]
+            else:
+                face = fake_face_landmarks(seed=i)
+
+            start = time.perf_counter()
+            points = landmarks_to_array(face, original_size)
+            stages['landmarks'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            au_row = extractor.compute(points)
+            stages['calculate_au'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            scorer.predict(au_row[np.newaxis])
+            stages['predict'].append(time.perf_counter() - start)
+            stages['end_to_end'].append(time.perf_counter() - total)
+            rows.append(points)
+    if no_face:
+        print(f"  (얼굴 미검출 {no_face}건은 decode/FaceMesh 단계에만 포함)")
+
+    print("[pipeline] 단건 요청 단계별 지연" + ("" if face_mesh is not None else " (end_to_end 는 FaceMesh 제외)"))
+    for name, samples in stages.items():
+        report_latency(name, samples)
+
+    if face_mesh is not None:
+        print("[pipeline] analyze_image (실제 요청 경로: 디코딩 + FaceMesh 풀 + 필요한 랜드마크만 읽는 어댑터 + predict)")
+        pool = FaceMeshPool(lambda: face_mesh, size=1)
+        samples = []
+        for _ in range(passes):
+            for _, data in images:
+                start = time.perf_counter()
+                analyze_image(data, pool, extractor, scorer, args.max_side)
+                samples.append(time.perf_counter() - start)
+        report_latency('analyze_image', samples)
+
+    if rows:
+        print("[pipeline] 배치 (특징 계산 + predict, 배치당 지연 / 초당 행 수)")
+        points = np.stack(rows)
+        for batch_size in sorted({1, 8, 32, len(points)}):
+            if batch_size > len(points):
+                continue
+            samples = []
+            for start in range(0, len(points) - batch_size + 1, batch_size):
+                batch = points[start:start + batch_size]
+                t = time.perf_counter()
+                scorer.predict(extractor.compute(batch))
+                samples.append(time.perf_counter() - t)
+            report_latency(f"batch {batch_size}", samples, items_per_sample=batch_size)
+
+
+def bench_load(args):
+    """Flask 테스트 클라이언트로 /submit_au_data_with_image 를 동시 호출 (기본: 로컬 가짜 Firebase, 결과 캐시 끔)."""
+    os.environ.setdefault('SMILEFIT_FIREBASE', 'local') # 부하 테스트가 실제 Storage 에 업로드하지 않도록
+    if not args.load_cache:
+        os.environ['SMILEFIT_RESULT_CACHE_SIZE'] = '0' # 같은 이미지를 반복하므로 캐시를 켜면 분석을 건너뜀
+    try:
+        import app as smilefit
+    except (SystemExit, Exception) as e:
+        print(f"[load] 앱을 불러올 수 없어 건너뜁니다: {e!r}")
+        return
+
+    images = bundled_images(args.images)
+    if not images:
+        print("[load] 번들 이미지가 없습니다.")
+        return
+    total = args.requests
+    concurrency = max(1, args.concurrency)
+    print(f"[load] /submit_au_data_with_image 요청 {total}개, 동시 {concurrency}개, 이미지 {len(images)}장 순환")
+
+    def client_loop(worker):
+        client = smilefit.app.test_client()
+        latencies, statuses = [], {}
+        for i in range(worker, total, concurrency):
+            path, data = images[i % len(images)]
+            start = time.perf_counter()
+            response = client.post('/submit_au_data_with_image', data={
+                'teacher_id': 'benchmark',
+                'round_number': str(i % 8 + 1),
+                'photo': (io.BytesIO(data), os.path.basename(path)),
+            }, content_type='multipart/form-data')
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return latencies, statuses
+
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(client_loop, range(concurrency)))
+    wall = time.perf_counter() - wall
+
+    latencies = [latency for worker_latencies, _ in results for latency in worker_latencies]
+    statuses = {}
+    for _, worker_statuses in results:
+        for code, count in worker_statuses.items():
+            statuses[code] = statuses.get(code, 0) + count
+    stats = report_latency(f"submit (concurrency {concurrency})", latencies)
+    throughput = round(len(latencies) / wall, 1) if wall else None
+    print(f"  실제 처리량 {throughput}/s (경과 {wall:.2f}s), 응답 코드 {statuses}")
+    RESULTS[_current['benchmark']][-1].update(wall_throughput_per_s=throughput, statuses={str(k): v for k, v in statuses.items()})
+    smilefit.storage_uploader.shutdown(wait=True)
+
+
+class SimulatedFaceMesh:
+    """
+    mediapipe 가 없을 때 HTTP 부하 테스트용 FaceMesh 대용. 실제 FaceMesh 처럼 GIL 을 놓고 delay_ms 동안 기다린 뒤
+    고정된 가짜 랜드마크를 반환합니다 (서버 구조에 따른 동시성 차이만 보기 위한 것으로, 분석 비용은 실제와 다름).
+    """
+
+    def __init__(self, delay_ms=float(os.environ.get('SMILEFIT_BENCH_FACE_MESH_MS', '20'))):
+        self.delay = delay_ms / 1000.0
+        self.face = fake_face_landmarks()
+
+    def process(self, image):
+        time.sleep(self.delay)
+        return SimpleNamespace(multi_face_landmarks=[self.face])
+
+    def close(self):
+        pass
+
+
+# HTTP 부하 테스트용 서버 프로세스 (python -c HTTP_SERVER_PROBE <mode> <port> <threads>)
+HTTP_SERVER_PROBE = r'''
+import sys
+mode, port, threads = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+import app
+import benchmark
+import serve
+from face_mesh_pool import FaceMeshPool
+if benchmark.create_benchmark_face_mesh() is None:
+    app.face_mesh_pool = FaceMeshPool(benchmark.SimulatedFaceMesh, size=app.face_mesh_pool.size)
+if mode == 'wsgi':
+    # gunicorn 워커는 fork 되므로 준비(스레드 시작 포함)는 워커 안에서
+    serve.run_wsgi(app.app, host='127.0.0.1', port=port, workers=1, threads=threads,
+                   post_fork=lambda server, worker: app.warm_up())
+else:
+    app.warm_up() # 요청을 받기 전에 모두 준비
+    if mode == 'asgi':
+        import asgi
+        serve.run_asgi(asgi.application, host='127.0.0.1', port=port)
+    else:
+        serve.run_dev(app.app, host='127.0.0.1', port=port)
+'''
+
+
+class HttpClient:
+    """asyncio 스트림 위의 최소 HTTP/1.1 keep-alive 클라이언트 (부하 테스트용). 사용자 한 명처럼 세션 쿠키를 기억합니다."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.cookies = {}
+        self.reader = None
+        self.writer = None
+
+    async def _send(self, method, path, body=b'', content_type=None):
+        import asyncio
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        if content_type:
+            lines.append(f"Content-Type: {content_type}")
+        if self.cookies:
+            lines.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in self.cookies.items()))
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                cookie_name, _, cookie_value = value.split(';', 1)[0].partition('=')
+                self.cookies[cookie_name] = cookie_value
+            headers[name] = value
+        return status, headers
+
+    async def request(self, method, path, body=b'', content_type=None):
+        """(status, body). 연결 오류는 예외로 전달하고 다음 요청에서 다시 연결합니다."""
+        try:
+            status, headers = await self._send(method, path, body, content_type)
+            if 'content-length' in headers:
+                data = await self.reader.readexactly(int(headers['content-length']))
+            elif headers.get('transfer-encoding', '').lower() == 'chunked':
+                chunks = []
+                while True:
+                    size = int((await self.reader.readline()).split(b';')[0], 16)
+                    chunks.append(await self.reader.readexactly(size + 2))
+                    if size == 0:
+                        break
+                data = b''.join(chunk[:-2] for chunk in chunks)
+            else:
+                data = await self.reader.read()
+                await self.close()
+            if headers.get('connection', '').lower() == 'close':
+                await self.close()
+            return status, data
+        except Exception:
+            await self.close()
+            raise
+
+    async def stream(self, path, until):
+        """스트리밍 응답을 until(loop.time()) 까지 읽고 받은 프레임 수를 반환합니다 (b'--frame' 경계 개수)."""
+        import asyncio
+        status, _ = await self._send('GET', path)
+        frames, tail = 0, b''
+        loop = asyncio.get_running_loop()
+        try:
+            while loop.time() < until:
+                try:
+                    data = await asyncio.wait_for(self.reader.read(65536), max(0.01, until - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if not data:
+                    break
+                frames += (tail + data).count(b'--frame')
+                tail = data[-7:]
+        finally:
+            await self.close()
+        return status, frames
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+
+def multipart_body(fields, files):
+    boundary = f"smilefit{os.getpid()}{int(time.time() * 1000)}"
+    parts = []
+    for name, value in fields.items():
+        parts.append(f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n".encode('utf-8'))
+    for name, (filename, data, content_type) in files.items():
+        parts.append(f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+                     f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode('utf-8'))
+    return b''.join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def start_http_server(mode, port, threads, log_file):
+    """서버 프로세스를 띄우고 /ready 가 응답할 때까지 기다립니다. 로그는 log_file 로 (파이프는 가득 차면 서버가 멈춤)."""
+    env = dict(os.environ, SMILEFIT_FIREBASE='local', SMILEFIT_SYNTHETIC_CAMERA='1', SMILEFIT_RESULT_CACHE_SIZE='0',
+               SMILEFIT_WARMUP='off', SMILEFIT_LOG_LEVEL='WARNING', PYTHONPATH=os.pathsep.join(filter(None, [BASE_DIR, os.environ.get('PYTHONPATH')])))
+    process = subprocess.Popen([sys.executable, '-c', HTTP_SERVER_PROBE, mode, str(port), str(threads)], cwd=BASE_DIR, env=env,
+                               stdout=log_file, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            log_file.seek(0)
+            raise RuntimeError(log_file.read().decode('utf-8', 'replace')[-2000:])
+        try:
+            import urllib.request
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1)
+            return process
+        except OSError as e:
+            if getattr(e, 'code', None) == 503:
+                return process # 일부 구성 요소만 준비되지 않음 (예: Firebase) - 측정에는 지장 없음
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("서버가 60초 안에 시작되지 않았습니다.")
+
+
+def stop_http_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def _http_scenarios(port, args, photo):
+    """피드백 조회(동시 연결 수별), 비디오 스트림을 열어 둔 상태의 사진 제출. 결과: {시나리오: (지연 목록, 응답 코드, 경과, 추가 값)}"""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    results = {}
+
+    async def user_loop(client, until, make_request, latencies, statuses):
+        while loop.time() < until:
+            start = time.perf_counter()
+            try:
+                status, _ = await make_request(client)
+            except Exception:
+                status = 'error'
+                await asyncio.sleep(0.05)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    for concurrency in args.http_concurrency:
+        clients = [HttpClient('127.0.0.1', port) for _ in range(concurrency)]
+        # 사용자마다 라운드 기록 하나 (사진 없이) 를 만들어 두고 피드백 데이터 조회
+        body, content_type = multipart_body({'teacher_id': 'benchmark', 'round_number': '1'}, {})
+        await asyncio.gather(*[client.request('POST', '/submit_au_data_with_image', body, content_type) for client in clients],
+                             return_exceptions=True)
+        latencies, statuses = [], {}
+        started = loop.time()
+        await asyncio.gather(*[user_loop(client, started + args.http_duration,
+                                         lambda c: c.request('GET', '/get_user_feedback_data'), latencies, statuses)
+                               for client in clients])
+        results[f"feedback (connections {concurrency})"] = (latencies, statuses, loop.time() - started, {})
+        await asyncio.gather(*[client.close() for client in clients])
+
+    body, content_type = multipart_body({'teacher_id': 'benchmark', 'round_number': '1'}, {'photo': photo})
+    streams = [HttpClient('127.0.0.1', port) for _ in range(args.http_streams)]
+    submitters = [HttpClient('127.0.0.1', port) for _ in range(args.http_submit_concurrency)]
+    latencies, statuses = [], {}
+    started = loop.time()
+    until = started + args.http_duration
+    stream_tasks = [asyncio.ensure_future(client.stream('/video_feed?fps=15', until + 0.5)) for client in streams]
+    await asyncio.sleep(0.5) # 스트림 연결이 자리 잡은 뒤 제출 시작
+    await asyncio.gather(*[user_loop(client, until, lambda c: c.request('POST', '/submit_au_data_with_image', body, content_type),
+                                     latencies, statuses) for client in submitters])
+    stream_results = await asyncio.gather(*stream_tasks, return_exceptions=True)
+    frames = [result[1] for result in stream_results if not isinstance(result, BaseException) and result[0] == 200]
+    stream_fps = round(sum(frames) / len(streams) / args.http_duration, 1) if streams else None
+    results[f"submit (concurrency {args.http_submit_concurrency}, video streams {args.http_streams})"] = (
+        latencies, statuses, loop.time() - started - 0.5,
+        {'streams_connected': len(frames), 'stream_fps_per_client': stream_fps})
+    await asyncio.gather(*[client.close() for client in submitters])
+    return results
+
+
+def bench_http(args):
+    """
+    실제 HTTP 서버 부하 테스트: 개발 서버(dev) / gunicorn gthread(wsgi) / uvicorn + asgi.py(asgi) 를 각각 띄우고
+    같은 asyncio 클라이언트로 피드백 조회와 (비디오 스트림을 열어 둔 상태의) 사진 제출을 측정합니다.
+    mediapipe 가 없으면 서버는 SimulatedFaceMesh 를 씁니다.
+    """
+    import asyncio
+    import importlib.util
+    import socket
+    import tempfile
+
+    images = bundled_images(1)
+    if not images:
+        print("[http] 번들 이미지가 없습니다.")
+        return
+    path, data = images[0]
+    photo = (os.path.basename(path), data, 'image/png')
+    required = {'asgi': ('uvicorn', 'a2wsgi'), 'wsgi': ('gunicorn',), 'dev': ()}
+    for mode in args.http_modes:
+        missing = [package for package in required.get(mode, ()) if importlib.util.find_spec(package) is None]
+        if missing:
+            print(f"[http] {mode}: {', '.join(missing)} 가 설치되어 있지 않아 건너뜁니다.")
+            continue
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        log_file = tempfile.TemporaryFile()
+        try:
+            process = start_http_server(mode, port, args.http_threads, log_file)
+        except RuntimeError as e:
+            print(f"[http] {mode}: 서버 시작 실패 - {e}")
+            log_file.close()
+            continue
+        print(f"[http] {mode} (port {port}, {args.http_duration:.0f}초씩" + (f", 스레드 {args.http_threads}" if mode == 'wsgi' else "") + ")")
+        try:
+            results = asyncio.run(_http_scenarios(port, args, photo))
+        finally:
+            stop_http_server(process)
+            log_file.close()
+        for name, (latencies, statuses, elapsed, extra) in results.items():
+            stats = report_latency(f"{mode} {name}", latencies)
+            throughput = round(len(latencies) / elapsed, 1) if elapsed > 0 else None
+            detail = "".join(f", {key} {value}" for key, value in extra.items())
+            print(f"    처리량 {throughput}/s, 응답 코드 {statuses}{detail}")
+            if stats.get('count'):
+                RESULTS[_current['benchmark']][-1].update(wall_throughput_per_s=throughput,
+                                                          statuses={str(k): v for k, v in statuses.items()}, **extra)
+
+
+# 새 인터프리터에서 실행하는 시작 시간 측정 스크립트 (결과는 마지막 줄의 JSON)
+STARTUP_PROBE = r'''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/')
+first_page = time.perf_counter()
+app.warm_up()
+warmed = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start,
+    'first_page_s': first_page - start,
+    'warm_up_s': warmed - first_page,
+    'components': {component.name: component.status() for component in app.LAZY_COMPONENTS},
+}))
+'''
+
+
+def bench_startup(args):
+    """콜드 스타트: 인터프리터 시작부터 정적 페이지 응답까지, 그리고 warm_up() 에서 구성 요소별 초기화 시간."""
+    env = dict(os.environ, SMILEFIT_WARMUP='off', SMILEFIT_LOG_LEVEL='WARNING')
+    env.setdefault('SMILEFIT_FIREBASE', 'local') # 측정 중 실제 Firebase 에 연결하지 않도록
+    runs = {'process → import app': [], 'process → first page': [], 'import app': [], 'warm_up()': []}
+    component_ms = {}
+    for _ in range(max(1, args.startup_runs)):
+        launched = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-c', STARTUP_PROBE], cwd=BASE_DIR, env=env, capture_output=True, text=True)
+        process_s = time.perf_counter() - launched
+        try:
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            print(f"[startup] 측정 실패 (종료 코드 {completed.returncode}): {completed.stderr.strip()[-500:]}")
+            return
+        # 프로세스 시작 ~ 스크립트 시작 (인터프리터 + site 초기화) 은 전체 시간에서 스크립트 안 측정값을 빼서 추정
+        overhead = process_s - result['first_page_s'] - result['warm_up_s']
+        runs['process → import app'].append(overhead + result['import_s'])
+        runs['process → first page'].append(overhead + result['first_page_s'])
+        runs['import app'].append(result['import_s'])
+        runs['warm_up()'].append(result['warm_up_s'])
+        for name, status in result['components'].items():
+            if status['ready']:
+                component_ms.setdefault(name, []).append(status['init_ms'] / 1000.0)
+            elif status['error']:
+                print(f"  [startup] {name} 초기화 실패: {status['error']}")
+    # 콜드 스타트는 프로세스당 한 번뿐이므로 실행 횟수에 걸친 중앙값 (초당 처리량은 의미가 없어 출력하지 않음)
+    print(f"[startup] 새 프로세스 {max(1, args.startup_runs)}회 콜드 스타트")
+    for name, samples in runs.items():
+        report_cold_start(name, samples)
+    for name, samples in component_ms.items():
+        report_cold_start(f"init {name}", samples)
+
+
+BENCHMARKS = {
+    'au': bench_au,
+    'landmarks': bench_landmarks,
+    'scorer': bench_scorer,
+    'tracking': bench_tracking,
+    'pipeline': bench_pipeline,
+    'load': bench_load,
+    'http': bench_http,
+    'nearest': bench_nearest,
+    'session': bench_session,
+    'video': bench_video,
+    'startup': bench_startup,
+}
+
+# 이름을 지정하지 않았을 때 실행하지 않는 벤치마크 (앱 전체를 띄우는 부하 테스트)
+OPT_IN_BENCHMARKS = ('load', 'http')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmileFit 얼굴 분석 파이프라인 벤치마크")
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help=f"실행할 벤치마크 {list(BENCHMARKS)} (기본: {', '.join(OPT_IN_BENCHMARKS)} 를 뺀 전체)")
+    parser.add_argument('--repeat', type=int, default=2000, help="단건 측정 반복 횟수")
+    parser.add_argument('--passes', type=int, default=3, help="pipeline: 번들 이미지 전체를 반복할 횟수")
+    parser.add_argument('--images', type=int, default=None, help="pipeline/load: 사용할 번들 이미지 최대 개수")
+    parser.add_argument('--max-side', type=int, default=int(os.environ.get('SMILEFIT_MAX_DECODE_SIDE', '0')), help="pipeline: 디코딩 최대 긴 변")
+    parser.add_argument('--concurrency', type=int, default=4, help="load: 동시 클라이언트 수")
+    parser.add_argument('--requests', type=int, default=100, help="load: 총 요청 수")
+    parser.add_argument('--load-cache', action='store_true', help="load: 결과 캐시를 켠 채로 측정")
+    parser.add_argument('--http-modes', type=lambda v: [m for m in v.split(',') if m], default=['dev', 'wsgi', 'asgi'],
+                        help="http: 비교할 서버 (dev,wsgi,asgi)")
+    parser.add_argument('--http-duration', type=float, default=5.0, help="http: 시나리오별 측정 시간(초)")
+    parser.add_argument('--http-concurrency', type=lambda v: [int(c) for c in v.split(',') if c], default=[64, 256],
+                        help="http: 피드백 조회 동시 연결 수 목록 (예: 64,256)")
+    parser.add_argument('--http-streams', type=int, default=50, help="http: 제출 측정 중 열어 둘 /video_feed 스트림 수")
+    parser.add_argument('--http-submit-concurrency', type=int, default=16, help="http: 동시 사진 제출 수")
+    parser.add_argument('--http-threads', type=int, default=32, help="http: wsgi(gunicorn) 워커 스레드 수")
+    parser.add_argument('--startup-runs', type=int, default=3, help="startup: 새 프로세스로 측정할 횟수")
+    parser.add_argument('--json', dest='json_path', default=None, help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"알 수 없는 벤치마크: {', '.join(unknown)}")
+
+    started = time.time()
+    for name in args.names or [name for name in BENCHMARKS if name not in OPT_IN_BENCHMARKS]:
+        _current['benchmark'] = name
+        RESULTS.setdefault(name, [])
+        BENCHMARKS[name](args)
+    print(f"[memory] 최대 RSS {peak_rss_mb()} MB")
+
+    if args.json_path:
+        output = {
+            'commit': git_commit(),
+            'timestamp': started,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': {k: v for k, v in vars(args).items() if k != 'json_path'},
+            'peak_rss_mb': peak_rss_mb(),
+            'results': RESULTS,
+        }
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=1)
+        print(f"결과 저장: {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,78 +1,403 @@
 # calculate_au.py
-# (기존의 sys, json, os, time 임포트는 그대로 유지)
-import cv2
-import mediapipe as mp # mediapipe 임포트
+# 이미지 여러 장을 서버와 같은 방식(디코딩 -> FaceMesh -> 40개 AU 특징 -> 모델 점수)으로 일괄 채점하는 배치 명령
+# 모델이 바뀐 뒤 과거 캡처를 다시 채점하는 용도이며, 결과를 조금씩 파일에 이어 쓰고 중단된 작업을 이어서 할 수 있습니다.
+#
+# 사용법:
+#   python calculate_au.py captures/ -o scores.jsonl                      # 폴더 (하위 폴더 포함)
+#   python calculate_au.py "captures/2024-*/*.jpg" -o scores.csv          # glob
+#   python calculate_au.py --manifest paths.txt -o scores/ --format columnar
+#   python calculate_au.py captures/ -o scores.jsonl --resume             # 이미 채점한 이미지(같은 모델)는 건너뜀
+# 입력 매니페스트: .txt (한 줄에 경로 하나, # 주석), .csv ('path' 열 또는 첫 열), .jsonl ({"path": ...})
+# 출력 형식: jsonl / csv / columnar (폴더 안에 part-00000.npz ... 를 열 단위 배열로 저장, load_columnar() 로 읽기)
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
-# MediaPipe Face Mesh 초기화
-mp_face_mesh = mp.solutions.face_mesh
-mp_drawing = mp.solutions.drawing_utils
-mp_drawing_styles = mp.solutions.drawing_styles
+import numpy as np
 
-def calculate_au_from_data(input_image_path):
-    """
-    MediaPipe를 사용하여 이미지에서 AU 값을 (또는 얼굴 특징) 계산하는 함수.
-    이 함수는 실제 AU 계산 로직을 포함해야 합니다.
-    """
-    print(f"[calculate_au.py] AU 계산 시작: {input_image_path}")
-
-    # 이미지 파일 읽기
-    image = cv2.imread(input_image_path)
-    if image is None:
-        print(f"[calculate_au.py] 오류: 이미지를 읽을 수 없습니다: {input_image_path}")
-        return None
-
-    # 이미지 색상 변환 (BGR -> RGB)
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-    # MediaPipe Face Mesh 처리
-    with mp_face_mesh.FaceMesh(
-        max_num_faces=1,
-        refine_landmarks=True,
-        min_detection_confidence=0.5,
-        min_tracking_confidence=0.5) as face_mesh:
-        
-        results = face_mesh.process(image_rgb)
-
-        # AU 값 계산 (실제 로직 필요)
-        # 이 부분은 MediaPipe의 랜드마크 데이터를 기반으로 AU를 계산하는 복잡한 로직이 필요합니다.
-        # 여기서는 랜드마크가 감지되었는지 여부로 간단히 AU 값을 시뮬레이션합니다.
-        
-        au_value = None
-        if results.multi_face_landmarks:
-            print("[calculate_au.py] 얼굴 랜드마크 감지됨.")
-            # TODO: 여기에 실제 랜드마크 데이터를 기반으로 AU를 계산하는 복잡한 알고리즘을 구현하세요.
-            # 예시: 특정 랜드마크 간의 거리 변화를 측정하여 AU 값으로 변환
-            # 현재는 단순히 랜드마크가 감지되면 랜덤 값 반환
-            import random
-            au_value = round(random.uniform(0.1, 0.9), 3) # 랜드마크 감지 시 0.1~0.9 사이 값
+from au_features import AUFeatureExtractor
+from teacher_reference import FEATURE_COLS_PATH, MODEL_PATH, model_fingerprint
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+OUTPUT_FORMATS = ('jsonl', 'csv', 'columnar')
+META_COLUMNS = ['path', 'sha256', 'status', 'score', 'model_hash']
+
+
+# --- 입력 목록 ---
+def read_manifest(manifest_path):
+    """매니페스트 파일의 이미지 경로 목록. 상대 경로는 매니페스트 파일 위치 기준."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    paths = []
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as f:
+        if manifest_path.lower().endswith('.csv'):
+            rows = list(csv.reader(f))
+            if rows:
+                header = [cell.strip().lower() for cell in rows[0]]
+                column = header.index('path') if 'path' in header else 0
+                start = 1 if 'path' in header else 0
+                paths = [row[column] for row in rows[start:] if len(row) > column and row[column].strip()]
+        elif manifest_path.lower().endswith(('.jsonl', '.ndjson')):
+            paths = [json.loads(line)['path'] for line in f if line.strip()]
         else:
-            print("[calculate_au.py] 얼굴 랜드마크 감지되지 않음.")
-            au_value = 0.0 # 얼굴이 감지되지 않으면 AU 값 0
+            paths = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    return [path if os.path.isabs(path) else os.path.join(base_dir, path) for path in paths]
 
-    print(f"[calculate_au.py] AU 계산 완료: {au_value}")
-    return au_value
 
-if __name__ == "__main__":
-    # (이 부분은 이전 calculate_au.py 코드와 동일)
-    if len(sys.argv) != 3:
-        print("사용법: python calculate_au.py <입력_이미지_경로> <출력_JSON_경로>")
-        sys.exit(1)
-    
-    input_image_path = sys.argv[1]
-    output_file_path = sys.argv[2]
-
-    calculated_au = calculate_au_from_data(input_image_path)
-    
-    if calculated_au is not None:
+def collect_images(inputs, manifests=()):
+    """폴더 / glob / 이미지 파일 / 매니페스트 -> 중복 없는 절대 경로 목록 (입력 순서 유지)."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(IMAGE_EXTENSIONS))
+        elif glob.has_magic(item):
+            paths.extend(path for path in sorted(glob.glob(item, recursive=True)) if os.path.isfile(path))
+        else:
+            paths.append(item) # 없는 파일은 read_failed 로 기록됨
+    for manifest_path in manifests:
+        paths.extend(read_manifest(manifest_path))
+
+    unique = {}
+    for path in paths:
+        unique.setdefault(os.path.abspath(path), None)
+    return list(unique)
+
+
+# --- 워커 프로세스 ---
+_worker = None
+
+
+def _init_worker(feature_cols, model_path, max_side):
+    """워커마다 FaceMesh / AU 추출기 / 점수 모델을 한 번만 준비합니다 (app.py 와 같은 설정)."""
+    global _worker
+    from face_mesh_pool import FaceMeshPool
+    from face_pipeline import create_static_face_mesh
+    from tree_scorer import TreeEnsembleScorer
+
+    _worker = {
+        'face_mesh_pool': FaceMeshPool(create_static_face_mesh, size=1),
+        'au_extractor': AUFeatureExtractor(feature_cols),
+        'model': TreeEnsembleScorer.load(model_path),
+        'max_side': max_side,
+    }
+
+
+def score_images(paths):
+    """이미지 경로 묶음 -> [(path, sha256, status, score, au_row 또는 None)]. status: ok / no_face / decode_failed / read_failed / error"""
+    from face_pipeline import analyze_image
+
+    results = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            results.append((path, None, 'read_failed', 0.0, None))
+            continue
+        digest = hashlib.sha256(data).hexdigest()
         try:
-            with open(output_file_path, 'w') as f:
-                json.dump({"au_value": calculated_au}, f)
-            print(f"[calculate_au.py] AU 값 '{calculated_au}'가 '{output_file_path}'에 저장되었습니다.")
+            au_row, score, status = analyze_image(data, _worker['face_mesh_pool'], _worker['au_extractor'],
+                                                  _worker['model'], _worker['max_side'])
         except Exception as e:
-            print(f"[calculate_au.py] 결과 JSON 저장 중 오류 발생: {e}")
-            sys.exit(1)
-    else:
-        print("[calculate_au.py] AU 값을 계산하지 못했습니다. 결과 파일을 생성하지 않습니다.")
-        sys.exit(1)
+            print(f"[calculate_au] 분석 오류 ({path}): {e}", file=sys.stderr)
+            au_row, score, status = None, 0.0, 'error'
+        results.append((path, digest, status, float(score), au_row))
+    return results
+
+
+# --- 출력 ---
+class JsonlWriter:
+    """한 줄에 결과 하나. 특징 값은 feature_cols 이름을 키로 저장 (얼굴이 없으면 null)."""
+
+    def __init__(self, path, feature_cols):
+        self.path = path
+        self.feature_cols = feature_cols
+        self._file = None
+
+    def existing(self):
+        """이미 기록된 (path, model_hash) 목록. 중간에 끊긴 마지막 줄은 잘라 냅니다."""
+        if not os.path.exists(self.path):
+            return []
+        _truncate_partial_line(self.path)
+        done = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    done.append((record['path'], record.get('model_hash')))
+        return done
+
+    def write(self, records):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        for path, digest, status, score, au_row, model_hash in records:
+            record = {'path': path, 'sha256': digest, 'status': status, 'score': round(score, 6), 'model_hash': model_hash}
+            values = [None] * len(self.feature_cols) if au_row is None else [round(float(v), 6) for v in au_row]
+            record.update(zip(self.feature_cols, values))
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class CsvWriter:
+    """META_COLUMNS + feature_cols 열. 얼굴이 없으면 특징 열은 빈 칸."""
+
+    def __init__(self, path, feature_cols):
+        self.path = path
+        self.feature_cols = feature_cols
+        self._file = None
+        self._writer = None
+
+    def existing(self):
+        if not os.path.exists(self.path):
+            return []
+        _truncate_partial_line(self.path)
+        with open(self.path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames and reader.fieldnames != META_COLUMNS + self.feature_cols:
+                raise SystemExit(f"{self.path} 의 열 구성이 현재 feature_cols 와 다릅니다. 새 출력 파일을 지정하세요.")
+            return [(row['path'], row['model_hash']) for row in reader]
+
+    def write(self, records):
+        if self._file is None:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self._file = open(self.path, 'a', encoding='utf-8', newline='')
+            self._writer = csv.writer(self._file)
+            if new_file:
+                self._writer.writerow(META_COLUMNS + self.feature_cols)
+        for path, digest, status, score, au_row, model_hash in records:
+            values = [''] * len(self.feature_cols) if au_row is None else [f"{float(v):.6g}" for v in au_row]
+            self._writer.writerow([path, digest or '', status, f"{score:.6g}", model_hash] + values)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
 
-    sys.exit(0)
\ No newline at end of file
+class ColumnarWriter:
+    """
+    출력 폴더에 결과를 열 단위 배열 묶음(part-00000.npz, part-00001.npz, ...)으로 저장합니다.
+    각 파트: path / sha256 / status / model_hash (문자열 배열), score (float32), features (n x 특징 수 float32, 얼굴 없음은 NaN),
+    feature_cols. 파트는 임시 파일에 쓴 뒤 이름을 바꾸므로 중간에 끊겨도 완성된 파트만 남습니다.
+    """
+
+    def __init__(self, path, feature_cols):
+        self.path = path
+        self.feature_cols = feature_cols
+
+    def _parts(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path) if name.startswith('part-') and name.endswith('.npz'))
+
+    def existing(self):
+        done = []
+        for name in self._parts():
+            with np.load(os.path.join(self.path, name), allow_pickle=False) as part:
+                if list(part['feature_cols']) != self.feature_cols:
+                    raise SystemExit(f"{self.path} 의 특징 열 구성이 현재 feature_cols 와 다릅니다. 새 출력 폴더를 지정하세요.")
+                done.extend(zip(part['path'].tolist(), part['model_hash'].tolist()))
+        return done
+
+    def write(self, records):
+        if not records:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        parts = self._parts()
+        index = int(parts[-1][5:10]) + 1 if parts else 0
+        features = np.full((len(records), len(self.feature_cols)), np.nan, dtype=np.float32)
+        for i, record in enumerate(records):
+            if record[4] is not None:
+                features[i] = record[4]
+        final_path = os.path.join(self.path, f"part-{index:05d}.npz")
+        tmp_path = final_path + '.tmp.npz'
+        np.savez(
+            tmp_path,
+            path=np.array([record[0] for record in records]),
+            sha256=np.array([record[1] or '' for record in records]),
+            status=np.array([record[2] for record in records]),
+            score=np.array([record[3] for record in records], dtype=np.float32),
+            model_hash=np.array([record[5] for record in records]),
+            features=features,
+            feature_cols=np.array(self.feature_cols),
+        )
+        os.replace(tmp_path, final_path)
+
+    def close(self):
+        pass
+
+
+def load_columnar(path):
+    """ColumnarWriter 출력 폴더의 모든 파트를 이어 붙인 {열 이름: 배열} dict."""
+    names = sorted(name for name in os.listdir(path) if name.startswith('part-') and name.endswith('.npz'))
+    columns = {}
+    feature_cols = None
+    for name in names:
+        with np.load(os.path.join(path, name), allow_pickle=False) as part:
+            feature_cols = part['feature_cols'].tolist()
+            for key in ('path', 'sha256', 'status', 'model_hash', 'score', 'features'):
+                columns.setdefault(key, []).append(part[key])
+    result = {key: np.concatenate(values) for key, values in columns.items()}
+    result['feature_cols'] = feature_cols or []
+    return result
+
+
+def _truncate_partial_line(path):
+    """강제 종료로 마지막 줄이 반쯤 쓰였으면 마지막 줄바꿈 뒤를 잘라 냅니다 (이어 쓸 때 줄이 붙지 않도록)."""
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            position -= step
+            f.seek(position)
+            newline = f.read(step).rfind(b'\n')
+            if newline >= 0:
+                f.truncate(position + newline + 1)
+                return
+        f.truncate(0)
+
+
+WRITERS = {'jsonl': JsonlWriter, 'csv': CsvWriter, 'columnar': ColumnarWriter}
+
+
+def infer_format(output_path):
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if extension == '.csv':
+        return 'csv'
+    return 'columnar'
+
+
+# --- 실행 ---
+def run_batch(paths, writer, model_hash, feature_cols, workers=None, chunk_size=16, max_side=0, flush_every=256):
+    """paths 를 채점해 writer 에 이어 씁니다. 상태별 개수 dict 를 반환합니다."""
+    counts = {}
+    pending_records = []
+    done = 0
+    total = len(paths)
+    started = time.perf_counter()
+    last_report = started
+
+    def consume(results):
+        nonlocal done, last_report
+        for path, digest, status, score, au_row in results:
+            pending_records.append((path, digest, status, score, au_row, model_hash))
+            counts[status] = counts.get(status, 0) + 1
+        done += len(results)
+        if len(pending_records) >= flush_every:
+            writer.write(pending_records)
+            pending_records.clear()
+        now = time.perf_counter()
+        if now - last_report >= 5.0 or done == total:
+            rate = done / (now - started) if now > started else 0.0
+            eta = (total - done) / rate if rate else 0.0
+            print(f"[calculate_au] {done}/{total} ({rate:.1f}장/초, 남은 시간 약 {eta:.0f}초)")
+            last_report = now
+
+    chunks = [paths[i:i + chunk_size] for i in range(0, total, chunk_size)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(chunks) or 1))
+    try:
+        if workers == 1:
+            _init_worker(feature_cols, MODEL_PATH, max_side)
+            for chunk in chunks:
+                consume(score_images(chunk))
+        else:
+            # 제출은 워커 수의 몇 배까지만 (수십만 장이어도 결과/작업 객체가 한꺼번에 메모리에 쌓이지 않도록)
+            window = workers * 4
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(feature_cols, MODEL_PATH, max_side)) as executor:
+                remaining = iter(chunks)
+                in_flight = set()
+                for chunk in remaining:
+                    in_flight.add(executor.submit(score_images, chunk))
+                    if len(in_flight) >= window:
+                        break
+                while in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        consume(future.result())
+                        next_chunk = next(remaining, None)
+                        if next_chunk is not None:
+                            in_flight.add(executor.submit(score_images, next_chunk))
+    finally:
+        # 중단(Ctrl+C)되더라도 끝난 결과는 저장해 --resume 으로 이어서 할 수 있게 함
+        writer.write(pending_records)
+        writer.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="이미지 일괄 AU 특징 추출 및 점수 계산 (서버와 같은 파이프라인)")
+    parser.add_argument('inputs', nargs='*', help="이미지 폴더 / glob 패턴 / 이미지 파일")
+    parser.add_argument('--manifest', action='append', default=[], help="이미지 경로 목록 파일 (.txt / .csv / .jsonl, 여러 번 지정 가능)")
+    parser.add_argument('-o', '--output', required=True, help="출력 파일(.jsonl / .csv) 또는 columnar 출력 폴더")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None, help="출력 형식 (기본: 출력 경로의 확장자로 판단)")
+    parser.add_argument('--resume', action='store_true', help="출력에 이미 있는 이미지(같은 모델 해시)는 건너뛰고 이어 쓰기")
+    parser.add_argument('--overwrite', action='store_true', help="기존 출력을 지우고 처음부터")
+    parser.add_argument('--workers', type=int, default=None, help="워커 프로세스 수 (기본: CPU 코어 수)")
+    parser.add_argument('--chunk-size', type=int, default=16, help="워커에 한 번에 넘길 이미지 수")
+    parser.add_argument('--max-side', type=int, default=int(os.environ.get('SMILEFIT_MAX_DECODE_SIDE', '0')),
+                        help="디코딩 최대 긴 변 (서버의 SMILEFIT_MAX_DECODE_SIDE 와 같게 두면 같은 결과)")
+    args = parser.parse_args()
+    if not args.inputs and not args.manifest:
+        parser.error("이미지 폴더 / glob / 파일 또는 --manifest 를 하나 이상 지정하세요.")
+
+    output_format = args.format or infer_format(args.output)
+    with open(FEATURE_COLS_PATH, 'r', encoding='utf-8') as f:
+        feature_cols = json.load(f)
+    model_hash = model_fingerprint(MODEL_PATH, feature_cols)
+    writer = WRITERS[output_format](args.output, feature_cols)
+
+    exists = os.path.exists(args.output)
+    if exists and args.overwrite:
+        if os.path.isdir(args.output):
+            for name in os.listdir(args.output):
+                if name.startswith('part-') and name.endswith('.npz'):
+                    os.remove(os.path.join(args.output, name))
+        else:
+            os.remove(args.output)
+    elif exists and not args.resume and writer.existing():
+        parser.error(f"{args.output} 에 이미 결과가 있습니다. --resume 으로 이어 쓰거나 --overwrite 로 다시 시작하세요.")
+
+    paths = collect_images(args.inputs, args.manifest)
+    skipped = 0
+    if args.resume:
+        existing = writer.existing()
+        done = {path for path, record_hash in existing if record_hash == model_hash}
+        other_models = sum(1 for _, record_hash in existing if record_hash != model_hash)
+        if other_models:
+            print(f"[calculate_au] 다른 모델로 채점된 기록 {other_models}개는 그대로 두고 현재 모델로 다시 채점합니다.")
+        before = len(paths)
+        paths = [path for path in paths if path not in done]
+        skipped = before - len(paths)
+
+    print(f"[calculate_au] 이미지 {len(paths)}장 채점 (이미 완료 {skipped}장 건너뜀), 출력: {args.output} ({output_format}), 모델 {model_hash[:12]}")
+    if not paths:
+        return
+    started = time.perf_counter()
+    counts = run_batch(paths, writer, model_hash, feature_cols, args.workers, max(1, args.chunk_size), args.max_side)
+    elapsed = time.perf_counter() - started
+    print(f"[calculate_au] 완료: {sum(counts.values())}장 / {elapsed:.1f}초 ({sum(counts.values()) / elapsed:.1f}장/초), 상태별 {counts}")
+
+
+if __name__ == "__main__":
+    main()
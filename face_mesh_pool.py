@@ -0,0 +1,122 @@
+# face_mesh_pool.py
+# 요청 스레드마다 FaceMesh 인스턴스를 빌려 쓰는 checkout/return 풀
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+# 인스턴스 생성이 실패했을 때 대기 중인 스레드를 깨우는 표시 (받은 스레드는 생성을 다시 시도)
+_RETRY = object()
+
+
+class FaceMeshPool:
+    """
+    FaceMesh 그래프 하나를 여러 스레드가 동시에 쓰지 않도록, 인스턴스를 빌려주고 돌려받는 풀입니다.
+
+    - 인스턴스는 필요할 때 최대 size 개까지 만들어집니다 (기본: CPU 코어 수).
+    - 모든 인스턴스가 사용 중이면 반납될 때까지 기다리며, 대기 시간은 stats() 로 확인합니다.
+    """
+
+    def __init__(self, factory, size=None):
+        self.size = max(1, size or os.cpu_count() or 1)
+        self._factory = factory
+        self._idle = queue.LifoQueue() # 최근에 쓴 인스턴스를 먼저 재사용
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waited = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def checkout(self, timeout=None):
+        """인스턴스를 하나 빌립니다. timeout 안에 얻지 못하면 TimeoutError."""
+        start = time.perf_counter()
+        instance = self._take(timeout)
+        wait = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        return instance
+
+    def checkin(self, instance):
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(instance)
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        instance = self.checkout(timeout)
+        try:
+            yield instance
+        finally:
+            self.checkin(instance)
+
+    def _take(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        while True:
+            try:
+                instance = self._idle.get_nowait()
+                if instance is not _RETRY:
+                    return instance
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+                elif not waited:
+                    self._waited += 1
+                    waited = True
+            if create:
+                try:
+                    return self._factory()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    # 이 인스턴스가 만들어지길 기다리던 스레드가 있으면 깨워서 직접 다시 만들어 보게 함
+                    self._idle.put(_RETRY)
+                    raise
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                instance = self._idle.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError(f"FaceMesh 인스턴스를 {timeout}초 안에 얻지 못했습니다.") from None
+            if instance is not _RETRY:
+                return instance
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'checkouts': self._checkouts,
+                'waited': self._waited,
+                'wait_total_ms': round(self._wait_total * 1000.0, 2),
+                'wait_avg_ms': round(self._wait_total * 1000.0 / self._checkouts, 3) if self._checkouts else 0.0,
+                'wait_max_ms': round(self._wait_max * 1000.0, 2),
+            }
+
+    def close(self):
+        """대기 중인(반납된) 인스턴스를 모두 닫습니다."""
+        while True:
+            try:
+                instance = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if instance is _RETRY:
+                continue
+            with self._lock:
+                self._created -= 1
+            close = getattr(instance, 'close', None)
+            if close is not None:
+                close()
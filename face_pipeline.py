@@ -0,0 +1,177 @@
+# face_pipeline.py
+# 업로드된 이미지를 메모리에서 바로 디코딩하고, 요청 단계별 소요 시간을 측정하는 공용 헬퍼 모음
+import struct
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+# JPEG SOF 마커 (DHT=C4, JPG=C8, DAC=CC 는 제외)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# cv2 가 DCT 단계에서 바로 축소 디코딩할 수 있는 배율 (큰 배율부터 시도)
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def read_image_size(data):
+    """PNG/JPEG 헤더만 읽어 (width, height)를 반환합니다. 알 수 없는 형식이면 None."""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return width, height
+    if data[:2] == b'\xff\xd8':
+        pos = 2
+        length = len(data)
+        while pos + 4 <= length:
+            if data[pos] != 0xFF:
+                pos += 1
+                continue
+            marker = data[pos + 1]
+            if marker == 0xFF: # 패딩 바이트
+                pos += 1
+                continue
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7: # 길이 필드가 없는 마커
+                pos += 2
+                continue
+            segment_length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+            if marker in _JPEG_SOF_MARKERS and pos + 9 <= length:
+                height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+                return width, height
+            pos += 2 + segment_length
+    return None
+
+
+def decode_image_bytes(data, max_side=0):
+    """
+    업로드 바이트를 임시 파일 없이 BGR 이미지로 디코딩합니다.
+
+    max_side 가 0보다 크면 긴 변이 max_side 에 가깝도록 축소 디코딩(JPEG는 DCT 단계 축소)한 뒤
+    남은 차이만 cv2.resize 로 줄입니다. 반환되는 original_size 는 원본 해상도 (width, height)로,
+    랜드마크를 원본 픽셀 좌표로 환산해 AU 거리값이 해상도와 무관하게 유지되도록 하는 데 사용합니다.
+    """
+    if not data:
+        return None, None
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    original_size = read_image_size(data)
+
+    flag = cv2.IMREAD_COLOR
+    if max_side and original_size:
+        longest = max(original_size)
+        for factor, reduced_flag in _REDUCED_DECODE_FLAGS:
+            if longest // factor >= max_side:
+                flag = reduced_flag
+                break
+
+    img = cv2.imdecode(buffer, flag)
+    if img is None:
+        return None, original_size
+
+    height, width = img.shape[:2]
+    if original_size is None:
+        original_size = (width, height)
+    elif (original_size[0] > original_size[1]) != (width > height) and original_size[0] != original_size[1]:
+        # EXIF 회전이 적용된 경우 가로/세로가 바뀌어 있음
+        original_size = (original_size[1], original_size[0])
+
+    if max_side and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    return img, original_size
+
+
+def create_static_face_mesh():
+    """정지 이미지용 FaceMesh (업로드 사진/선생님 이미지 분석에 사용하는 설정)."""
+    import mediapipe as mp
+    return mp.solutions.face_mesh.FaceMesh(
+        static_image_mode=True,
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5
+    )
+
+
+def create_tracking_face_mesh():
+    """연속 프레임용 FaceMesh (이전 프레임의 얼굴 위치를 추적해 매 프레임 검출을 건너뜀). 한 스레드에서만 사용해야 합니다."""
+    import mediapipe as mp
+    return mp.solutions.face_mesh.FaceMesh(
+        static_image_mode=False,
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5
+    )
+
+
+def analyze_frame(frame, face_mesh, au_extractor, model, timer=None):
+    """
+    이미 디코딩된 BGR 프레임 -> FaceMesh -> AU 특징 행 -> 점수. face_mesh 는 호출자가 직접 소유한 인스턴스.
+
+    반환값: (au_row, score, status). status 는 'ok' / 'no_face'.
+    """
+    timer = timer or StageTimer()
+    height, width = frame.shape[:2]
+    with timer.stage('landmark'):
+        results = face_mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    if not results.multi_face_landmarks:
+        return None, 0.0, 'no_face'
+    with timer.stage('au'):
+        au_row = au_extractor.compute_from_face_landmarks(results.multi_face_landmarks[0], (width, height))
+    with timer.stage('predict'):
+        score = float(model.predict(au_row[np.newaxis])[0]) if model is not None and au_extractor.feature_cols else 0.0
+    return au_row, score, 'ok'
+
+
+def analyze_image(data, face_mesh_pool, au_extractor, model, max_side=0, timer=None):
+    """
+    이미지 바이트 -> 디코딩 -> FaceMesh -> AU 특징 행 -> 점수.
+
+    반환값: (au_row, score, status). status 는 'ok' / 'decode_failed' / 'no_face' 이며,
+    얼굴을 찾지 못하면 au_row 는 None, score 는 0.0 입니다.
+    """
+    timer = timer or StageTimer()
+    with timer.stage('decode'):
+        img, original_size = decode_image_bytes(data, max_side)
+    if img is None:
+        return None, 0.0, 'decode_failed'
+
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    with timer.stage('landmark_wait'):
+        face_mesh = face_mesh_pool.checkout()
+    try:
+        with timer.stage('landmark'):
+            results = face_mesh.process(img_rgb)
+    finally:
+        face_mesh_pool.checkin(face_mesh)
+    if not results.multi_face_landmarks:
+        return None, 0.0, 'no_face'
+
+    with timer.stage('au'):
+        # 축소 디코딩 여부와 관계없이 원본 해상도 기준 픽셀 좌표로 환산
+        au_row = au_extractor.compute_from_face_landmarks(results.multi_face_landmarks[0], original_size)
+    with timer.stage('predict'):
+        score = float(model.predict(au_row[np.newaxis])[0]) if model is not None and au_extractor.feature_cols else 0.0
+    return au_row, score, 'ok'
+
+
+class StageTimer:
+    """요청 처리 단계별 소요 시간(ms)을 기록합니다."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - start) * 1000.0
+
+    def as_dict(self):
+        return {name: round(ms, 2) for name, ms in self.timings.items()}
+
+    def summary(self):
+        return ", ".join(f"{name}={ms:.1f}ms" for name, ms in self.timings.items())
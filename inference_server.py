@@ -0,0 +1,160 @@
+# inference_server.py
+# 디코딩 -> FaceMesh -> AU 계산 -> 모델 예측을 워커 프로세스 풀에서 실행하는 추론 백엔드
+import json
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from au_features import AUFeatureExtractor
+from face_mesh_pool import FaceMeshPool
+from face_pipeline import analyze_image, create_static_face_mesh, StageTimer
+from tree_scorer import TreeEnsembleScorer
+
+
+class InferenceQueueFull(Exception):
+    """대기 중인 추론 요청이 max_queue 에 도달했을 때 발생합니다."""
+
+
+class InferenceTimeout(Exception):
+    """추론 결과를 timeout 안에 받지 못했을 때 발생합니다."""
+
+
+# --- 워커 프로세스 측 ---
+_worker = None
+
+
+def _init_worker(model_path, feature_cols_path, max_side):
+    """워커 시작 시 모델과 FaceMesh 를 한 번만 로드합니다."""
+    global _worker
+    with open(feature_cols_path, 'r', encoding='utf-8') as f:
+        feature_cols = json.load(f)
+    model = TreeEnsembleScorer.load(model_path)
+    face_mesh_pool = FaceMeshPool(create_static_face_mesh, size=1)
+    face_mesh_pool.checkin(face_mesh_pool.checkout()) # FaceMesh 그래프를 미리 생성
+    _worker = {
+        'face_mesh_pool': face_mesh_pool,
+        'au_extractor': AUFeatureExtractor(feature_cols),
+        'model': model,
+        'max_side': max_side,
+    }
+
+
+def _ping():
+    return _worker is not None
+
+
+def _analyze_shared(shm_name, size):
+    """공유 메모리에 올라온 이미지 바이트를 분석합니다. 결과는 작은 파이썬 값만 돌려줍니다."""
+    timer = StageTimer()
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=shm_name, track=False)
+    else:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        # 해제(unlink)는 웹 프로세스 담당이므로 워커 쪽 resource_tracker 등록은 취소
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    try:
+        view = shm.buf[:size]
+        try:
+            au_row, score, status = analyze_image(
+                view, _worker['face_mesh_pool'], _worker['au_extractor'], _worker['model'], _worker['max_side'], timer
+            )
+        finally:
+            view.release()
+    finally:
+        shm.close()
+    return (None if au_row is None else au_row.tolist()), score, status, timer.timings
+
+
+# --- 웹 프로세스 측 ---
+class InferenceServer:
+    """
+    얼굴 분석 파이프라인을 별도 프로세스에서 실행합니다. 웹 프로세스는 이미지 바이트를 공유 메모리에
+    복사해 이름만 넘기고 결과(특징 행, 점수)만 받으므로 GIL/코어를 요청 처리와 나누어 쓰지 않습니다.
+
+    - workers: 워커 프로세스 수
+    - max_queue: 동시에 처리/대기할 수 있는 최대 요청 수 (초과 시 InferenceQueueFull)
+    - timeout: 요청당 결과 대기 시간(초) (초과 시 InferenceTimeout)
+    - start_method: 워커 시작 방식 (기본 'forkserver', 없으면 'spawn').
+      'fork' 는 웹 프로세스의 스레드(업로드/워밍업 등)와 잠금 상태, MediaPipe 그래프까지 복제하므로 기본값으로 쓰지 않습니다.
+      forkserver 서버는 이 모듈만 미리 불러오므로 실행 스크립트(__main__) 는 워커에서 '__mp_main__' 으로 다시 import 됩니다.
+    """
+
+    def __init__(self, model_path, feature_cols_path, workers=2, max_queue=None, timeout=10.0, max_side=0, start_method=None):
+        self.workers = workers
+        self.max_queue = max_queue or workers * 4
+        self.timeout = timeout
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            # 기본 preload(__main__) 대신 워커 코드만: 서버 프로세스가 웹 앱을 import 해 스레드를 띄운 채 fork 하지 않도록
+            context.set_forkserver_preload([__name__])
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(model_path, feature_cols_path, max_side)
+        )
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0, 'in_flight': 0}
+
+    def start(self):
+        """워커 프로세스를 미리 띄우고 모델/FaceMesh 로드가 끝날 때까지 기다립니다."""
+        futures = [self._executor.submit(_ping) for _ in range(self.workers)]
+        return all(future.result() for future in futures)
+
+    def analyze(self, data):
+        """(au_row(np.float32) 또는 None, score, status, 워커 단계별 timings) 를 반환합니다."""
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise InferenceQueueFull(f"추론 대기열이 가득 찼습니다 (max_queue={self.max_queue}).")
+
+        shm = None
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+            shm.buf[:len(data)] = data
+            future = self._executor.submit(_analyze_shared, shm.name, len(data))
+        except Exception:
+            self._release(shm)
+            raise
+        self._count('submitted')
+        self._count('in_flight')
+        # 타임아웃이 나더라도 워커가 끝난 뒤에 공유 메모리 해제와 슬롯 반환이 이루어지도록 콜백에서 처리
+        future.add_done_callback(lambda _: self._release(shm, finished=True))
+
+        try:
+            au_row, score, status, timings = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._count('timeouts')
+            raise InferenceTimeout(f"추론 결과를 {self.timeout}초 안에 받지 못했습니다.") from None
+        except Exception:
+            self._count('errors')
+            raise
+        if au_row is not None:
+            au_row = np.asarray(au_row, dtype=np.float32)
+        return au_row, score, status, timings
+
+    def _release(self, shm, finished=False):
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        if finished:
+            self._count('in_flight', -1)
+        self._slots.release()
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self._stats[key] += delta
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, workers=self.workers, max_queue=self.max_queue)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
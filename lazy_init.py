@@ -0,0 +1,88 @@
+# lazy_init.py
+# 무거운 구성 요소(MediaPipe, 점수 모델, Firebase 등)를 처음 사용할 때 한 번만 초기화하는 헬퍼
+import threading
+import time
+
+
+class LazyComponent:
+    """
+    factory() 를 처음 get() 할 때 한 번만 실행하고 결과를 보관합니다 (여러 스레드가 동시에 불러도 한 번).
+
+    - 실패하면 오류를 기록하고 예외를 다시 던집니다. retry_interval 초가 지나기 전의 get() 은 factory 를 다시
+      실행하지 않고 같은 예외를 던집니다 (설정 오류로 매 요청마다 초기화를 반복하지 않도록).
+    - required=False 인 구성 요소는 준비되지 않아도 readiness 를 막지 않습니다.
+    """
+
+    def __init__(self, name, factory, required=True, retry_interval=30.0):
+        self.name = name
+        self.factory = factory
+        self.required = required
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._value = None
+        self._ready = False
+        self._error = None
+        self._failed_at = None
+        self._init_ms = None
+
+    def get(self):
+        if self._ready:
+            return self._value
+        with self._lock:
+            if self._ready:
+                return self._value
+            if self._error is not None and time.monotonic() - self._failed_at < self.retry_interval:
+                raise self._error
+            start = time.perf_counter()
+            try:
+                value = self.factory()
+            except Exception as e:
+                self._error = e
+                self._failed_at = time.monotonic()
+                raise
+            self._init_ms = (time.perf_counter() - start) * 1000.0
+            self._value = value
+            self._error = None
+            self._ready = True
+            return value
+
+    def peek(self):
+        """초기화하지 않고 현재 값을 반환합니다 (아직 준비되지 않았으면 None)."""
+        return self._value if self._ready else None
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def status(self):
+        return {
+            'ready': self._ready,
+            'required': self.required,
+            'init_ms': round(self._init_ms, 1) if self._init_ms is not None else None,
+            'error': None if self._error is None else f"{type(self._error).__name__}: {self._error}",
+        }
+
+
+class LazyProxy:
+    """getter() 가 돌려주는 객체로 속성 접근을 넘깁니다. 다른 모듈에 '아직 만들지 않은' 객체를 넘길 때 사용합니다."""
+
+    __slots__ = ('_getter',)
+
+    def __init__(self, getter):
+        self._getter = getter
+
+    def __getattr__(self, name):
+        return getattr(self._getter(), name)
+
+
+def warm_up(components, on_error=None):
+    """components 를 순서대로 초기화합니다. 실패해도 나머지를 계속 진행하고, 모두 준비됐으면 True."""
+    ok = True
+    for component in components:
+        try:
+            component.get()
+        except Exception as e:
+            ok = False
+            if on_error is not None:
+                on_error(component, e)
+    return ok
@@ -0,0 +1,164 @@
+# live_scoring.py
+# 서버가 이미 가진 웹캠 프레임을 추적 모드 FaceMesh 로 주기적으로 분석해 최신 AU/점수를 유지하고 구독자에게 알려주는 모듈
+import logging
+import threading
+import time
+
+from au_tracking import TrackedAUAnalyzer
+from face_pipeline import StageTimer
+
+logger = logging.getLogger(__name__)
+
+
+class LiveScorer:
+    """
+    FrameBroadcaster 의 원본 프레임을 rate_hz 간격으로 받아 (추적 모드 FaceMesh -> AU -> 점수) 분석합니다.
+
+    - 분석 스레드 하나가 FaceMesh 인스턴스 하나를 독점합니다 (추적 모드는 연속 프레임을 한 인스턴스로 처리해야 함).
+    - 프레임 건너뛰기/AU 거리 필터링은 TrackedAUAnalyzer 가 담당합니다 (tracker_options 로 설정).
+    - 구독자(SSE 연결)가 있거나 최근 idle_timeout 안에 latest() 요청이 있을 때만 돌고, 아니면 멈춰 카메라를 놓아 줍니다.
+    - 결과는 dict (seq, timestamp, status, overall_score, au_detail, timings_ms) 로 공개되고,
+      분석에 쓴 프레임/특징 행은 캡처(snapshot) 용으로 함께 보관합니다.
+    """
+
+    def __init__(self, broadcaster, face_mesh_factory, au_extractor, model, rate_hz=5.0, idle_timeout=5.0, wait_timeout=15.0,
+                 tracker_options=None):
+        self.broadcaster = broadcaster
+        self.face_mesh_factory = face_mesh_factory
+        self.au_extractor = au_extractor
+        self.model = model
+        self.rate_hz = rate_hz
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.tracker_options = dict(tracker_options or {})
+        self._face_mesh = None
+        self._tracker = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._stop = False
+        self._listeners = 0
+        self._last_access = 0.0
+        self._version = 0
+        self._latest = None # (result dict, BGR frame, au_row)
+        self._stats = {'analyzed': 0, 'inferences': 0, 'no_face': 0, 'errors': 0, 'analysis_ms_total': 0.0, 'starts': 0}
+
+    def _ensure_running(self):
+        with self._cond:
+            self._last_access = time.monotonic()
+            if self._running:
+                return
+            self._running = True
+            self._stop = False
+            self._stats['starts'] += 1
+            self._thread = threading.Thread(target=self._loop, name='live-scorer', daemon=True)
+            self._thread.start()
+
+    def _should_stop(self):
+        with self._cond:
+            if self._stop:
+                return True
+            return self._listeners == 0 and time.monotonic() - self._last_access > self.idle_timeout
+
+    def _loop(self):
+        frames = self.broadcaster.raw_frames(max_fps=self.rate_hz)
+        try:
+            if self._face_mesh is None:
+                self._face_mesh = self.face_mesh_factory()
+            # 멈췄다 다시 시작하면 이전 랜드마크/필터 상태는 버림
+            self._tracker = TrackedAUAnalyzer(self._face_mesh, self.au_extractor, self.model, **self.tracker_options)
+            for seq, frame in frames:
+                if self._should_stop():
+                    break
+                self._analyze(seq, frame)
+        except Exception as e:
+            logger.error("[Live Scoring] 분석 스레드 오류: %s", e)
+            with self._cond:
+                self._stats['errors'] += 1
+        finally:
+            frames.close()
+            with self._cond:
+                self._running = False
+                self._thread = None
+                self._cond.notify_all()
+
+    def _analyze(self, seq, frame):
+        timer = StageTimer()
+        start = time.perf_counter()
+        au_row, score, status, inferred = self._tracker.process(frame, timer=timer)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        result = {
+            'seq': seq,
+            'timestamp': time.time(),
+            'status': status,
+            'inferred': inferred,
+            'overall_score': float(f"{score:.4f}"),
+            'au_detail': self.au_extractor.detail_values(au_row) if au_row is not None else None,
+            'timings_ms': timer.as_dict(),
+        }
+        with self._cond:
+            self._stats['analyzed'] += 1
+            self._stats['analysis_ms_total'] += elapsed_ms
+            self._stats['inferences'] += int(inferred)
+            if status == 'no_face':
+                self._stats['no_face'] += 1
+            self._latest = (result, frame, au_row)
+            self._version += 1
+            self._cond.notify_all()
+
+    def results(self):
+        """
+        새 분석 결과가 나올 때마다 결과 dict 를 내보내는 제너레이터 (SSE 용).
+        wait_timeout 동안 새 결과가 없으면 None 을 내보내 연결 유지(keep-alive)에 쓸 수 있게 합니다.
+        """
+        with self._cond:
+            self._listeners += 1
+        self._ensure_running()
+        last_version = 0
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._version > last_version, timeout=self.wait_timeout)
+                    if self._version <= last_version:
+                        result = None
+                    else:
+                        last_version = self._version
+                        result = self._latest[0]
+                if result is None and not self._running:
+                    self._ensure_running() # 카메라 오류 등으로 멈췄으면 다시 시도
+                yield result
+        finally:
+            with self._cond:
+                self._listeners -= 1
+
+    def latest(self, max_age=None, wait=0.0):
+        """
+        (result, frame, au_row) 또는 None. max_age(초)보다 오래된 결과는 None.
+        분석이 멈춰 있으면 다시 시작하고 최대 wait 초 동안 첫 결과를 기다립니다.
+        """
+        self._ensure_running()
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                latest = self._latest
+                if latest is not None and (max_age is None or time.time() - latest[0]['timestamp'] <= max_age):
+                    return latest
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats, listeners=self._listeners, running=self._running, rate_hz=self.rate_hz)
+        stats['analysis_ms_avg'] = round(stats['analysis_ms_total'] / stats['analyzed'], 2) if stats['analyzed'] else 0.0
+        stats['analysis_ms_total'] = round(stats['analysis_ms_total'], 2)
+        return stats
+
+    def stop(self, timeout=2.0):
+        with self._cond:
+            self._stop = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
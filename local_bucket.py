@@ -0,0 +1,70 @@
+# local_bucket.py
+# 네트워크 없이 Storage 관련 코드를 실행/테스트하기 위한 메모리 기반 가짜 버킷
+import threading
+import time
+
+
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket._wait()
+        self.bucket._maybe_fail()
+        with self.bucket._lock:
+            self.bucket.objects[self.name] = bytes(data)
+
+    def upload_from_filename(self, filename, content_type=None):
+        with open(filename, 'rb') as f:
+            self.upload_from_string(f.read(), content_type=content_type)
+
+    def make_public(self):
+        with self.bucket._lock:
+            self.bucket.public.add(self.name)
+
+    def exists(self):
+        self.bucket._wait()
+        with self.bucket._lock:
+            return self.name in self.bucket.objects
+
+    def delete(self):
+        self.bucket._wait()
+        with self.bucket._lock:
+            if self.name not in self.bucket.objects:
+                raise FileNotFoundError(self.name)
+            del self.bucket.objects[self.name]
+            self.bucket.public.discard(self.name)
+
+
+class LocalBucket:
+    """
+    firebase_admin.storage.bucket() 과 같은 인터페이스(blob, name)를 흉내 냅니다.
+    fail_uploads 만큼 업로드를 실패시켜 재시도 로직을 확인할 수 있습니다.
+    latency 를 주면 업로드/exists/delete 마다 그만큼(초) 대기해 네트워크 왕복을 흉내 냅니다.
+    """
+
+    def __init__(self, name='local-bucket', fail_uploads=0, latency=0.0):
+        self.name = name
+        self.latency = latency
+        self.objects = {}
+        self.public = set()
+        self.fail_uploads = fail_uploads
+        self._lock = threading.Lock()
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _maybe_fail(self):
+        with self._lock:
+            if self.fail_uploads > 0:
+                self.fail_uploads -= 1
+                raise ConnectionError("LocalBucket: simulated upload failure")
@@ -0,0 +1,122 @@
+# local_firestore.py
+# 네트워크 없이 Firestore 쓰기 코드를 실행/테스트하기 위한 최소한의 가짜 Firestore 클라이언트
+import json
+import os
+import threading
+import uuid
+
+# firestore.WriteBatch 의 최대 쓰기 개수
+MAX_BATCH_WRITES = 500
+
+
+class LocalDocumentSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return None if self._data is None else dict(self._data)
+
+
+class LocalDocumentReference:
+    def __init__(self, client, collection_name, doc_id):
+        self._client = client
+        self.id = doc_id
+        self.path = f"{collection_name}/{doc_id}"
+        self._collection_name = collection_name
+
+    def get(self):
+        with self._client._lock:
+            data = self._client.data.get(self._collection_name, {}).get(self.id)
+        return LocalDocumentSnapshot(self.id, data)
+
+    def set(self, data, merge=False):
+        self._client._write(self._collection_name, self.id, data, merge)
+
+
+class LocalCollectionReference:
+    def __init__(self, client, name):
+        self._client = client
+        self.id = name
+
+    def document(self, doc_id):
+        return LocalDocumentReference(self._client, self.id, doc_id)
+
+    def add(self, data):
+        reference = self.document(uuid.uuid4().hex)
+        reference.set(data)
+        return None, reference
+
+    def stream(self):
+        with self._client._lock:
+            documents = dict(self._client.data.get(self.id, {}))
+        for doc_id, data in documents.items():
+            yield LocalDocumentSnapshot(doc_id, data)
+
+
+class LocalWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, data, merge=False):
+        if len(self._writes) >= MAX_BATCH_WRITES:
+            raise ValueError(f"WriteBatch 는 최대 {MAX_BATCH_WRITES}개까지 쓸 수 있습니다.")
+        self._writes.append((reference, data, merge))
+
+    def commit(self):
+        with self._client._lock:
+            for reference, data, merge in self._writes:
+                self._client._write_locked(reference._collection_name, reference.id, data, merge)
+            self._client.commits.append(len(self._writes))
+        self._client._save()
+        self._writes = []
+
+
+class LocalFirestore:
+    """
+    firestore.client() 의 일부(collection/document/get/set/add, batch, get_all)를 흉내 냅니다.
+    path 를 주면 JSON 파일에 내용을 저장해 여러 번 실행해도 상태가 유지됩니다 (직렬화 가능한 값만 저장).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.data = {}
+        self.commits = [] # 커밋된 배치별 쓰기 개수
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+
+    def collection(self, name):
+        return LocalCollectionReference(self, name)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def get_all(self, references):
+        for reference in references:
+            yield reference.get()
+
+    def _write(self, collection_name, doc_id, data, merge):
+        with self._lock:
+            self._write_locked(collection_name, doc_id, data, merge)
+        self._save()
+
+    def _write_locked(self, collection_name, doc_id, data, merge):
+        documents = self.data.setdefault(collection_name, {})
+        if merge and doc_id in documents:
+            documents[doc_id] = dict(documents[doc_id], **data)
+        else:
+            documents[doc_id] = dict(data)
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=1, default=str)
@@ -0,0 +1,31 @@
+# log_config.py
+# 레벨별 로깅 설정. 요청 스레드는 메모리 큐에 기록만 넣고, 실제 출력(stderr 쓰기)은 리스너 스레드 하나가 담당합니다.
+import logging
+import logging.handlers
+import queue
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+
+def setup_logging(name='smilefit', level='INFO', handler=None, module_names=()):
+    """
+    name 로거에 QueueHandler 를 달고, 큐를 비우는 QueueListener 를 시작해 (logger, listener) 를 반환합니다.
+    level 보다 낮은 레벨의 호출은 메시지 포맷팅 없이 바로 버려지므로, 핫 패스에서는 logger.debug("... %s", value) 처럼
+    % 인자를 넘겨 쓰면 됩니다. 종료 시 listener.stop() 으로 남은 기록을 모두 출력합니다.
+    module_names: logging.getLogger(__name__) 을 쓰는 모듈들. 같은 레벨로 같은 큐에 기록합니다.
+    """
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    for logger_name in (*module_names, name):
+        logger = logging.getLogger(logger_name)
+        logger.setLevel(level.upper() if isinstance(level, str) else level)
+        logger.propagate = False
+        for existing in list(logger.handlers):
+            logger.removeHandler(existing)
+        logger.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return logger, listener
@@ -0,0 +1,166 @@
+# metrics.py
+# 서버 내부 지표 (히스토그램, 카운터, 게이지) 공용 구현과 Prometheus 텍스트 형식 출력
+import bisect
+import threading
+
+
+class Histogram:
+    """고정 버킷 누적 히스토그램 (Prometheus 의 histogram 과 같은 le 버킷 의미)."""
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1) # 마지막 칸은 +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """{'buckets': {le: 누적 개수}, 'sum': 합계, 'count': 개수}"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets + ['+Inf'], counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        return {'buckets': cumulative, 'sum': round(total, 4), 'count': count}
+
+    def prometheus_lines(self, name, labels=None, scale=1.0):
+        """Prometheus 텍스트 형식의 _bucket/_sum/_count 줄. scale 은 버킷 경계/합계에 곱할 배율 (예: ms -> 초 0.001)."""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        base = _format_labels(labels)
+        lines = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets + [None], counts):
+            running += bucket_count
+            le = '+Inf' if bound is None else _format_value(bound * scale)
+            lines.append(f"{name}_bucket{_format_labels(dict(labels or {}, le=le))} {running}")
+        lines.append(f"{name}_sum{base} {_format_value(total * scale)}")
+        lines.append(f"{name}_count{base} {count}")
+        return lines
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 9))
+    return str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), chr(92) + "n")}"'
+               for key, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+class Counter:
+    """라벨별 누적 카운터."""
+
+    type_name = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return {key: value for key, value in self._values.items()}
+
+    def prometheus_lines(self):
+        return [f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}"
+                for key, value in sorted(self.values().items())]
+
+
+class Gauge:
+    """수집 시점에 callback() 으로 값을 읽는 게이지. callback 은 숫자 또는 {라벨 값 튜플: 숫자} 를 반환합니다."""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, help_text, callback, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def prometheus_lines(self):
+        value = self.callback()
+        if value is None:
+            return []
+        if not self.labelnames:
+            return [f"{self.name} {_format_value(value)}"]
+        return [f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(v)}"
+                for key, v in sorted(value.items())]
+
+
+class HistogramVec:
+    """라벨 값 조합마다 Histogram 하나. 관측 단위와 출력 단위가 다르면 scale 로 환산합니다 (예: ms 로 관측, 초로 출력)."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labelnames=(), scale=1.0):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = sorted(buckets)
+        self.labelnames = tuple(labelnames)
+        self.scale = scale
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labelnames)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self.buckets))
+        histogram.observe(value)
+
+    def prometheus_lines(self):
+        with self._lock:
+            items = sorted(self._histograms.items())
+        lines = []
+        for key, histogram in items:
+            lines.extend(histogram.prometheus_lines(self.name, dict(zip(self.labelnames, key)), self.scale))
+        return lines
+
+
+class MetricsRegistry:
+    """등록된 지표들을 Prometheus 텍스트 형식(0.0.4)으로 내보냅니다."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.prometheus_lines()
+            except Exception as e: # 게이지 콜백 오류가 전체 수집을 막지 않도록
+                lines.append(f"# {metric.name} 수집 실패: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,168 @@
+# reference_index.py
+# 선생님/표정 기준 이미지들의 AU 벡터를 하나의 float32 행렬로 묶어, 사용자 AU 벡터와 가장 가까운 기준 표정을
+# 한 번의 행렬 곱으로 찾는 인덱스 (cosine / L2 top-k, AU 별 차이)
+import numpy as np
+
+METRICS = ('cosine', 'l2')
+
+
+class ExpressionIndex:
+    """
+    기준 표정 M 개의 AU 벡터 ('_w' 를 뺀 AU 컬럼 F 개) 를 미리 정규화해 둔 (M, F) float32 행렬.
+
+    - cosine: 각 행을 단위 벡터로 나눈 행렬과의 내적. AU 거리들의 '비율'만 비교하므로 얼굴 크기/해상도에 덜 민감합니다.
+    - l2: 기준 표정들의 AU 별 평균/표준편차로 표준화한 값의 유클리드 거리 (AU 마다 다른 값 범위를 맞춤).
+      |q|^2 + |x|^2 - 2 q·x 로 계산하므로 cosine 과 같은 행렬 곱 한 번입니다.
+    - 얼굴을 찾지 못해 AU 가 모두 0 인 기준 이미지는 인덱스에서 제외합니다.
+
+    search() 는 (N, F) 질의 묶음을 받아 (N, k) 인덱스/점수를 반환하므로 수천 개의 기준 표정도
+    질의 하나당 수십 마이크로초 수준입니다.
+    """
+
+    def __init__(self, au_rows, feature_cols, reference_sets, groups, round_numbers, image_paths):
+        feature_cols = list(feature_cols)
+        self.columns = np.array([i for i, col in enumerate(feature_cols) if not col.endswith('_w')], dtype=np.intp)
+        self.au_names = [feature_cols[i] for i in self.columns]
+        self.feature_cols = feature_cols
+        values = np.asarray(au_rows, dtype=np.float32).reshape(-1, len(feature_cols))[:, self.columns]
+        keep = values.any(axis=1)
+        self.values = np.ascontiguousarray(values[keep])
+        self.reference_sets = np.asarray(reference_sets, dtype=str)[keep]
+        self.groups = np.asarray(groups, dtype=str)[keep]
+        self.round_numbers = np.asarray(round_numbers, dtype=np.int32)[keep]
+        self.image_paths = np.asarray(image_paths, dtype=str)[keep]
+        self.skipped = int((~keep).sum())
+
+        # cosine: 단위 벡터 행렬
+        norms = np.linalg.norm(self.values, axis=1, keepdims=True)
+        self.unit = np.ascontiguousarray(self.values / np.where(norms > 0, norms, 1.0), dtype=np.float32)
+        # l2: 표준화 행렬과 행별 제곱 노름
+        if len(self.values):
+            self.mean = self.values.mean(axis=0)
+            std = self.values.std(axis=0)
+        else:
+            self.mean = np.zeros(len(self.columns), dtype=np.float32)
+            std = np.ones(len(self.columns), dtype=np.float32)
+        self.inv_std = (1.0 / np.where(std > 1e-6, std, 1.0)).astype(np.float32)
+        self.standardized = np.ascontiguousarray((self.values - self.mean) * self.inv_std, dtype=np.float32)
+        self.sq_norms = np.einsum('mf,mf->m', self.standardized, self.standardized)
+        self._masks = {}
+
+    @classmethod
+    def from_table(cls, table):
+        """TeacherReferenceTable 로부터 인덱스를 만듭니다."""
+        return cls(table.au_rows, table.feature_cols, table.reference_sets, table.teacher_ids,
+                   table.round_numbers, table.image_paths)
+
+    def __len__(self):
+        return len(self.values)
+
+    def sets(self):
+        """{세트: [그룹, ...]}"""
+        result = {}
+        for reference_set, group in zip(self.reference_sets.tolist(), self.groups.tolist()):
+            groups = result.setdefault(reference_set, [])
+            if group not in groups:
+                groups.append(group)
+        return result
+
+    def _mask(self, reference_set, group):
+        """세트/그룹 필터에 맞는 행의 bool 마스크 (필터가 없으면 None). 같은 필터는 재사용합니다."""
+        if reference_set is None and group is None:
+            return None
+        key = (reference_set, group)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+            if reference_set is not None:
+                mask &= self.reference_sets == reference_set
+            if group is not None:
+                mask &= self.groups == group
+            if mask.any():
+                self._masks[key] = mask # 없는 세트/그룹 이름(사용자 입력)은 저장하지 않음
+        return mask
+
+    def vector(self, rows):
+        """feature_cols 순서 특징 행 (F_all,) / (N, F_all) -> 인덱스 AU 컬럼만의 (N, F) float32."""
+        rows = np.asarray(rows, dtype=np.float32)
+        rows = rows.reshape(-1, rows.shape[-1])
+        if rows.shape[1] == len(self.feature_cols):
+            rows = rows[:, self.columns]
+        elif rows.shape[1] != len(self.columns):
+            raise ValueError(f"특징 수가 맞지 않습니다: {rows.shape[1]} (기대: {len(self.feature_cols)} 또는 {len(self.columns)})")
+        return rows
+
+    def vector_from_values(self, values):
+        """{AU: 값} (au_detail_values 형식) -> (F,) float32. 없는 AU 는 0, 아는 AU 가 하나도 없으면 ValueError."""
+        vector = np.zeros(len(self.columns), dtype=np.float32)
+        found = 0
+        for i, name in enumerate(self.au_names):
+            value = values.get(name)
+            if value is not None:
+                vector[i] = float(value)
+                found += 1
+        if not found:
+            raise ValueError(f"알 수 있는 AU 값이 없습니다 (가능: {', '.join(self.au_names)})")
+        return vector
+
+    def search(self, rows, k=5, metric='cosine', reference_set=None, group=None):
+        """
+        rows: (F,) 또는 (N, F) (feature_cols 전체 또는 인덱스 AU 컬럼만).
+        (indices (N, k'), scores (N, k')) 를 가까운 순으로 반환합니다. k' = min(k, 후보 수).
+        cosine 점수는 유사도 (클수록 가까움), l2 점수는 거리 (작을수록 가까움) 입니다.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"알 수 없는 metric: {metric} (가능: {', '.join(METRICS)})")
+        queries = self.vector(rows)
+        mask = self._mask(reference_set, group)
+        candidates = len(self) if mask is None else int(mask.sum())
+        k = min(int(k), candidates)
+        if k <= 0 or not len(queries):
+            return np.zeros((len(queries), 0), dtype=np.intp), np.zeros((len(queries), 0), dtype=np.float32)
+
+        if metric == 'cosine':
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            keys = (queries / np.where(norms > 0, norms, 1.0)) @ self.unit.T
+            keys = -keys # 작을수록 가까움
+        else:
+            standardized = (queries - self.mean) * self.inv_std
+            keys = self.sq_norms - 2.0 * (standardized @ self.standardized.T)
+            keys += np.einsum('nf,nf->n', standardized, standardized)[:, np.newaxis]
+        if mask is not None:
+            keys[:, ~mask] = np.inf
+
+        if k < keys.shape[1]:
+            top = np.argpartition(keys, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(keys.shape[1]), keys.shape).copy()
+        top_keys = np.take_along_axis(keys, top, axis=1)
+        order = np.argsort(top_keys, axis=1, kind='stable')
+        indices = np.take_along_axis(top, order, axis=1)
+        top_keys = np.take_along_axis(top_keys, order, axis=1)
+        scores = -top_keys if metric == 'cosine' else np.sqrt(np.maximum(top_keys, 0.0))
+        return indices, scores.astype(np.float32)
+
+    def matches(self, rows, k=5, metric='cosine', reference_set=None, group=None, decimals=4):
+        """
+        search() 결과를 JSON 응답용 dict 목록으로 (질의마다 하나의 목록).
+        au_delta 는 사용자 값 - 기준 값 (원래 단위, AU 별) 입니다.
+        """
+        queries = self.vector(rows)
+        indices, scores = self.search(queries, k, metric, reference_set, group)
+        score_key = 'similarity' if metric == 'cosine' else 'distance'
+        results = []
+        for query, row_indices, row_scores in zip(queries, indices, scores):
+            deltas = query - self.values[row_indices]
+            matches = []
+            for rank, (i, score, delta) in enumerate(zip(row_indices.tolist(), row_scores.tolist(), deltas)):
+                matches.append({
+                    'rank': rank + 1,
+                    'set': str(self.reference_sets[i]),
+                    'group': str(self.groups[i]),
+                    'round_number': int(self.round_numbers[i]),
+                    'image_path_static': str(self.image_paths[i]),
+                    score_key: round(score, decimals),
+                    'au_delta': {name: round(float(value), decimals) for name, value in zip(self.au_names, delta)},
+                })
+            results.append(matches)
+        return results
@@ -0,0 +1,213 @@
+# result_cache.py
+# 이미지 내용 해시로 분석 결과(AU 특징 행, 점수, 상태)를 재사용하는 캐시 (메모리 LRU + 선택적 디스크)
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 디스크 캐시 폴더 이름 접두사와 표시 파일: 둘 다 있는 폴더만 이 캐시가 만든 것으로 보고 삭제 대상으로 삼음
+NAMESPACE_DIR_PREFIX = 'smilefit-result-cache-'
+NAMESPACE_MARKER = '.smilefit-result-cache'
+
+
+def cache_namespace(*parts):
+    """모델 해시, 특징 설정 등 결과에 영향을 주는 값들을 합친 네임스페이스. 하나라도 바뀌면 이전 캐시는 쓰이지 않습니다."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """
+    key = sha256(네임스페이스 + 원본 바이트). 값은 (au_row, score, status).
+
+    - 메모리: 최근 사용 순 max_entries 개 (OrderedDict LRU).
+    - 디스크(disk_dir 지정 시): disk_dir/smilefit-result-cache-<네임스페이스 앞 16자>/<key>.npz. 시작할 때 다른
+      네임스페이스 폴더(이전 모델/특징 설정의 캐시)는 삭제하고, 항목 수가 disk_max_entries 를 넘으면 오래된 파일부터 지웁니다.
+      삭제는 접두사와 표시 파일(.smilefit-result-cache)이 모두 있는 폴더만 하므로 disk_dir 안의 다른 폴더는 건드리지 않습니다.
+    - get_or_compute: 같은 key 를 동시에 계산하지 않도록, 계산 중인 요청이 있으면 그 결과를 기다립니다
+      (더블 클릭/재시도로 같은 사진이 거의 동시에 들어오는 경우).
+    """
+
+    def __init__(self, namespace, max_entries=512, disk_dir=None, disk_max_entries=10000, inflight_timeout=30.0):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.inflight_timeout = inflight_timeout
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'inflight_waits': 0, 'stores': 0,
+                       'memory_evictions': 0, 'disk_evictions': 0, 'disk_errors': 0}
+        self.disk_dir = None
+        self._disk_entries = 0
+        if disk_dir:
+            self.disk_dir = os.path.join(disk_dir, NAMESPACE_DIR_PREFIX + namespace[:16])
+            os.makedirs(self.disk_dir, exist_ok=True)
+            with open(os.path.join(self.disk_dir, NAMESPACE_MARKER), 'w', encoding='utf-8') as marker:
+                marker.write(namespace + '\n')
+            self._remove_stale_namespaces(disk_dir)
+            self._disk_entries = sum(1 for name in os.listdir(self.disk_dir) if name.endswith('.npz'))
+
+    def _remove_stale_namespaces(self, disk_dir):
+        current = os.path.basename(self.disk_dir)
+        for name in os.listdir(disk_dir):
+            path = os.path.join(disk_dir, name)
+            if (name != current and name.startswith(NAMESPACE_DIR_PREFIX) and os.path.isdir(path)
+                    and os.path.isfile(os.path.join(path, NAMESPACE_MARKER))):
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info("[Result Cache] 이전 모델/설정의 디스크 캐시를 삭제했습니다: %s", path)
+
+    def key(self, data):
+        digest = hashlib.sha256(self.namespace.encode('ascii'))
+        digest.update(data)
+        return digest.hexdigest()
+
+    # --- 조회 ---
+    def _lookup(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return value
+        value = self._read_disk(key)
+        if value is not None:
+            with self._lock:
+                self._stats['disk_hits'] += 1
+            self._remember(key, value)
+        return value
+
+    def get(self, key):
+        value = self._lookup(key)
+        if value is None:
+            with self._lock:
+                self._stats['misses'] += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        """(value, cached). compute() 가 None 을 반환하거나 예외를 내면 캐시에 저장하지 않습니다."""
+        while True:
+            value = self._lookup(key)
+            if value is not None:
+                return value, True
+            with self._lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[key] = event
+                    self._stats['misses'] += 1
+                    break
+                self._stats['inflight_waits'] += 1
+            # 다른 요청이 계산 중 -> 끝나면 다시 조회 (실패했으면 다음 반복에서 직접 계산)
+            event.wait(self.inflight_timeout)
+        try:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+            return value, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    # --- 저장 ---
+    def put(self, key, value):
+        au_row, score, status = value
+        value = (None if au_row is None else np.asarray(au_row, dtype=np.float32), float(score), str(status))
+        self._remember(key, value)
+        self._write_disk(key, value)
+        with self._lock:
+            self._stats['stores'] += 1
+
+    def _remember(self, key, value):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._stats['memory_evictions'] += 1
+
+    # --- 디스크 ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def _read_disk(self, key):
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                au_row = data['au_row'] if bool(data['has_row']) else None
+                return au_row, float(data['score']), str(data['status'])
+        except Exception as e:
+            with self._lock:
+                self._stats['disk_errors'] += 1
+            logger.warning("[Result Cache] 디스크 캐시 읽기 실패 (%s): %s", path, e)
+            return None
+
+    def _write_disk(self, key, value):
+        if self.disk_dir is None:
+            return
+        au_row, score, status = value
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp.npz"
+        try:
+            np.savez(tmp_path, au_row=au_row if au_row is not None else np.zeros(0, dtype=np.float32),
+                     has_row=np.asarray(au_row is not None), score=np.asarray(score), status=np.asarray(status))
+            existed = os.path.exists(path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            with self._lock:
+                self._stats['disk_errors'] += 1
+            logger.warning("[Result Cache] 디스크 캐시 쓰기 실패 (%s): %s", path, e)
+            return
+        with self._lock:
+            if not existed:
+                self._disk_entries += 1
+            prune = self._disk_entries > self.disk_max_entries
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """오래된(수정 시각 기준) 파일부터 지워 disk_max_entries 의 90% 까지 줄입니다."""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                path = os.path.join(self.disk_dir, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        entries.sort()
+        target = int(self.disk_max_entries * 0.9)
+        removed = 0
+        for _, path in entries[:max(0, len(entries) - target)]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_entries = len(entries) - removed
+            self._stats['disk_evictions'] += removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, memory_entries=len(self._memory), disk_entries=self._disk_entries,
+                         disk_dir=self.disk_dir, namespace=self.namespace[:16])
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0.0
+        return stats
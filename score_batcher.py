@@ -0,0 +1,92 @@
+# score_batcher.py
+# 동시에 들어온 단건 predict 요청을 모아 한 번의 배치 predict 로 처리하는 요청 병합기
+import queue
+import threading
+import time
+
+import numpy as np
+
+from metrics import Histogram
+
+
+class _PendingScore:
+    __slots__ = ('row', 'enqueued', 'event', 'score', 'error')
+
+    def __init__(self, row):
+        self.row = row
+        self.enqueued = time.perf_counter()
+        self.event = threading.Event()
+        self.score = None
+        self.error = None
+
+
+class ScoreBatcher:
+    """
+    특징 행을 최대 max_wait_ms 동안 (또는 max_batch_size 개가 찰 때까지) 모은 뒤
+    float32 행렬 하나로 model.predict 를 호출하고, 각 점수를 기다리던 요청에 돌려줍니다.
+
+    predict(X) 인터페이스를 그대로 제공하므로 face_pipeline.analyze_image 에 model 대신 넘길 수 있습니다.
+    """
+
+    def __init__(self, model, max_batch_size=16, max_wait_ms=2.0, result_timeout=10.0):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.result_timeout = result_timeout
+        self._queue = queue.Queue()
+        self.batch_size_histogram = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.wait_ms_histogram = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100])
+        self._thread = threading.Thread(target=self._run, name='score-batcher', daemon=True)
+        self._thread.start()
+
+    def predict(self, X):
+        """(N, F) 행렬의 각 행을 병합 큐에 넣고 N개의 점수를 반환합니다."""
+        rows = np.asarray(X, dtype=np.float32)
+        if rows.ndim == 1:
+            rows = rows[np.newaxis]
+        pending = [_PendingScore(row) for row in rows]
+        for item in pending:
+            self._queue.put(item)
+        scores = np.empty(len(pending), dtype=np.float32)
+        for i, item in enumerate(pending):
+            if not item.event.wait(self.result_timeout):
+                raise TimeoutError(f"배치 점수 계산 결과를 {self.result_timeout}초 안에 받지 못했습니다.")
+            if item.error is not None:
+                raise item.error
+            scores[i] = item.score
+        return scores
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0].enqueued + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = time.perf_counter()
+            for item in batch:
+                self.wait_ms_histogram.observe((started - item.enqueued) * 1000.0)
+            self.batch_size_histogram.observe(len(batch))
+
+            try:
+                scores = self.model.predict(np.stack([item.row for item in batch]))
+                for item, score in zip(batch, scores):
+                    item.score = float(score)
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            for item in batch:
+                item.event.set()
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'queued': self._queue.qsize(),
+            'batch_size': self.batch_size_histogram.snapshot(),
+            'wait_ms': self.wait_ms_histogram.snapshot(),
+        }
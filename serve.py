@@ -0,0 +1,96 @@
+# serve.py
+# 운영용 서버 실행기
+# 사용법:
+#   python serve.py --mode asgi --workers 4            (uvicorn: 사진 제출 / 피드백 / 비디오 스트림을 비동기로 처리, asgi.py)
+#   python serve.py --mode wsgi --workers 4 --threads 8 (gunicorn gthread: 기존 동기 Flask 앱)
+#   python serve.py --mode dev                          (Flask 개발 서버, threaded)
+# 필요 패키지: asgi -> pip install "uvicorn[standard]" a2wsgi, wsgi -> pip install gunicorn
+#
+# 워커(프로세스)가 2개 이상이면 세션 기록이 프로세스마다 따로 생기지 않도록 SMILEFIT_SESSION_STORE=sqlite:///<경로> 를 사용하세요.
+# 각 워커는 시작할 때 SMILEFIT_WARMUP (기본 background) 에 따라 모델/FaceMesh 를 준비합니다.
+import argparse
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODES = ('asgi', 'wsgi', 'dev')
+
+
+def warn_unshared_sessions(workers):
+    if workers > 1 and not os.environ.get('SMILEFIT_SESSION_STORE', 'memory').startswith('sqlite'):
+        print(f"[serve] 경고: 워커 {workers}개가 각자 메모리 세션 저장소를 씁니다. 같은 사용자의 요청이 다른 워커로 가면 "
+              "피드백 페이지에 기록이 보이지 않을 수 있습니다 (SMILEFIT_SESSION_STORE=sqlite:///... 권장).", file=sys.stderr)
+
+
+def run_asgi(application='asgi:application', host='0.0.0.0', port=5000, workers=1, backlog=2048,
+             limit_concurrency=None, keep_alive=5, log_level='warning'):
+    """uvicorn 으로 실행. workers > 1 이면 application 은 'module:attr' 문자열이어야 합니다."""
+    import uvicorn
+    uvicorn.run(application, host=host, port=port, workers=workers, app_dir=BASE_DIR, backlog=backlog,
+                limit_concurrency=limit_concurrency, timeout_keep_alive=keep_alive, log_level=log_level,
+                access_log=False, lifespan='on')
+
+
+def run_wsgi(application=None, host='0.0.0.0', port=5000, workers=1, threads=8, timeout=120, keep_alive=5, log_level='warning',
+             post_fork=None):
+    """
+    gunicorn (gthread) 으로 실행. application 이 None 이면 각 워커가 app.py 의 Flask 앱을 불러옵니다.
+    워커는 fork 로 만들어지므로 부모에서 시작한 스레드(업로드/추론 풀 등)는 워커에 없습니다.
+    부모에서 앱을 미리 불러왔다면 워커별 준비는 post_fork(server, worker) 에서 하세요.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class SmileFitGunicorn(BaseApplication):
+        def load_config(self):
+            options = {'bind': f"{host}:{port}", 'workers': workers, 'threads': threads, 'worker_class': 'gthread',
+                       'timeout': timeout, 'keepalive': keep_alive, 'loglevel': log_level, 'chdir': BASE_DIR}
+            if post_fork is not None:
+                options['post_fork'] = post_fork
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            if application is not None:
+                return application
+            from app import app as flask_app
+            return flask_app
+
+    SmileFitGunicorn().run()
+
+
+def run_dev(application=None, host='0.0.0.0', port=5000):
+    """Flask 개발 서버 (요청마다 스레드)."""
+    if application is None:
+        from app import app as application
+    application.run(host=host, port=port, threaded=True, use_reloader=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmileFit 서버 실행")
+    parser.add_argument('--mode', choices=MODES, default=os.environ.get('SMILEFIT_SERVER_MODE', 'asgi'))
+    parser.add_argument('--host', default=os.environ.get('SMILEFIT_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SMILEFIT_PORT', '5000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SMILEFIT_WORKERS', '1')), help="프로세스 수")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SMILEFIT_THREADS', '8')), help="wsgi: 워커당 스레드 수")
+    parser.add_argument('--backlog', type=int, default=2048, help="asgi: 대기 연결 수")
+    parser.add_argument('--limit-concurrency', type=int, default=None, help="asgi: 워커당 최대 동시 연결 (넘으면 503)")
+    parser.add_argument('--keep-alive', type=int, default=5, help="keep-alive 유지 시간(초)")
+    parser.add_argument('--log-level', default='warning')
+    args = parser.parse_args()
+
+    warn_unshared_sessions(args.workers)
+    try:
+        if args.mode == 'asgi':
+            run_asgi(host=args.host, port=args.port, workers=args.workers, backlog=args.backlog,
+                     limit_concurrency=args.limit_concurrency, keep_alive=args.keep_alive, log_level=args.log_level)
+        elif args.mode == 'wsgi':
+            run_wsgi(host=args.host, port=args.port, workers=args.workers, threads=args.threads,
+                     keep_alive=args.keep_alive, log_level=args.log_level)
+        else:
+            run_dev(host=args.host, port=args.port)
+    except ImportError as e:
+        sys.exit(f"[serve] {args.mode} 모드에 필요한 패키지가 없습니다: {e} (파일 상단의 필요 패키지 참고)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,421 @@
+# session_history.py
+# 세션 하나의 라운드 기록을 열(column) 단위로 보관하는 압축 표현 (메모리 세션 저장소가 사용)
+# - AU 값: (라운드, AU) float32 배열 하나, 점수/라운드 번호/시각: 작은 숫자 배열, 나머지 문자열 필드: __slots__ 레코드
+# - round_number 순서를 삽입할 때 유지하므로 조회할 때 다시 정렬하지 않음
+# - AU 별 평균/최소/최대/진행도(마지막 - 처음)를 라운드 전체와 선생님별로 numpy 로 한 번에 계산
+# - 필드 선택 / 페이지 단위로 JSON 응답용 dict 를 만듦 (숫자 열은 구간 단위로 한 번에 변환/반올림)
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROUND_FIELDS = ('teacher_id', 'round_number', 'overall_score', 'au_detail_values', 'photo_url', 'photo_status', 'timestamp')
+PHOTO_STATUSES = ('pending', 'uploaded', 'failed')
+SUMMARY_STATS = ('mean', 'min', 'max', 'progress')
+DEFAULT_DECIMALS = 4
+INITIAL_CAPACITY = 8
+
+_NO_ROUND = np.iinfo(np.int64).min # round_number 가 None (가장 앞에 정렬)
+_MIN_ROUND = _NO_ROUND + 1
+_MAX_ROUND = np.iinfo(np.int64).max
+_NO_TIME = np.iinfo(np.int64).min
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_MISSING = object() # 원래 기록에 없던 필드 (출력하지 않음)
+_au_names_cache = {} # 같은 AU 이름 묶음은 모든 세션이 튜플 하나를 공유
+
+
+def _shared_au_names(names):
+    names = tuple(names)
+    return _au_names_cache.setdefault(names, names)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) and len(value) <= 64 else value
+
+
+class RoundRecord:
+    """라운드 하나의 배열 밖 필드. dict 대신 __slots__ 로 두어 라운드당 메모리를 줄입니다 (extra: 그 밖의 키)."""
+
+    __slots__ = ('round_id', 'teacher_id', 'photo_url', 'photo_status', 'extra')
+
+    def __init__(self, round_id):
+        self.round_id = round_id
+        self.teacher_id = None
+        self.photo_url = None
+        self.photo_status = None
+        self.extra = None
+
+    def nbytes(self):
+        size = sys.getsizeof(self)
+        for value in (self.teacher_id, self.photo_url):
+            if isinstance(value, str):
+                size += sys.getsizeof(value)
+        if self.extra:
+            size += sys.getsizeof(self.extra) + sum(sys.getsizeof(v) for v in self.extra.values())
+        return size
+
+
+class SessionHistory:
+    """
+    세션의 라운드 기록 (round_number 오름차순, 같은 번호는 들어온 순서).
+
+    append_round / update_round 에 쓰던 라운드 dict 를 그대로 받아 열로 나눠 저장하고, rounds() 로 같은 모양의 dict 를
+    돌려줍니다. 배열은 미리 잡아 둔 용량이 차면 두 배로 늘립니다.
+    AU 값은 float32 (유효숫자 약 7자리) 로 저장하고 출력할 때 decimals 자리로 반올림합니다.
+    AU 이름 묶음이 세션의 첫 기록과 다른 au_detail_values 나 숫자가 아닌 round_number 등은 레코드의 extra 에 그대로 둡니다.
+    int64 범위를 벗어난 round_number 는 extra 에 원래 값을, 배열에는 정렬용으로 범위 끝 값을 둡니다.
+    append / update 는 중간에 실패하면 기록을 바꾸기 전 상태로 되돌립니다.
+    """
+
+    __slots__ = ('au_names', 'values', 'has_au', 'round_numbers', 'scores', 'timestamps', 'records', 'size')
+
+    def __init__(self, au_names=None, capacity=INITIAL_CAPACITY):
+        self.au_names = _shared_au_names(au_names) if au_names is not None else None
+        self.size = 0
+        self.records = []
+        self.values = None
+        self._allocate(max(int(capacity), 1))
+
+    def _allocate(self, capacity):
+        width = len(self.au_names) if self.au_names is not None else 0
+        old = self.size
+        values = np.zeros((capacity, width), dtype=np.float32)
+        has_au = np.zeros(capacity, dtype=bool)
+        round_numbers = np.full(capacity, _NO_ROUND, dtype=np.int64)
+        scores = np.full(capacity, np.nan, dtype=np.float64)
+        timestamps = np.full(capacity, _NO_TIME, dtype=np.int64)
+        if self.values is not None and old:
+            if self.values.shape[1] == width:
+                values[:old] = self.values[:old]
+            has_au[:old] = self.has_au[:old]
+            round_numbers[:old] = self.round_numbers[:old]
+            scores[:old] = self.scores[:old]
+            timestamps[:old] = self.timestamps[:old]
+        self.values, self.has_au, self.round_numbers, self.scores, self.timestamps = values, has_au, round_numbers, scores, timestamps
+
+    @classmethod
+    def from_rounds(cls, rounds, start_id=1):
+        """라운드 dict 목록 (SQLite 저장소 등) 으로부터 만듭니다."""
+        history = cls(capacity=max(len(rounds), 1))
+        for offset, round_data in enumerate(rounds):
+            history.append(start_id + offset, round_data)
+        return history
+
+    def __len__(self):
+        return self.size
+
+    def copy(self):
+        """현재 기록의 사본 (저장소 잠금 안에서 만들고, 직렬화/요약은 잠금 밖에서 사본으로)."""
+        n = self.size
+        history = SessionHistory.__new__(SessionHistory)
+        history.au_names = self.au_names
+        history.size = n
+        history.values = self.values[:n].copy()
+        history.has_au = self.has_au[:n].copy()
+        history.round_numbers = self.round_numbers[:n].copy()
+        history.scores = self.scores[:n].copy()
+        history.timestamps = self.timestamps[:n].copy()
+        history.records = [self._save_row_record(record) for record in self.records]
+        return history
+
+    def nbytes(self):
+        """배열(용량 기준) + 레코드의 대략적인 메모리 크기(바이트)."""
+        arrays = self.values.nbytes + self.has_au.nbytes + self.round_numbers.nbytes + self.scores.nbytes + self.timestamps.nbytes
+        return sys.getsizeof(self) + sys.getsizeof(self.records) + arrays + sum(record.nbytes() for record in self.records)
+
+    # --- 기록 추가 / 갱신 ---
+    @staticmethod
+    def _round_key(value):
+        """round_number -> 정렬 키 (배열 값). 정수가 아니면 None, int64 범위 밖이면 범위 끝 값."""
+        if not isinstance(value, int) or isinstance(value, bool):
+            return None
+        return min(max(value, _MIN_ROUND), _MAX_ROUND)
+
+    def append(self, round_id, round_data):
+        """라운드 dict 를 round_number 순서 위치에 넣습니다. 들어간 위치를 반환 (실패하면 기록을 남기지 않음)."""
+        key = self._round_key(round_data.get('round_number'))
+        if self.au_names is None:
+            au_values = round_data.get('au_detail_values')
+            if isinstance(au_values, dict) and au_values:
+                self.au_names = _shared_au_names(au_values)
+                self.values = np.zeros((len(self.values), len(self.au_names)), dtype=np.float32)
+        if self.size == len(self.round_numbers):
+            self._allocate(len(self.round_numbers) * 2)
+
+        position = int(np.searchsorted(self.round_numbers[:self.size], _NO_ROUND if key is None else key, side='right'))
+        end = self.size
+        if position < end:
+            # 뒤쪽 라운드를 한 칸씩 밀기 (라운드 수가 작아 복사 비용이 무시할 만함)
+            for column in self._columns():
+                column[position + 1:end + 1] = column[position:end]
+        self.values[position] = 0.0
+        self.has_au[position] = False
+        self.round_numbers[position] = _NO_ROUND
+        self.scores[position] = np.nan
+        self.timestamps[position] = _NO_TIME
+        record = RoundRecord(round_id)
+        self.records.insert(position, record)
+        self.size += 1
+        try:
+            for field, value in round_data.items():
+                self._set(position, record, field, value)
+        except BaseException:
+            self._remove(position)
+            raise
+        return position
+
+    def update(self, round_id, fields):
+        """round_id 기록의 일부 필드를 바꿉니다. 기록이 없으면 False."""
+        position = self.find(round_id)
+        if position < 0:
+            return False
+        saved = self._save_row(position)
+        if 'round_number' in fields:
+            # 순서가 바뀌므로 빼고 다시 넣기
+            round_data = self._round_dicts(position, position + 1, None, None, DEFAULT_DECIMALS, exact=True)[0]
+            self._remove(position)
+            try:
+                self.append(round_id, dict(round_data, **fields))
+            except BaseException:
+                self._insert_row(position, saved)
+                raise
+            return True
+        record = self.records[position]
+        try:
+            for field, value in fields.items():
+                self._set(position, record, field, value)
+        except BaseException:
+            self._remove(position)
+            self._insert_row(position, saved)
+            raise
+        return True
+
+    def find(self, round_id):
+        for position, record in enumerate(self.records):
+            if record.round_id == round_id:
+                return position
+        return -1
+
+    def _columns(self):
+        return (self.values, self.has_au, self.round_numbers, self.scores, self.timestamps)
+
+    def _save_row(self, position):
+        """실패 시 되돌리기용: 열 값과 레코드 사본."""
+        return [column[position].copy() for column in self._columns()], self._save_row_record(self.records[position])
+
+    @staticmethod
+    def _save_row_record(record):
+        copy = RoundRecord(record.round_id)
+        copy.teacher_id, copy.photo_url, copy.photo_status = record.teacher_id, record.photo_url, record.photo_status
+        copy.extra = dict(record.extra) if record.extra else None
+        return copy
+
+    def _insert_row(self, position, saved):
+        cells, record = saved
+        end = self.size
+        for column, cell in zip(self._columns(), cells):
+            column[position + 1:end + 1] = column[position:end]
+            column[position] = cell
+        self.records.insert(position, record)
+        self.size += 1
+
+    def _remove(self, position):
+        end = self.size
+        for column in self._columns():
+            column[position:end - 1] = column[position + 1:end]
+        del self.records[position]
+        self.size -= 1
+
+    def _set(self, position, record, field, value):
+        key = self._round_key(value) if field == 'round_number' else None
+        if field == 'round_number' and (value is None or key == value):
+            self.round_numbers[position] = _NO_ROUND if value is None else value
+            self._pop_extra(record, field)
+        elif field == 'overall_score' and isinstance(value, (int, float)) and not isinstance(value, bool) and self._set_score(position, value):
+            self._pop_extra(record, field)
+        elif field == 'au_detail_values' and self._set_au(position, value):
+            self._pop_extra(record, field)
+        elif field == 'timestamp' and self._set_timestamp(position, value):
+            self._pop_extra(record, field)
+        elif field in ('teacher_id', 'photo_url', 'photo_status'):
+            setattr(record, field, _intern(value))
+        else:
+            if field == 'round_number':
+                self.round_numbers[position] = _NO_ROUND if key is None else key # 정렬용 (출력은 extra 의 원래 값)
+            elif field == 'overall_score':
+                self.scores[position] = np.nan
+            elif field == 'au_detail_values':
+                self.has_au[position] = False
+            elif field == 'timestamp':
+                self.timestamps[position] = _NO_TIME
+            if record.extra is None:
+                record.extra = {}
+            record.extra[field] = value
+
+    @staticmethod
+    def _pop_extra(record, field):
+        if record.extra and field in record.extra:
+            del record.extra[field]
+            if not record.extra:
+                record.extra = None
+
+    def _set_score(self, position, value):
+        try:
+            self.scores[position] = float(value)
+        except OverflowError:
+            return False # float 로 나타낼 수 없는 정수는 extra 에
+        return True
+
+    def _set_au(self, position, values):
+        """세션의 AU 이름 묶음과 같은 {AU: 숫자} 이면 배열에 저장하고 True."""
+        if not isinstance(values, dict) or self.au_names is None or len(values) != len(self.au_names):
+            return False
+        try:
+            row = [float(values[name]) for name in self.au_names]
+        except (KeyError, TypeError, ValueError, OverflowError):
+            return False
+        self.values[position] = row
+        self.has_au[position] = True
+        return True
+
+    def _set_timestamp(self, position, value):
+        """ISO 형식 (시간대 없는) 시각 문자열이면 마이크로초 정수로 저장하고 True."""
+        if not isinstance(value, str):
+            return False
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            return False
+        if moment.tzinfo is not None or moment.isoformat() != value:
+            return False # 원래 문자열을 그대로 돌려줄 수 없는 형식은 extra 에
+        self.timestamps[position] = (moment - _EPOCH) // _MICROSECOND
+        return True
+
+    # --- 조회 ---
+    def _round_dicts(self, start, stop, fields, au_columns, decimals, exact=False):
+        """[start, stop) 라운드의 dict 목록. 숫자 열은 구간 단위로 한 번에 변환/반올림하고 열을 묶어 dict 를 만듭니다."""
+        wanted = ROUND_FIELDS if fields is None else tuple(fields)
+        records = self.records[start:stop]
+        columns = []
+        for field in wanted:
+            if field == 'round_number':
+                column = [None if n == _NO_ROUND else n for n in self.round_numbers[start:stop].tolist()]
+            elif field == 'overall_score':
+                column = [_MISSING if score != score else score for score in self.scores[start:stop].tolist()]
+            elif field == 'au_detail_values':
+                column = [_MISSING] * len(records)
+                if self.au_names is not None:
+                    names, rows = self.au_names, self.values[start:stop].astype(np.float64)
+                    if au_columns is not None:
+                        names, rows = [self.au_names[i] for i in au_columns], rows[:, au_columns]
+                    if not exact:
+                        rows = np.round(rows, decimals)
+                    column = [dict(zip(names, row)) if measured else _MISSING
+                              for row, measured in zip(rows.tolist(), self.has_au[start:stop].tolist())]
+            elif field == 'timestamp':
+                micros = self.timestamps[start:stop]
+                texts = np.datetime_as_string(micros.astype('datetime64[us]'), unit='us').tolist()
+                # datetime.isoformat() 과 같게: 마이크로초가 0 이면 생략
+                column = [_MISSING if value == _NO_TIME else (text[:-7] if value % 1000000 == 0 else text)
+                          for text, value in zip(texts, micros.tolist())]
+            else:
+                column = [getattr(record, field) for record in records]
+            columns.append(column)
+
+        result = [dict(zip(wanted, row)) for row in zip(*columns)] if columns else [{} for _ in records]
+        if any(_MISSING in column for column in columns) or any(record.extra for record in records):
+            for round_data, record in zip(result, records):
+                if record.extra:
+                    for field, value in record.extra.items():
+                        if fields is None or field in wanted:
+                            round_data[field] = value
+                for field in [field for field, value in round_data.items() if value is _MISSING]:
+                    del round_data[field] # 원래 기록에 없던 필드
+        return result
+
+    def au_columns(self, au_names):
+        """AU 이름 목록 -> values 열 번호 (모르는 이름이면 ValueError)."""
+        if self.au_names is None:
+            return np.zeros(0, dtype=np.intp)
+        index = {name: i for i, name in enumerate(self.au_names)}
+        unknown = [name for name in au_names if name not in index]
+        if unknown:
+            raise ValueError(f"알 수 없는 AU: {', '.join(unknown)}")
+        return np.array([index[name] for name in au_names], dtype=np.intp)
+
+    def rounds(self, fields=None, offset=0, limit=None, au_names=None, decimals=DEFAULT_DECIMALS):
+        """
+        round_number 순서의 라운드 dict 목록. fields 로 필드를, au_names 로 au_detail_values 의 AU 를 고르고
+        offset / limit 으로 일부만 가져옵니다 (기본: 전체 필드, 전체 라운드).
+        """
+        au_columns = self.au_columns(au_names) if au_names is not None else None
+        start = min(max(offset, 0), self.size)
+        stop = self.size if limit is None else min(self.size, start + limit)
+        return self._round_dicts(start, stop, fields, au_columns, decimals)
+
+    def upload_status(self):
+        counts = dict.fromkeys(PHOTO_STATUSES, 0)
+        for record in self.records:
+            if record.photo_status in counts:
+                counts[record.photo_status] += 1
+        return counts
+
+    def summary(self, au_names=None, decimals=DEFAULT_DECIMALS):
+        """
+        라운드 전체와 선생님(teacher_id)별 점수 / AU 요약 (progress = 마지막 라운드 - 첫 라운드, round_number 순서):
+        {'rounds', 'overall_score': {mean, min, max, progress}, 'au': {AU: {...}}, 'teachers': {teacher_id: {...}}}
+        그룹 (전체 + 선생님) x 열 (점수 + AU) 을 마스크 배열로 한 번에 계산합니다.
+        """
+        n = self.size
+        if not n:
+            return {'rounds': 0, 'teachers': {}}
+        au_columns = self.au_columns(au_names) if au_names is not None else None
+        if self.au_names is None:
+            au_columns = np.zeros(0, dtype=np.intp)
+        elif au_columns is None:
+            au_columns = np.arange(len(self.au_names))
+        names = [self.au_names[i] for i in au_columns.tolist()] if len(au_columns) else []
+
+        # 열 0: overall_score, 열 1~: AU. 값이 없는 칸 (점수 NaN, AU 없음) 은 valid=False
+        matrix = np.empty((n, 1 + len(au_columns)), dtype=np.float64)
+        matrix[:, 0] = self.scores[:n]
+        matrix[:, 1:] = self.values[:n][:, au_columns]
+        valid = np.empty(matrix.shape, dtype=bool)
+        valid[:, 0] = ~np.isnan(matrix[:, 0])
+        valid[:, 1:] = self.has_au[:n, np.newaxis]
+
+        teacher_ids = [record.teacher_id for record in self.records]
+        groups = list(dict.fromkeys(teacher_ids))
+        group_of = {teacher_id: i + 1 for i, teacher_id in enumerate(groups)}
+        membership = np.zeros((1 + len(groups), n), dtype=bool)
+        membership[0] = True
+        membership[[group_of[teacher_id] for teacher_id in teacher_ids], np.arange(n)] = True
+
+        cells = membership[:, :, np.newaxis] & valid[np.newaxis] # (그룹, 라운드, 열)
+        counts = cells.sum(axis=1)
+        present = counts > 0
+        safe_counts = np.maximum(counts, 1)
+        stats = np.empty((4,) + counts.shape, dtype=np.float64)
+        stats[0] = np.where(cells, matrix, 0.0).sum(axis=1) / safe_counts
+        stats[1] = np.where(cells, matrix, np.inf).min(axis=1)
+        stats[2] = np.where(cells, matrix, -np.inf).max(axis=1)
+        first = cells.argmax(axis=1)
+        last = n - 1 - cells[:, ::-1].argmax(axis=1)
+        columns = np.arange(matrix.shape[1])
+        stats[3] = matrix[last, columns] - matrix[first, columns]
+        stats = np.round(np.where(present, stats, 0.0), decimals).tolist()
+        rounds = membership.sum(axis=1).tolist()
+        present = present.tolist()
+
+        def group_summary(g):
+            result = {'rounds': rounds[g]}
+            if present[g][0]:
+                result['overall_score'] = {key: stats[k][g][0] for k, key in enumerate(SUMMARY_STATS)}
+            if names and present[g][1]:
+                result['au'] = {name: {key: stats[k][g][c] for k, key in enumerate(SUMMARY_STATS)} for c, name in enumerate(names, 1)}
+            return result
+
+        result = group_summary(0)
+        result['teachers'] = {str(teacher_id): group_summary(g) for teacher_id, g in group_of.items()}
+        return result
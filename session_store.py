@@ -0,0 +1,363 @@
+# session_store.py
+# 사용자 세션별 라운드 기록 저장소. 메모리(LRU + TTL, 용량 제한) / SQLite(WAL, 여러 프로세스가 공유) 백엔드
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from session_history import SessionHistory
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """
+    세션 저장소 인터페이스. 라운드 기록은 dict 이며, append_round 가 돌려준 round_id 로 나중에 일부 필드를 갱신합니다
+    (예: 백그라운드 업로드가 끝난 뒤 photo_url 채우기).
+
+    on_evict(session_id, rounds) 는 세션이 만료/축출될 때 호출됩니다 (저장소 잠금 밖에서).
+    """
+
+    shared = False # 여러 프로세스가 같은 데이터를 보는지 여부
+
+    def __init__(self, ttl_seconds=None, on_evict=None):
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+
+    def append_round(self, session_id, round_data):
+        raise NotImplementedError
+
+    def update_round(self, session_id, round_id, fields):
+        raise NotImplementedError
+
+    def get_rounds(self, session_id):
+        raise NotImplementedError
+
+    def read_history(self, session_id, reader):
+        """
+        reader(SessionHistory) 의 결과를 반환합니다 (세션이 없으면 빈 기록). reader 는 저장소 잠금 밖에서 사본으로 호출됩니다.
+        피드백 조회처럼 정렬된 기록의 일부/요약만 필요할 때 라운드 dict 를 모두 만들지 않기 위한 경로입니다.
+        """
+        return reader(SessionHistory.from_rounds(self.get_rounds(session_id)))
+
+    def delete_session(self, session_id):
+        raise NotImplementedError
+
+    def sessions(self):
+        """(session_id, rounds) 목록 (종료 시 정리용)."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+    def _notify_evicted(self, evicted):
+        if self.on_evict is None:
+            return
+        for session_id, rounds in evicted:
+            try:
+                self.on_evict(session_id, rounds)
+            except Exception as e:
+                logger.error("[Session Store] 축출 콜백 오류 (%s): %s", session_id, e)
+
+
+class MemorySessionStore(SessionStore):
+    """
+    프로세스 메모리 저장소. 마지막 접근 순서(OrderedDict)로 관리하며
+    - ttl_seconds 동안 접근이 없는 세션은 만료,
+    - 세션 수가 max_sessions 를 넘거나 대략적인 총 크기가 max_bytes 를 넘으면 가장 오래 쓰지 않은 세션부터 축출합니다.
+    세션의 라운드 기록은 SessionHistory (열 단위 배열, round_number 순서) 로 보관하며 크기는 그 메모리 추정치입니다.
+    """
+
+    def __init__(self, max_sessions=10000, max_bytes=64 * 1024 * 1024, ttl_seconds=2 * 3600, on_evict=None):
+        super().__init__(ttl_seconds, on_evict)
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict() # session_id -> {'history': SessionHistory, 'bytes', 'last_access'}
+        self._next_round_id = 1
+        self._bytes = 0
+        self._evictions = {'ttl': 0, 'lru': 0, 'memory': 0}
+
+    def _touch(self, session_id, create=False):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            if not create:
+                return None
+            entry = {'history': SessionHistory(), 'bytes': 0, 'last_access': 0.0}
+            self._sessions[session_id] = entry
+        entry['last_access'] = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def _pop_locked(self, session_id, reason):
+        entry = self._sessions.pop(session_id)
+        self._bytes -= entry['bytes']
+        self._evictions[reason] += 1
+        return session_id, entry['history'].rounds()
+
+    def _evict_locked(self, keep=None):
+        """만료/용량 초과 세션을 떼어 내 (session_id, rounds) 목록으로 반환 (콜백은 잠금 밖에서)."""
+        evicted = []
+        if self.ttl_seconds:
+            deadline = time.monotonic() - self.ttl_seconds
+            while self._sessions:
+                session_id, entry = next(iter(self._sessions.items()))
+                if entry['last_access'] >= deadline:
+                    break
+                evicted.append(self._pop_locked(session_id, 'ttl'))
+        while self._sessions and len(self._sessions) > self.max_sessions:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            evicted.append(self._pop_locked(session_id, 'lru'))
+        while self._sessions and self.max_bytes and self._bytes > self.max_bytes:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            evicted.append(self._pop_locked(session_id, 'memory'))
+        return evicted
+
+    def _resize_locked(self, entry):
+        size = entry['history'].nbytes()
+        self._bytes += size - entry['bytes']
+        entry['bytes'] = size
+
+    def append_round(self, session_id, round_data):
+        with self._lock:
+            entry = self._touch(session_id, create=True)
+            round_id = self._next_round_id
+            self._next_round_id += 1
+            entry['history'].append(round_id, round_data)
+            self._resize_locked(entry)
+            evicted = self._evict_locked(keep=session_id)
+        self._notify_evicted(evicted)
+        return round_id
+
+    def update_round(self, session_id, round_id, fields):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or not entry['history'].update(round_id, fields):
+                return False # 이미 만료/축출됨
+            self._resize_locked(entry)
+            return True
+
+    def get_rounds(self, session_id):
+        with self._lock:
+            evicted = self._evict_locked()
+            entry = self._touch(session_id)
+            rounds = entry['history'].rounds() if entry is not None else []
+        self._notify_evicted(evicted)
+        return rounds
+
+    def read_history(self, session_id, reader):
+        """잠금 안에서는 배열/레코드 사본만 만들고, reader (직렬화/요약) 는 잠금 밖에서 실행합니다."""
+        with self._lock:
+            evicted = self._evict_locked()
+            entry = self._touch(session_id)
+            history = entry['history'].copy() if entry is not None else SessionHistory()
+        self._notify_evicted(evicted)
+        return reader(history)
+
+    def delete_session(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return []
+            self._bytes -= entry['bytes']
+            return entry['history'].rounds()
+
+    def sessions(self):
+        with self._lock:
+            return [(session_id, entry['history'].rounds()) for session_id, entry in self._sessions.items()]
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._bytes = 0
+
+    def expire(self):
+        """만료된 세션을 지금 정리합니다 (주기 작업용). 정리한 세션 수를 반환."""
+        with self._lock:
+            evicted = self._evict_locked()
+        self._notify_evicted(evicted)
+        return len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'sessions': len(self._sessions),
+                'rounds': sum(len(entry['history']) for entry in self._sessions.values()),
+                'bytes': self._bytes,
+                'max_sessions': self.max_sessions,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'evictions': dict(self._evictions),
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    로컬 디스크 SQLite(WAL 모드) 저장소. 같은 파일을 여러 워커 프로세스(gunicorn 등)가 공유할 수 있습니다.
+    스레드마다 연결을 하나씩 쓰고, 만료/세션 수 초과 정리는 purge_interval 초마다 한 번씩 합니다.
+    """
+
+    shared = True
+
+    def __init__(self, path, max_sessions=100000, ttl_seconds=2 * 3600, on_evict=None, purge_interval=30.0):
+        super().__init__(ttl_seconds, on_evict)
+        self.path = path
+        self.max_sessions = max_sessions
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._purge_lock = threading.Lock()
+        self._last_purge = 0.0
+        self._evictions = {'ttl': 0, 'lru': 0}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS session_rounds (
+                round_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                data TEXT NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_session_rounds_session ON session_rounds(session_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    class _Transaction:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def __enter__(self):
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn
+
+        def __exit__(self, exc_type, exc, tb):
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+            return False
+
+    def _transaction(self):
+        return self._Transaction(self._connection())
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        if now - self._last_purge < self.purge_interval or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_purge = now
+            self.expire()
+        finally:
+            self._purge_lock.release()
+
+    def expire(self):
+        """만료 세션과 max_sessions 초과분(가장 오래 쓰지 않은 순)을 정리합니다. 정리한 세션 수를 반환."""
+        with self._transaction() as conn:
+            expired = []
+            if self.ttl_seconds:
+                expired = [row[0] for row in conn.execute(
+                    "SELECT session_id FROM sessions WHERE last_access < ?", (time.time() - self.ttl_seconds,))]
+            count = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - len(expired)
+            overflow = []
+            if count > self.max_sessions:
+                overflow = [row[0] for row in conn.execute(
+                    "SELECT session_id FROM sessions WHERE last_access >= ? ORDER BY last_access LIMIT ?",
+                    (time.time() - self.ttl_seconds if self.ttl_seconds else 0.0, count - self.max_sessions))]
+            evicted = [(session_id, self._pop(conn, session_id)) for session_id in expired + overflow]
+        self._evictions['ttl'] += len(expired)
+        self._evictions['lru'] += len(overflow)
+        self._notify_evicted(evicted)
+        return len(evicted)
+
+    @staticmethod
+    def _pop(conn, session_id):
+        rounds = [json.loads(row[0]) for row in conn.execute(
+            "SELECT data FROM session_rounds WHERE session_id = ? ORDER BY round_id", (session_id,))]
+        conn.execute("DELETE FROM session_rounds WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return rounds
+
+    def append_round(self, session_id, round_data):
+        data = json.dumps(round_data, ensure_ascii=False, default=str)
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions (session_id, last_access) VALUES (?, ?)", (session_id, time.time()))
+            round_id = conn.execute("INSERT INTO session_rounds (session_id, data) VALUES (?, ?)", (session_id, data)).lastrowid
+        self._maybe_purge()
+        return round_id
+
+    def update_round(self, session_id, round_id, fields):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM session_rounds WHERE round_id = ? AND session_id = ?", (round_id, session_id)).fetchone()
+            if row is None:
+                return False
+            round_data = json.loads(row[0])
+            round_data.update(fields)
+            conn.execute("UPDATE session_rounds SET data = ? WHERE round_id = ?",
+                         (json.dumps(round_data, ensure_ascii=False, default=str), round_id))
+        return True
+
+    def get_rounds(self, session_id):
+        self._maybe_purge()
+        conn = self._connection()
+        conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (time.time(), session_id))
+        return [json.loads(row[0]) for row in conn.execute(
+            "SELECT data FROM session_rounds WHERE session_id = ? ORDER BY round_id", (session_id,))]
+
+    def delete_session(self, session_id):
+        with self._transaction() as conn:
+            return self._pop(conn, session_id)
+
+    def sessions(self):
+        conn = self._connection()
+        grouped = OrderedDict()
+        for session_id, data in conn.execute("SELECT session_id, data FROM session_rounds ORDER BY session_id, round_id"):
+            grouped.setdefault(session_id, []).append(json.loads(data))
+        return list(grouped.items())
+
+    def clear(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM session_rounds")
+            conn.execute("DELETE FROM sessions")
+
+    def stats(self):
+        conn = self._connection()
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'sessions': conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0],
+            'rounds': conn.execute("SELECT COUNT(*) FROM session_rounds").fetchone()[0],
+            'bytes': conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0],
+            'max_sessions': self.max_sessions,
+            'ttl_seconds': self.ttl_seconds,
+            'evictions': dict(self._evictions), # 이 프로세스에서 정리한 수
+        }
+
+
+def create_session_store(url, **options):
+    """
+    'memory' -> MemorySessionStore, 'sqlite:///<경로>' -> SQLiteSessionStore.
+    options 는 백엔드 생성자로 그대로 전달됩니다 (해당 백엔드가 받지 않는 값은 무시).
+    """
+    if url in (None, '', 'memory'):
+        allowed = ('max_sessions', 'max_bytes', 'ttl_seconds', 'on_evict')
+        return MemorySessionStore(**{k: v for k, v in options.items() if k in allowed})
+    if url.startswith('sqlite:///'):
+        allowed = ('max_sessions', 'ttl_seconds', 'on_evict', 'purge_interval')
+        return SQLiteSessionStore(url[len('sqlite:///'):], **{k: v for k, v in options.items() if k in allowed})
+    raise ValueError(f"지원하지 않는 세션 저장소입니다: {url} ('memory' 또는 'sqlite:///<경로>')")
@@ -0,0 +1,158 @@
+# storage_reaper.py
+# 만료된 세션의 Storage 사진을 백그라운드에서 동시에 삭제하는 정리기
+import logging
+import queue
+import threading
+import time
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+# 사진이 없거나 업로드되지 않은 기록의 photo_url 값
+NO_PHOTO_URLS = ("no_image_provided", "upload_failed", "upload_pending")
+
+
+def storage_path_from_url(photo_url, bucket_name):
+    """
+    공개 URL -> 버킷 안의 경로. 버킷 이름이 없는 URL 이면 None.
+      https://storage.googleapis.com/{bucket}/{path}
+      https://firebasestorage.googleapis.com/v0/b/{bucket}/o/{path(URL 인코딩)}?alt=media
+    """
+    if not photo_url or photo_url in NO_PHOTO_URLS or bucket_name not in photo_url:
+        return None
+    path = urlparse(photo_url).path.lstrip('/')
+    if '/o/' in path:
+        path = path.split('/o/', 1)[1]
+    else:
+        path = path.replace(f"{bucket_name}/", '', 1)
+    return unquote(path)
+
+
+def _is_not_found(error):
+    # google.api_core.exceptions.NotFound (의존성 없이 이름으로 판별) / LocalBucket 의 FileNotFoundError
+    return isinstance(error, FileNotFoundError) or type(error).__name__ == 'NotFound'
+
+
+class StorageReaper:
+    """
+    Storage 사진 삭제를 제한된 크기의 스레드 풀에서 동시에 처리합니다.
+
+    - exists() 확인 없이 바로 delete() 하고, 없으면(NotFound) 이미 삭제된 것으로 셉니다 (사진 하나당 왕복 1회).
+    - start() 하면 interval 초마다 expire() (예: session_store.expire) 를 호출해, 만료된 세션이
+      세션 저장소의 on_evict 를 통해 schedule_rounds 로 들어오게 합니다.
+    - shutdown(timeout) 은 최대 timeout 초만 기다리고 남은 삭제는 취소합니다.
+
+    bucket 은 blob(path).delete() 를 제공하면 되므로 local_bucket.LocalBucket 으로 테스트할 수 있습니다.
+
+    워커는 ThreadPoolExecutor 대신 직접 만든 스레드를 씁니다. concurrent.futures 는 인터프리터 종료가 시작되면
+    (atexit 콜백 실행 시점) 새 작업을 거절하므로, 종료 시 정리(cleanup_user_data)에서 삭제를 예약할 수 없기 때문입니다.
+    """
+
+    def __init__(self, bucket, max_workers=8, interval=60.0, expire=None):
+        self.bucket = bucket
+        self.interval = interval
+        self.expire = expire
+        self.max_workers = max_workers
+        self._queue = queue.SimpleQueue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._stats = {'scheduled': 0, 'deleted': 0, 'not_found': 0, 'failed': 0, 'cancelled': 0, 'pending': 0, 'sweeps': 0}
+
+    def start(self):
+        if self._thread is None and self.expire is not None and self.interval:
+            self._thread = threading.Thread(target=self._sweep_loop, name='storage-reaper-sweep', daemon=True)
+            self._thread.start()
+        return self
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.expire()
+                with self._lock:
+                    self._stats['sweeps'] += 1
+            except Exception as e:
+                logger.error("[Storage Reaper] 만료 세션 정리 오류: %s", e)
+
+    def schedule_rounds(self, rounds):
+        """라운드 기록들의 photo_url 에서 Storage 경로를 뽑아 삭제를 예약합니다. 예약한 개수를 반환."""
+        paths = []
+        for round_data in rounds:
+            path = storage_path_from_url(round_data.get('photo_url'), self.bucket.name)
+            if path:
+                paths.append(path)
+        return self.schedule_paths(paths)
+
+    def schedule_paths(self, paths):
+        scheduled = 0
+        for path in paths:
+            with self._lock:
+                if self._closed:
+                    break
+                self._stats['scheduled'] += 1
+                self._stats['pending'] += 1
+                if len(self._workers) < min(self.max_workers, self._stats['pending']):
+                    worker = threading.Thread(target=self._worker_loop, name=f'storage-reaper-{len(self._workers)}', daemon=True)
+                    self._workers.append(worker)
+                    worker.start()
+            self._queue.put(path)
+            scheduled += 1
+        return scheduled
+
+    def _worker_loop(self):
+        while True:
+            path = self._queue.get()
+            if path is None or self._closed:
+                return # 종료: 남은 항목은 shutdown 에서 취소로 집계됨
+            self._delete(path)
+
+    def _delete(self, path):
+        outcome = 'deleted'
+        try:
+            self.bucket.blob(path).delete()
+        except Exception as e:
+            if _is_not_found(e):
+                outcome = 'not_found'
+            else:
+                outcome = 'failed'
+                logger.warning("[Storage Reaper] 삭제 실패 (%s): %s", path, e)
+        with self._lock:
+            if self._closed:
+                return
+            self._stats[outcome] += 1
+            self._stats['pending'] -= 1
+            if self._stats['pending'] == 0:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """예약된 삭제가 모두 끝날 때까지 최대 timeout 초 기다립니다. 끝났으면 True."""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._stats['pending'] == 0, timeout=timeout)
+
+    def shutdown(self, timeout=10.0):
+        """주기 작업을 멈추고 남은 삭제를 최대 timeout 초 기다린 뒤, 끝나지 않은 것은 취소합니다. 남은 개수를 반환."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        deadline = time.monotonic() + timeout
+        self.wait_idle(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            self._closed = True
+            remaining = self._stats['pending']
+        # 아직 시작하지 않은 삭제는 취소 (실행 중인 호출은 끝나도록 두되 기다리지 않음)
+        for _ in self._workers:
+            self._queue.put(None)
+        if remaining:
+            with self._lock:
+                cancelled = self._stats['pending']
+                self._stats['cancelled'] += cancelled
+                self._stats['pending'] = 0
+            logger.warning("[Storage Reaper] 제한 시간 %s초 안에 끝나지 않은 삭제 %d건을 취소했습니다.", timeout, cancelled)
+        return remaining
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,311 @@
+# teacher_reference.py
+# 선생님 이미지(와 e_game / expression 표정 이미지)의 AU 특징/점수를 한 번만 계산해 로컬 .npz 파일로 저장하고,
+# 서버에서 읽어 제공하기 위한 모듈
+# 빌드: python teacher_reference.py [--output teacher_references.npz] [--sets teachers,e_game,expression] [--force]
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGES_DIR = os.path.join(BASE_DIR, 'static', 'images')
+TEACHERS_DIR = os.path.join(IMAGES_DIR, 'teachers')
+DEFAULT_REFERENCE_PATH = os.path.join(BASE_DIR, 'teacher_references.npz')
+MODEL_PATH = os.path.join(BASE_DIR, 'expression_similarity_model.json')
+FEATURE_COLS_PATH = os.path.join(BASE_DIR, 'feature_cols.json')
+
+# 'emma3.png' -> ('emma', 3)
+_TEACHER_IMAGE_PATTERN = re.compile(r'^(?P<teacher>[A-Za-z_]+?)(?P<round>\d+)\.(png|jpg|jpeg)$', re.IGNORECASE)
+# 'e12.png' -> 12, '3.png' -> 3
+_NUMBERED_IMAGE_PATTERN = re.compile(r'^[A-Za-z_]*?(?P<round>\d+)\.(png|jpg|jpeg)$', re.IGNORECASE)
+
+# 기준 이미지 세트 (IMAGES_DIR 아래 폴더 이름)
+#   teachers:   teachers/<선생님>/<선생님><라운드>.png  -> 그룹 = 선생님
+#   e_game:     e_game/e<번호>.png                      -> 그룹 = 'e_game'
+#   expression: expression/<운동>/<번호>.png             -> 그룹 = 운동 (smile, frown, ...)
+REFERENCE_SETS = ('teachers', 'e_game', 'expression')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_fingerprint(model_path=MODEL_PATH, feature_cols=None):
+    """모델 JSON 내용과 feature_cols 순서를 합친 해시. 둘 중 하나라도 바뀌면 캐시가 무효화됩니다."""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps(list(feature_cols or [])).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def discover_teacher_images(teachers_dir=TEACHERS_DIR):
+    """teachers_dir/<teacher>/<teacher><round>.png 형태의 이미지를 (teacher_id, round_number, path) 로 나열합니다."""
+    images = []
+    if not os.path.isdir(teachers_dir):
+        return images
+    for teacher_id in sorted(os.listdir(teachers_dir)):
+        teacher_dir = os.path.join(teachers_dir, teacher_id)
+        if not os.path.isdir(teacher_dir):
+            continue
+        for filename in os.listdir(teacher_dir):
+            match = _TEACHER_IMAGE_PATTERN.match(filename)
+            if match and match.group('teacher') == teacher_id:
+                images.append((teacher_id, int(match.group('round')), os.path.join(teacher_dir, filename)))
+    images.sort(key=lambda item: (item[0], item[1]))
+    return images
+
+
+def discover_reference_images(images_dir=IMAGES_DIR, sets=REFERENCE_SETS):
+    """기준 이미지 세트들을 (세트, 그룹, 번호, 경로) 로 나열합니다. teachers 는 discover_teacher_images 와 같은 규칙."""
+    images = []
+    for reference_set in sets:
+        set_dir = os.path.join(images_dir, reference_set)
+        if reference_set == 'teachers':
+            images.extend(('teachers', teacher_id, round_number, path)
+                          for teacher_id, round_number, path in discover_teacher_images(set_dir))
+            continue
+        if not os.path.isdir(set_dir):
+            continue
+        found = []
+        for name in os.listdir(set_dir):
+            path = os.path.join(set_dir, name)
+            # 하위 폴더가 있으면 폴더 이름이 그룹, 세트 폴더에 바로 있는 이미지는 세트 이름이 그룹
+            group, entries = (name, [os.path.join(path, f) for f in os.listdir(path)]) if os.path.isdir(path) else (reference_set, [path])
+            for entry in entries:
+                match = _NUMBERED_IMAGE_PATTERN.match(os.path.basename(entry))
+                if match and os.path.isfile(entry):
+                    found.append((reference_set, group, int(match.group('round')), entry))
+        images.extend(sorted(found, key=lambda item: (item[1], item[2])))
+    return images
+
+
+class TeacherReferenceTable:
+    """
+    기준 이미지별 AU 특징 행과 점수를 담는 작은 표 (.npz 한 파일).
+    reference_sets 는 각 행의 세트 ('teachers', 'e_game', 'expression'), teacher_ids 는 세트 안의 그룹
+    (선생님 이름, 'e_game', 운동 이름) 입니다. reference_sets 가 없던 이전 파일은 모두 'teachers' 로 읽습니다.
+    image_sizes / image_mtimes (만들 때의 파일 크기, 수정 시각 ns) 와 built_sets (만들 때 포함한 세트) 는 changed_images()
+    가 이미지 변경을 빠르게 확인하는 데 씁니다. 없던 이전 파일은 -1 (모르는 값) 로 읽어 모든 이미지의 해시를 비교합니다.
+    """
+
+    def __init__(self, teacher_ids, round_numbers, image_hashes, image_paths, au_rows, scores, feature_cols, model_hash,
+                 reference_sets=None, image_sizes=None, image_mtimes=None, built_sets=None):
+        self.teacher_ids = np.asarray(teacher_ids, dtype=str)
+        self.reference_sets = (np.full(len(self.teacher_ids), 'teachers') if reference_sets is None
+                               else np.asarray(reference_sets, dtype=str))
+        self.round_numbers = np.asarray(round_numbers, dtype=np.int32)
+        self.image_hashes = np.asarray(image_hashes, dtype=str)
+        self.image_paths = np.asarray(image_paths, dtype=str)
+        unknown = np.full(len(self.teacher_ids), -1, dtype=np.int64)
+        self.image_sizes = unknown if image_sizes is None else np.asarray(image_sizes, dtype=np.int64)
+        self.image_mtimes = unknown if image_mtimes is None else np.asarray(image_mtimes, dtype=np.int64)
+        self.built_sets = (sorted(set(self.reference_sets.tolist())) if built_sets is None
+                           else [str(name) for name in built_sets])
+        self.au_rows = np.asarray(au_rows, dtype=np.float32).reshape(len(self.teacher_ids), len(feature_cols))
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.feature_cols = list(feature_cols)
+        self.model_hash = str(model_hash)
+        # 내용이 같으면 같은 ETag (모델 해시 + 이미지 해시들)
+        digest = hashlib.sha256(self.model_hash.encode('utf-8'))
+        for image_hash in self.image_hashes:
+            digest.update(str(image_hash).encode('utf-8'))
+        self.etag = digest.hexdigest()[:32]
+        self._index = {(str(s), str(t), int(r)): i
+                       for i, (s, t, r) in enumerate(zip(self.reference_sets, self.teacher_ids, self.round_numbers))}
+
+    def __len__(self):
+        return len(self.teacher_ids)
+
+    @classmethod
+    def load(cls, path=DEFAULT_REFERENCE_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data['teacher_ids'], data['round_numbers'], data['image_hashes'], data['image_paths'],
+                data['au_rows'], data['scores'], data['feature_cols'].tolist(), str(data['model_hash']),
+                data['reference_sets'] if 'reference_sets' in data.files else None,
+                data['image_sizes'] if 'image_sizes' in data.files else None,
+                data['image_mtimes'] if 'image_mtimes' in data.files else None,
+                data['built_sets'].tolist() if 'built_sets' in data.files else None
+            )
+
+    def save(self, path=DEFAULT_REFERENCE_PATH):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            teacher_ids=self.teacher_ids, round_numbers=self.round_numbers, reference_sets=self.reference_sets,
+            image_hashes=self.image_hashes, image_paths=self.image_paths,
+            image_sizes=self.image_sizes, image_mtimes=self.image_mtimes, built_sets=np.asarray(self.built_sets, dtype=str),
+            au_rows=self.au_rows, scores=self.scores,
+            feature_cols=np.asarray(self.feature_cols, dtype=str), model_hash=np.asarray(self.model_hash)
+        )
+        os.replace(tmp_path, path)
+
+    def lookup(self, teacher_id, round_number, reference_set='teachers'):
+        """(au_row, score) 또는 None."""
+        i = self._index.get((reference_set, teacher_id, int(round_number)))
+        return None if i is None else (self.au_rows[i], float(self.scores[i]))
+
+    def changed_images(self, images_dir=IMAGES_DIR):
+        """
+        표를 만든 뒤 바뀐 기준 이미지의 경로 목록 (추가/삭제/내용 변경). 비어 있으면 표가 현재 이미지와 같습니다.
+        크기와 수정 시각이 저장된 값과 같으면 그대로 보고, 다르면 (또는 모르면) 파일 해시를 다시 계산해 비교합니다.
+        """
+        stored = {(str(s), str(t), int(r)): i
+                  for i, (s, t, r) in enumerate(zip(self.reference_sets, self.teacher_ids, self.round_numbers))}
+        changed = []
+        for reference_set, teacher_id, round_number, path in discover_reference_images(images_dir, self.built_sets):
+            i = stored.pop((reference_set, teacher_id, round_number), None)
+            if i is None:
+                changed.append(path) # 새 이미지
+                continue
+            try:
+                stat = os.stat(path)
+                if (stat.st_size, stat.st_mtime_ns) != (int(self.image_sizes[i]), int(self.image_mtimes[i])) \
+                        and file_sha256(path) != str(self.image_hashes[i]):
+                    changed.append(path)
+            except OSError:
+                changed.append(path)
+        changed.extend(str(self.image_paths[i]) for i in stored.values()) # 삭제된 이미지
+        return changed
+
+    def teachers(self):
+        return sorted(set(self.teacher_ids[self.reference_sets == 'teachers'].tolist()))
+
+    def records(self, teacher_id=None, decimals=4, reference_set='teachers'):
+        """feedback 페이지가 쓰던 Firestore 'teacher_au_references' 문서와 같은 형태의 dict 목록."""
+        detail_columns = [i for i, col in enumerate(self.feature_cols) if not col.endswith('_w')]
+        records = []
+        for i in range(len(self)):
+            if self.reference_sets[i] != reference_set:
+                continue
+            if teacher_id is not None and self.teacher_ids[i] != teacher_id:
+                continue
+            row = self.au_rows[i]
+            records.append({
+                'teacher_id': str(self.teacher_ids[i]),
+                'round_number': int(self.round_numbers[i]),
+                'overall_score': round(float(self.scores[i]), decimals),
+                'au_detail_values': {self.feature_cols[c]: round(float(row[c]), decimals) for c in detail_columns},
+                'image_path_static': str(self.image_paths[i]),
+            })
+        return records
+
+
+def build_reference_table(face_mesh_pool, au_extractor, model, model_hash, images_dir=IMAGES_DIR, sets=REFERENCE_SETS,
+                          previous=None, force=False):
+    """
+    기준 이미지 세트들을 분석해 TeacherReferenceTable 을 만듭니다. previous 표의 모델 해시가 같으면
+    이미지 해시가 바뀌지 않은 항목은 다시 계산하지 않고 재사용합니다.
+    """
+    from face_pipeline import analyze_image
+
+    reusable = previous is not None and not force and previous.model_hash == model_hash and previous.feature_cols == au_extractor.feature_cols
+    previous_hashes = {}
+    if reusable:
+        previous_hashes = {(str(s), str(t), int(r)): str(h) for s, t, r, h in
+                           zip(previous.reference_sets, previous.teacher_ids, previous.round_numbers, previous.image_hashes)}
+
+    reference_sets, teacher_ids, round_numbers, image_hashes, image_paths, au_rows, scores = [], [], [], [], [], [], []
+    image_sizes, image_mtimes = [], []
+    computed = reused = 0
+    for reference_set, teacher_id, round_number, path in discover_reference_images(images_dir, sets):
+        stat = os.stat(path) # 해시 전에 기록: 계산 중에 파일이 바뀌면 다음 확인에서 해시를 다시 비교
+        image_hash = file_sha256(path)
+        if previous_hashes.get((reference_set, teacher_id, round_number)) == image_hash:
+            au_row, score = previous.lookup(teacher_id, round_number, reference_set)
+            reused += 1
+        else:
+            with open(path, 'rb') as f:
+                au_row, score, status = analyze_image(f.read(), face_mesh_pool, au_extractor, model)
+            if status != 'ok':
+                print(f"경고: {path} 에서 얼굴을 찾지 못했습니다 ({status}). AU 값을 0으로 저장합니다.")
+                au_row = np.zeros(len(au_extractor.feature_cols), dtype=np.float32)
+            computed += 1
+        reference_sets.append(reference_set)
+        teacher_ids.append(teacher_id)
+        round_numbers.append(round_number)
+        image_hashes.append(image_hash)
+        image_sizes.append(stat.st_size)
+        image_mtimes.append(stat.st_mtime_ns)
+        image_paths.append('/static/images/' + os.path.relpath(path, images_dir).replace(os.sep, '/'))
+        au_rows.append(au_row)
+        scores.append(score)
+
+    table = TeacherReferenceTable(teacher_ids, round_numbers, image_hashes, image_paths,
+                                  np.array(au_rows, dtype=np.float32).reshape(len(teacher_ids), len(au_extractor.feature_cols)),
+                                  scores, au_extractor.feature_cols, model_hash, reference_sets,
+                                  image_sizes, image_mtimes, list(sets))
+    print(f"[Teacher Reference] {len(table)}개 항목 (새로 계산 {computed}, 재사용 {reused})")
+    return table
+
+
+def load_if_current(path, model_hash, images_dir=IMAGES_DIR):
+    """
+    저장된 표가 있고 현재 모델 해시와 같으며 기준 이미지가 만들 때와 같으면 불러옵니다. 아니면 None
+    (서버는 /teacher_au_references 에 404 를 돌려주고, 피드백 페이지는 Firestore 데이터를 사용).
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        table = TeacherReferenceTable.load(path)
+    except Exception as e:
+        print(f"[Teacher Reference] {path} 로드 실패: {e}")
+        return None
+    if table.model_hash != model_hash:
+        print(f"[Teacher Reference] {path} 는 다른 모델로 계산되었습니다. 'python teacher_reference.py' 로 다시 생성하세요.")
+        return None
+    changed = table.changed_images(images_dir)
+    if changed:
+        print(f"[Teacher Reference] {path} 를 만든 뒤 기준 이미지 {len(changed)}개가 바뀌었습니다 (예: {changed[0]}). "
+              "'python teacher_reference.py' 로 다시 생성하세요 (바뀐 이미지만 다시 계산).")
+        return None
+    return table
+
+
+def main():
+    from au_features import AUFeatureExtractor
+    from face_mesh_pool import FaceMeshPool
+    from face_pipeline import create_static_face_mesh
+    from tree_scorer import TreeEnsembleScorer
+
+    parser = argparse.ArgumentParser(description="선생님/표정 AU 기준 데이터(.npz) 생성")
+    parser.add_argument('--output', default=DEFAULT_REFERENCE_PATH, help="출력 .npz 경로")
+    parser.add_argument('--images-dir', default=IMAGES_DIR, help="기준 이미지 세트 폴더들이 있는 폴더")
+    parser.add_argument('--sets', default=','.join(REFERENCE_SETS), help="포함할 세트 (쉼표로 구분)")
+    parser.add_argument('--force', action='store_true', help="해시가 같아도 전부 다시 계산")
+    args = parser.parse_args()
+
+    with open(FEATURE_COLS_PATH, 'r', encoding='utf-8') as f:
+        feature_cols = json.load(f)
+    model_hash = model_fingerprint(MODEL_PATH, feature_cols)
+    previous = None
+    if os.path.exists(args.output):
+        try:
+            previous = TeacherReferenceTable.load(args.output)
+        except Exception as e:
+            print(f"[Teacher Reference] 기존 파일을 읽을 수 없어 새로 만듭니다: {e}")
+
+    table = build_reference_table(
+        FaceMeshPool(create_static_face_mesh, size=1),
+        AUFeatureExtractor(feature_cols),
+        TreeEnsembleScorer.load(MODEL_PATH),
+        model_hash,
+        images_dir=args.images_dir,
+        sets=[name.strip() for name in args.sets.split(',') if name.strip()],
+        previous=previous,
+        force=args.force
+    )
+    table.save(args.output)
+    print(f"[Teacher Reference] 저장 완료: {args.output} (ETag {table.etag})")
+
+
+if __name__ == '__main__':
+    main()
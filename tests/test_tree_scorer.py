@@ -0,0 +1,124 @@
+# tests/test_tree_scorer.py
+# TreeEnsembleScorer 가 XGBRegressor.predict 와 같은 점수를 내는지 확인 (xgboost 가 설치된 환경에서만 실행)
+import os
+
+import numpy as np
+import pytest
+
+from tree_scorer import TreeEnsembleScorer
+
+xgboost = pytest.importorskip('xgboost')
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'expression_similarity_model.json')
+FEATURE_ROWS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'au_feature_rows.csv')
+
+
+def load_pair(path):
+    regressor = xgboost.XGBRegressor()
+    regressor.load_model(path)
+    return TreeEnsembleScorer.load(path), regressor
+
+
+def random_rows(scorer, rng, count):
+    """분할 임계값이 놓인 범위 (특징별 최소/최대 임계값 바깥까지 조금 넓힌 범위) 의 임의 행."""
+    split = scorer.left_child != np.arange(len(scorer.left_child))
+    low = np.zeros(scorer.num_features, dtype=np.float32)
+    high = np.ones(scorer.num_features, dtype=np.float32)
+    for feature in range(scorer.num_features):
+        thresholds = scorer.threshold[split & (scorer.feature_index == feature)]
+        if len(thresholds):
+            margin = max(float(thresholds.max() - thresholds.min()) * 0.1, 1e-3)
+            low[feature], high[feature] = thresholds.min() - margin, thresholds.max() + margin
+    return rng.uniform(low, high, size=(count, scorer.num_features)).astype(np.float32)
+
+
+def threshold_rows(scorer, rng, count):
+    """모든 특징을 그 특징의 분할 임계값 중 하나와 정확히 같게 (또는 바로 아래/위 float32 로) 둔 행."""
+    split = scorer.left_child != np.arange(len(scorer.left_child))
+    rows = random_rows(scorer, rng, count)
+    for feature in range(scorer.num_features):
+        thresholds = scorer.threshold[split & (scorer.feature_index == feature)]
+        if not len(thresholds):
+            continue
+        picked = rng.choice(thresholds, size=count)
+        nudge = rng.integers(-1, 2, size=count) # -1: 바로 아래, 0: 같음, 1: 바로 위
+        picked = np.where(nudge < 0, np.nextafter(picked, np.float32(-np.inf)), picked)
+        picked = np.where(nudge > 0, np.nextafter(picked, np.float32(np.inf)), picked)
+        rows[:, feature] = picked
+    return rows
+
+
+def with_missing(rows, rng, fraction):
+    rows = rows.copy()
+    rows[rng.random(rows.shape) < fraction] = np.nan
+    return rows
+
+
+def assert_same_scores(scorer, regressor, rows):
+    expected = regressor.predict(rows)
+    actual = scorer.predict(rows)
+    assert actual.dtype == np.float32
+    np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-5)
+
+
+@pytest.fixture(scope='module')
+def bundled():
+    if not os.path.exists(MODEL_PATH):
+        pytest.skip("expression_similarity_model.json 이 없습니다.")
+    return load_pair(MODEL_PATH)
+
+
+@pytest.fixture(scope='module')
+def trained_with_missing(tmp_path_factory):
+    """학습 데이터에 결측값이 있어 default_left 가 왼쪽/오른쪽 모두 쓰이는 작은 모델."""
+    rng = np.random.default_rng(7)
+    X = rng.normal(size=(400, 6)).astype(np.float32)
+    y = X[:, 0] * 2.0 - X[:, 1] + np.where(np.isnan(with_missing(X, rng, 0.3)[:, 2]), 3.0, X[:, 2])
+    X = with_missing(X, rng, 0.2)
+    regressor = xgboost.XGBRegressor(n_estimators=30, max_depth=4, learning_rate=0.3, objective='reg:squarederror')
+    regressor.fit(X, y)
+    path = tmp_path_factory.mktemp('model') / 'model.json'
+    regressor.save_model(str(path))
+    scorer, loaded = load_pair(str(path))
+    assert scorer.default_left.any() and not scorer.default_left.all()
+    return scorer, loaded
+
+
+@pytest.mark.parametrize('model', ['bundled', 'trained_with_missing'])
+def test_random_rows(model, request):
+    scorer, regressor = request.getfixturevalue(model)
+    assert_same_scores(scorer, regressor, random_rows(scorer, np.random.default_rng(0), 500))
+
+
+@pytest.mark.parametrize('model', ['bundled', 'trained_with_missing'])
+def test_missing_values(model, request):
+    scorer, regressor = request.getfixturevalue(model)
+    rng = np.random.default_rng(1)
+    rows = with_missing(random_rows(scorer, rng, 500), rng, 0.3)
+    rows[0] = np.nan # 모든 특징이 결측
+    assert_same_scores(scorer, regressor, rows)
+
+
+@pytest.mark.parametrize('model', ['bundled', 'trained_with_missing'])
+def test_split_threshold_rows(model, request):
+    scorer, regressor = request.getfixturevalue(model)
+    rng = np.random.default_rng(2)
+    rows = threshold_rows(scorer, rng, 500)
+    assert_same_scores(scorer, regressor, rows)
+    assert_same_scores(scorer, regressor, with_missing(rows, rng, 0.2))
+
+
+def test_single_row_and_empty_batch(bundled):
+    scorer, regressor = bundled
+    row = random_rows(scorer, np.random.default_rng(3), 1)
+    np.testing.assert_allclose(scorer.predict(row[0]), regressor.predict(row), rtol=1e-5, atol=1e-5)
+    assert scorer.predict(np.zeros((0, scorer.num_features))).shape == (0,)
+
+
+def test_feature_rows_fixture(bundled):
+    """AUFeatureExtractor 가 만든 실제 형태의 특징 행 (같은 랜드마크 쌍을 쓰는 AU, '_w' 배율 관계 포함)."""
+    scorer, regressor = bundled
+    rows = np.loadtxt(FEATURE_ROWS_PATH, delimiter=',', dtype=np.float32, encoding='utf-8')
+    assert rows.shape == (40, scorer.num_features)
+    assert_same_scores(scorer, regressor, rows)
+    assert len(np.unique(scorer.predict(rows))) > 10 # 여러 분기 경로를 지나는 행인지
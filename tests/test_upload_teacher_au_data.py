@@ -0,0 +1,95 @@
+# tests/test_upload_teacher_au_data.py
+# upload_teacher_au_data.py --dry-run 을 가짜 분석기로 실행: 결정적인 문서 ID, 재실행 시 sha256 로 건너뛰기, 배치 저장,
+# 읽지 못한 이미지는 저장하지 않기
+import json
+import sys
+
+import numpy as np
+import pytest
+
+import face_pipeline
+import upload_teacher_au_data as uploader
+
+
+def fake_analyze_image(data, face_mesh_pool, au_extractor, model, max_side=0, timer=None):
+    """이미지 바이트 내용으로 결과를 정하는 분석기 (FaceMesh 없이)."""
+    if data == b'broken':
+        return None, 0.0, 'decode_failed'
+    if data == b'noface':
+        return None, 0.0, 'no_face'
+    au_row = np.full(len(au_extractor.feature_cols), len(data) / 10.0, dtype=np.float32)
+    return au_row, float(len(data)), 'ok'
+
+
+def fake_init_worker(feature_cols, model_path):
+    uploader._worker = {
+        'face_mesh_pool': None,
+        'au_extractor': uploader.AUFeatureExtractor(feature_cols, au_landmarks=uploader.AU_LANDMARKS),
+        'model': object(),
+    }
+
+
+@pytest.fixture
+def dry_run(tmp_path, monkeypatch):
+    """main() 을 --dry-run 으로 실행하는 함수. 실행마다 만든 LocalFirestore 를 돌려줍니다."""
+    monkeypatch.setattr(face_pipeline, 'analyze_image', fake_analyze_image)
+    monkeypatch.setattr(uploader, '_init_worker', fake_init_worker)
+    monkeypatch.setattr(uploader, 'MAX_BATCH_WRITES', 2)
+    clients = []
+
+    class RecordingFirestore(uploader.LocalFirestore):
+        def __init__(self, path=None):
+            super().__init__(path)
+            clients.append(self)
+
+    monkeypatch.setattr(uploader, 'LocalFirestore', RecordingFirestore)
+    state = tmp_path / 'state.json'
+
+    def run(*extra):
+        argv = ['upload_teacher_au_data.py', str(tmp_path / 'teachers'), '--dry-run', '--dry-run-state', str(state),
+                '--workers', '1', *extra]
+        monkeypatch.setattr(sys, 'argv', argv)
+        uploader.main()
+        return clients[-1]
+
+    return run
+
+
+def write_image(tmp_path, teacher_id, round_number, data):
+    folder = tmp_path / 'teachers' / teacher_id
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / f'{teacher_id}{round_number}.png').write_bytes(data)
+
+
+def test_dry_run_ids_rerun_and_batches(tmp_path, dry_run):
+    write_image(tmp_path, 'emma', 1, b'smile-1')
+    write_image(tmp_path, 'emma', 2, b'smile-22')
+    write_image(tmp_path, 'emma', 3, b'noface')
+    write_image(tmp_path, 'olivia', 1, b'smile-333')
+    write_image(tmp_path, 'olivia', 2, b'broken')
+
+    db = dry_run()
+    documents = db.data[uploader.COLLECTION_NAME]
+    # 읽지 못한 olivia 2 는 0 AU 문서로 저장하지 않음, 얼굴 없는 emma 3 는 0 AU 로 저장
+    assert sorted(documents) == ['emma_01', 'emma_02', 'emma_03', 'olivia_01']
+    assert documents['emma_02']['overall_score'] == 8.0
+    assert set(documents['emma_03']['au_detail_values'].values()) == {0.0}
+    assert documents['olivia_01']['image_path_static'] is None # static 폴더 밖 이미지
+    assert db.commits == [2, 2]
+
+    # 같은 내용으로 다시 실행: 해시와 모델이 같으므로 아무것도 쓰지 않음 (읽지 못한 이미지만 다시 시도)
+    db = dry_run()
+    assert db.commits == []
+    assert sorted(db.data[uploader.COLLECTION_NAME]) == ['emma_01', 'emma_02', 'emma_03', 'olivia_01']
+
+    # 한 이미지만 바뀌면 그 문서만 같은 ID 로 덮어씀
+    write_image(tmp_path, 'emma', 2, b'smile-2222')
+    db = dry_run()
+    assert db.commits == [1]
+    stored = json.loads((tmp_path / 'state.json').read_text(encoding='utf-8'))[uploader.COLLECTION_NAME]
+    assert sorted(stored) == ['emma_01', 'emma_02', 'emma_03', 'olivia_01']
+    assert stored['emma_02']['overall_score'] == 10.0
+
+    # --force 는 해시가 같아도 전부 다시 저장
+    db = dry_run('--force')
+    assert db.commits == [2, 2]
@@ -0,0 +1,120 @@
+# tree_scorer.py
+# xgboost 없이 expression_similarity_model.json (XGBoost JSON 모델)을 직접 평가하는 경량 점수 계산기
+import json
+
+import numpy as np
+
+
+def _parse_base_score(value):
+    # XGBoost 2.x: "6.585381E-1", 3.x: "[6.585381E-1]"
+    value = str(value).strip()
+    if value.startswith('['):
+        value = value.strip('[]').split(',')[0]
+    return float(value)
+
+
+class TreeEnsembleScorer:
+    """
+    XGBoost gbtree 회귀 모델의 모든 트리를 평탄화된 NumPy 노드 배열(특징 인덱스, 임계값, 왼쪽/오른쪽 자식,
+    결측 시 방향, 리프 값)로 한 번만 파싱해 두고, 배치 전체 x 트리 전체를 깊이 단위로 동시에 내려가며 평가합니다.
+
+    리프 노드는 자기 자신을 자식으로 가리키게 만들어 두었기 때문에, 최대 깊이만큼 반복하면
+    모든 (행, 트리) 쌍이 리프에 도달합니다. 결과는 base_score + 리프 값의 합이며
+    XGBRegressor(objective='reg:squarederror').predict 와 같은 값을 냅니다.
+    """
+
+    SUPPORTED_OBJECTIVES = ('reg:squarederror', 'reg:linear')
+
+    def __init__(self, model_json):
+        learner = model_json['learner']
+        objective = learner['objective']['name']
+        booster = learner['gradient_booster']
+        if booster.get('name') != 'gbtree':
+            raise ValueError(f"지원하지 않는 booster 입니다: {booster.get('name')}")
+        if objective not in self.SUPPORTED_OBJECTIVES:
+            raise ValueError(f"지원하지 않는 objective 입니다: {objective}")
+        model_param = learner['learner_model_param']
+        if int(model_param.get('num_class', 0)) > 1 or int(model_param.get('num_target', 1)) > 1:
+            raise ValueError("다중 출력 모델은 지원하지 않습니다.")
+
+        self.feature_names = learner.get('feature_names', [])
+        self.num_features = int(model_param['num_feature'])
+        self.base_score = np.float32(_parse_base_score(model_param['base_score']))
+
+        trees = booster['model']['trees']
+        features, thresholds, lefts, rights, default_lefts, leaf_values, roots = [], [], [], [], [], [], []
+        depth = 0
+        offset = 0
+        for tree in trees:
+            if any(tree.get('split_type', [])):
+                raise ValueError("범주형 분할이 있는 트리는 지원하지 않습니다.")
+            left = np.asarray(tree['left_children'], dtype=np.int64)
+            right = np.asarray(tree['right_children'], dtype=np.int64)
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            node_ids = np.arange(len(left), dtype=np.int64)
+            is_leaf = left == -1
+
+            features.append(np.where(is_leaf, 0, np.asarray(tree['split_indices'], dtype=np.int64)))
+            thresholds.append(np.where(is_leaf, np.float32(0), conditions))
+            lefts.append(np.where(is_leaf, node_ids, left) + offset)
+            rights.append(np.where(is_leaf, node_ids, right) + offset)
+            default_lefts.append(np.asarray(tree['default_left'], dtype=bool))
+            # 리프 노드에서는 split_conditions 가 리프 값
+            leaf_values.append(np.where(is_leaf, conditions, np.float32(0)))
+            roots.append(offset)
+            depth = max(depth, self._tree_depth(left, right))
+            offset += len(left)
+
+        self.feature_index = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds).astype(np.float32)
+        self.left_child = np.concatenate(lefts).astype(np.intp)
+        self.right_child = np.concatenate(rights).astype(np.intp)
+        self.default_left = np.concatenate(default_lefts)
+        self.leaf_value = np.concatenate(leaf_values).astype(np.float32)
+        # children[node * 2 + go_left] -> 다음 노드 (오른쪽/왼쪽 자식을 한 번의 take 로 선택)
+        self.children = np.stack([self.right_child, self.left_child], axis=1).ravel()
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = depth
+        self.num_trees = len(trees)
+
+    @staticmethod
+    def _tree_depth(left, right):
+        depth = 0
+        frontier = [0]
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                if left[node] != -1:
+                    next_frontier.extend((left[node], right[node]))
+            if next_frontier:
+                depth += 1
+            frontier = next_frontier
+        return depth
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def predict(self, X):
+        """(N, num_features) -> (N,) float32 점수. NaN 은 XGBoost 와 같이 결측값으로 처리합니다."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis]
+        count = X.shape[0]
+        if count == 0:
+            return np.zeros(0, dtype=np.float32)
+        if X.shape[1] != self.num_features:
+            raise ValueError(f"특징 수가 다릅니다: 입력 {X.shape[1]}, 모델 {self.num_features}")
+
+        flat = np.ascontiguousarray(X).ravel()
+        row_offset = (np.arange(count, dtype=np.intp) * self.num_features)[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (count, self.num_trees)).copy()
+        for _ in range(self.max_depth):
+            values = flat.take(row_offset + self.feature_index.take(nodes))
+            go_left = values < self.threshold.take(nodes)
+            missing = np.isnan(values)
+            if missing.any():
+                go_left = np.where(missing, self.default_left.take(nodes), go_left)
+            nodes = self.children.take(nodes * 2 + go_left)
+        return self.leaf_value.take(nodes).sum(axis=1, dtype=np.float32) + self.base_score
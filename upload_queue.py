@@ -0,0 +1,87 @@
+# upload_queue.py
+# Firebase Storage 업로드를 요청 처리 경로에서 분리하는 백그라운드 업로더
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundUploader:
+    """
+    제한된 크기의 스레드 풀로 Storage 업로드를 처리합니다.
+
+    - max_pending: 대기 + 진행 중인 업로드 최대 개수. 가득 차면 enqueue_timeout 동안 기다린 뒤 거절(backpressure).
+    - max_retries: 실패 시 재시도 횟수 (retry_backoff * 2^n 초 대기).
+    - 업로드가 끝나면 on_done(public_url, error) 콜백이 업로드 스레드에서 호출됩니다.
+
+    bucket 은 blob(path) -> upload_from_string / make_public / public_url 을 제공하는 객체면 되므로
+    local_bucket.LocalBucket 으로 네트워크 없이 테스트할 수 있습니다.
+    """
+
+    def __init__(self, bucket, max_workers=4, max_pending=64, max_retries=3, retry_backoff=0.5, enqueue_timeout=2.0):
+        self.bucket = bucket
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.enqueue_timeout = enqueue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='storage-upload')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'rejected': 0, 'uploaded': 0, 'failed': 0, 'retries': 0, 'in_flight': 0}
+
+    def submit(self, path, data, content_type, on_done):
+        """업로드를 큐에 넣습니다. 큐가 가득 차 enqueue_timeout 안에 자리가 나지 않으면 False 를 반환합니다."""
+        if not self._slots.acquire(timeout=self.enqueue_timeout):
+            self._count('rejected')
+            return False
+        self._count('submitted')
+        self._count('in_flight')
+        try:
+            self._executor.submit(self._run, path, data, content_type, on_done)
+        except RuntimeError: # shutdown 이후 제출
+            self._slots.release()
+            self._count('in_flight', -1)
+            self._count('rejected')
+            return False
+        return True
+
+    def _run(self, path, data, content_type, on_done):
+        error = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    blob = self.bucket.blob(path)
+                    blob.upload_from_string(data, content_type=content_type)
+                    blob.make_public() # 공개적으로 접근 가능하게 설정
+                    self._count('uploaded')
+                    self._notify(on_done, blob.public_url, None)
+                    return
+                except Exception as e:
+                    error = e
+                    if attempt < self.max_retries:
+                        self._count('retries')
+                        time.sleep(self.retry_backoff * (2 ** attempt))
+            self._count('failed')
+            self._notify(on_done, None, error)
+        finally:
+            self._count('in_flight', -1)
+            self._slots.release()
+
+    def _notify(self, on_done, public_url, error):
+        try:
+            on_done(public_url, error)
+        except Exception as e:
+            logger.error("[Upload Queue] 업로드 완료 콜백 오류: %s", e)
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self._stats[key] += delta
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, max_pending=self.max_pending)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
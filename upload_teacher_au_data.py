@@ -1,58 +1,30 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
-import cv2
-import mediapipe as mp
-import numpy as np
+# upload_teacher_au_data.py
+# 선생님 이미지에서 AU 데이터를 추출해 Firestore 'teacher_au_data' 컬렉션에 저장합니다.
+# - 이미지 내용 해시를 문서에 함께 저장하고, 해시와 모델이 같으면 다시 계산/저장하지 않습니다.
+# - 바뀐 이미지만 프로세스 풀에서 병렬로 분석하고, 결정적인 문서 ID(<선생님>_<라운드>)로 WriteBatch(최대 500건) 저장합니다.
+#
+# 사용법:
+#   python upload_teacher_au_data.py [선생님 이미지 폴더 ...] [--teacher emma ...] [--workers N] [--force]
+#   python upload_teacher_au_data.py --dry-run [--dry-run-state state.json]   # 네트워크 없이 로컬 가짜 Firestore 사용
+import argparse
+import json
 import os
-import json # feature_cols 로드를 위해 필요
-import xgboost as xgb # XGBoost 모델 로드를 위해 추가
+from concurrent.futures import ProcessPoolExecutor
 
-# --- Firebase 초기화 ---
-# serviceAccountKey.json 파일 경로 (현재 스크립트와 같은 폴더에 있어야 함)
-service_account_key_path = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
+from au_features import AUFeatureExtractor
+from local_firestore import LocalFirestore, MAX_BATCH_WRITES
+from teacher_reference import discover_teacher_images, file_sha256, model_fingerprint
 
-if not firebase_admin._apps:
-    try:
-        cred = credentials.Certificate(service_account_key_path)
-        firebase_admin.initialize_app(cred)
-        print("[Firebase] Firebase 앱이 성공적으로 초기화되었습니다.")
-    except Exception as e:
-        print(f"[Firebase] Firebase 앱 초기화 실패: {e}")
-        print("Firebase 초기화에 실패했습니다. 스크립트를 종료합니다.")
-        exit() # 초기화 실패 시 스크립트 종료
-
-db = firestore.client() # Firestore 클라이언트 초기화
-
-# --- MediaPipe 초기화 ---
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(
-    static_image_mode=True, # 이미지 처리용이므로 True
-    max_num_faces=1,
-    refine_landmarks=True,
-    min_detection_confidence=0.5
-)
-
-# --- feature_cols 로드 ---
-feature_cols = []
-try:
-    # feature_cols.json 파일의 인코딩이 UTF-8인지 확인하세요.
-    with open('feature_cols.json', 'r', encoding='utf-8') as f:
-        feature_cols = json.load(f)
-    print("feature_cols.json 로드 완료.")
-except Exception as e:
-    print(f"feature_cols.json 로드 실패: {e}")
-    print("feature_cols 파일 없이는 AU 계산이 어렵습니다. 스크립트를 종료합니다.")
-    exit() # feature_cols 로드 실패 시 스크립트 종료
-
-# --- XGBoost 모델 로드 (모든 선생님 AU 데이터의 overall_score 예측용) ---
-overall_score_model = None # 모든 선생님에 대한 점수 계산용 모델
-try:
-    overall_score_model = xgb.XGBRegressor()
-    overall_score_model.load_model('expression_similarity_model.json') # <-- app.py와 동일한 모델 사용
-    print("Overall Score 예측 모델 로드 완료.")
-except Exception as e:
-    print(f"Overall Score 예측 모델 로드 실패: {e}. 선생님 overall_score는 임의 계산됩니다.")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+MODEL_PATH = os.path.join(BASE_DIR, 'expression_similarity_model.json')
+FEATURE_COLS_PATH = os.path.join(BASE_DIR, 'feature_cols.json')
+
+# --- 선생님 이미지 경로 설정 ---
+TEACHERS_IMAGE_BASE_PATH = os.path.join(STATIC_DIR, 'images', 'teachers') # 기본 선생님 이미지 폴더
+
+# --- Firestore에 저장할 컬렉션 이름 ---
+COLLECTION_NAME = 'teacher_au_data' # 선생님 AU 데이터 저장 컬렉션
 
 # AU 계산을 위한 랜드마크 인덱스 (FACS 기준, MediaPipe 랜드마크 기반)
 AU_LANDMARKS = {
@@ -64,152 +36,221 @@ AU_LANDMARKS = {
     'AU25': [13, 14] # 입술 개방 (lips part)
 }
 
-# app.py의 calculate_au 함수와 동일 (복사해 옴)
-def calculate_au(landmarks, image_shape, feature_cols): # feature_cols 인자 추가
-    """MediaPipe 랜드마크 기반 AU 계산 (거리 기반)"""
-    au_dict = {}
-    
-    # landmarks가 비어있으면 0으로 채움
-    if not (isinstance(landmarks, np.ndarray) and landmarks.any()):
-        if feature_cols: # feature_cols가 존재할 때만 채움
-            for col in feature_cols:
-                au_dict[col] = 0.0
-        return au_dict
-    
-    # 랜드마크를 픽셀 값으로 변환 (정규화된 값 * 이미지 크기)
-    # Python MediaPipe 랜드마크는 0.0 ~ 1.0 정규화된 값입니다.
-    pixel_landmarks = np.array([
-        (lm.x * image_shape[1], lm.y * image_shape[0])
-        for lm in landmarks # MediaPipe Result 객체의 landmarks는 직접 lm.x, lm.y 접근 가능
-    ], dtype=np.float32)
-
-    # 얼굴 크기 변화에 둔감하도록, 특정 기준선으로 AU 값을 정규화 (눈 사이 거리)
-    # 랜드마크 인덱스가 유효한지 먼저 확인
-    if 133 < len(pixel_landmarks) and 362 < len(pixel_landmarks):
-        left_eye_inner = pixel_landmarks[133]
-        right_eye_inner = pixel_landmarks[362]
-        eye_distance = np.linalg.norm(left_eye_inner - right_eye_inner)
-        normalization_factor = eye_distance if eye_distance > 0.01 else 1 # 0으로 나누는 것 방지
-    else:
-        normalization_factor = 1 # 눈 랜드마크 없으면 정규화 안함
-
-    # 기본 AU 계산 (랜드마크 간 유클리드 거리)
-    for au, indices in AU_LANDMARKS.items():
-        if indices[0] < len(pixel_landmarks) and indices[1] < len(pixel_landmarks):
-            p1 = pixel_landmarks[indices[0]]
-            p2 = pixel_landmarks[indices[1]]
-            distance = np.linalg.norm(p1 - p2)
-            au_dict[au] = distance / normalization_factor # 정규화된 거리
-        else:
-            au_dict[au] = 0.0
-    
-    # 가중치 컬럼 생성 (모델이 요구하는 형식에 맞춤)
-    # feature_cols에 'AU01_w'와 같은 키가 있다면, 해당 AU 값 * 0.8 등으로 생성
-    final_au_features = {} # 먼저 딕셔너리 초기화
-    for col in feature_cols:
-        if col.endswith('_w'):
-            base_au = col.replace('_w', '')
-            final_au_features[col] = au_dict.get(base_au, 0.0) * 0.8 # 예시 가중치
+# 눈 안쪽 사이 거리 (얼굴 크기 변화에 둔감하도록 AU 값을 정규화하는 기준선)
+EYE_NORMALIZE_PAIR = [133, 362]
+
+
+def load_feature_cols():
+    # feature_cols.json 파일의 인코딩이 UTF-8인지 확인하세요.
+    with open(FEATURE_COLS_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def document_id(teacher_id, round_number):
+    """같은 선생님/라운드는 항상 같은 문서에 저장 (재실행해도 중복 문서가 생기지 않음)."""
+    return f"{teacher_id}_{int(round_number):02d}"
+
+
+def static_web_path(image_path):
+    """static 폴더 아래 이미지면 웹 경로(/static/...)를 반환합니다."""
+    relative = os.path.relpath(os.path.abspath(image_path), STATIC_DIR)
+    if relative.startswith('..'):
+        return None
+    return '/static/' + relative.replace(os.sep, '/')
+
+
+# --- 워커 프로세스 (이미지 분석) ---
+_worker = None
+
+
+def _init_worker(feature_cols, model_path):
+    """워커마다 FaceMesh / AU 추출기 / 점수 모델을 한 번만 준비합니다."""
+    global _worker
+    from face_mesh_pool import FaceMeshPool
+    from face_pipeline import create_static_face_mesh
+    from tree_scorer import TreeEnsembleScorer
+
+    overall_score_model = None # 모든 선생님에 대한 점수 계산용 모델
+    try:
+        overall_score_model = TreeEnsembleScorer.load(model_path) # <-- app.py와 동일한 모델 사용
+    except Exception as e:
+        print(f"Overall Score 예측 모델 로드 실패: {e}. 선생님 overall_score는 임의 계산됩니다.")
+    _worker = {
+        'face_mesh_pool': FaceMeshPool(create_static_face_mesh, size=1),
+        'au_extractor': AUFeatureExtractor(feature_cols, au_landmarks=AU_LANDMARKS, normalize_pair=EYE_NORMALIZE_PAIR),
+        'model': overall_score_model,
+    }
+
+
+def process_teacher_image(task):
+    """(teacher_id, round_number, image_path, image_sha256, model_hash) -> (Firestore 문서 데이터, 상태)"""
+    from face_pipeline import analyze_image
+
+    teacher_id, round_number, image_path, image_hash, model_hash = task
+    au_extractor = _worker['au_extractor']
+    overall_score_model = _worker['model']
+
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+    au_row, overall_score, status = analyze_image(image_bytes, _worker['face_mesh_pool'], au_extractor, overall_score_model)
+
+    if status == 'ok':
+        au_detail_values = {k: float(f"{v:.4f}") for k, v in au_extractor.to_dict(au_row).items()}
+        if overall_score_model is not None:
+            overall_score = float(f"{overall_score:.4f}")
         else:
-            final_au_features[col] = au_dict.get(col, 0.0) # au_dict에 있는 값 사용
+            # 모델이 없으면 AU 상세 값 기반으로 임의 계산 (AU12 값을 0-100 스케일로 변환, 단순 참고용)
+            overall_score = float(f"{(au_detail_values.get('AU12', 0.0) * 50):.4f}")
+            overall_score = min(max(overall_score, 0.0), 100.0)
+    else:
+        overall_score = 0.0
+        au_detail_values = {col: 0.0 for col in au_extractor.feature_cols} # 모든 AU를 0으로
 
-    return final_au_features
+    return {
+        'teacher_id': teacher_id,
+        'round_number': round_number,
+        'overall_score': overall_score,
+        'au_detail_values': au_detail_values,
+        'image_path_static': static_web_path(image_path), # 웹 경로 저장
+        'image_sha256': image_hash,
+        'model_hash': model_hash,
+    }, status
 
 
-# --- 선생님 이미지 경로 설정 ---
-TEACHERS_IMAGE_BASE_PATH = 'static/images/teachers' # static/images/teachers 폴더 경로
-TEACHERS = ['emma', 'olivia', 'sophia'] # 선생님 이름 목록
-TOTAL_ROUNDS = 10 # 각 선생님별 라운드 수
+# --- 변경 감지 / 저장 ---
+def find_changed_images(db, images, model_hash, force=False):
+    """저장된 문서의 이미지 해시/모델 해시와 비교해 다시 처리해야 할 이미지만 돌려줍니다."""
+    hashed = [(teacher_id, round_number, path, file_sha256(path)) for teacher_id, round_number, path in images]
+    if force:
+        return hashed, 0
+
+    collection = db.collection(COLLECTION_NAME)
+    references = [collection.document(document_id(t, r)) for t, r, _, _ in hashed]
+    stored = {}
+    for snapshot in db.get_all(references):
+        if snapshot.exists:
+            stored[snapshot.id] = snapshot.to_dict()
+
+    changed = []
+    for teacher_id, round_number, path, image_hash in hashed:
+        data = stored.get(document_id(teacher_id, round_number))
+        if data and data.get('image_sha256') == image_hash and data.get('model_hash') == model_hash:
+            continue
+        changed.append((teacher_id, round_number, path, image_hash))
+    return changed, len(hashed) - len(changed)
+
+
+def write_documents(db, documents, timestamp):
+    """문서들을 WriteBatch(최대 500건) 단위로 저장합니다. 커밋된 배치 수를 반환합니다."""
+    collection = db.collection(COLLECTION_NAME)
+    commits = 0
+    for start in range(0, len(documents), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for data in documents[start:start + MAX_BATCH_WRITES]:
+            batch.set(collection.document(document_id(data['teacher_id'], data['round_number'])), dict(data, timestamp=timestamp))
+        batch.commit()
+        commits += 1
+    return commits
+
+
+def init_firestore():
+    """Firebase 앱을 초기화하고 (firestore client, SERVER_TIMESTAMP) 를 반환합니다."""
+    import firebase_admin
+    from firebase_admin import credentials
+    from firebase_admin import firestore
+
+    # serviceAccountKey.json 파일 경로 (현재 스크립트와 같은 폴더에 있어야 함)
+    service_account_key_path = os.path.join(BASE_DIR, 'serviceAccountKey.json')
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(service_account_key_path)
+        firebase_admin.initialize_app(cred)
+        print("[Firebase] Firebase 앱이 성공적으로 초기화되었습니다.")
+    return firestore.client(), firestore.SERVER_TIMESTAMP
+
+
+def run_ingestion(db, timestamp, image_dirs, teachers=None, workers=None, force=False):
+    """
+    이미지 폴더들을 스캔해 바뀐 이미지만 분석/저장합니다.
+    (저장한 문서 목록, 변경 없어 건너뛴 개수, 얼굴 감지 실패 개수, 읽지 못한 이미지 경로 목록) 반환.
+    읽지 못한 이미지는 저장하지 않으므로 다음 실행에서 다시 시도합니다.
+    """
+    feature_cols = load_feature_cols()
+    model_hash = model_fingerprint(MODEL_PATH, feature_cols)
+
+    images = []
+    for image_dir in image_dirs:
+        images.extend(discover_teacher_images(image_dir))
+    if teachers:
+        images = [image for image in images if image[0] in teachers]
+    if not images:
+        print("처리할 선생님 이미지가 없습니다.")
+        return [], 0, 0, []
+
+    changed, skipped = find_changed_images(db, images, model_hash, force)
+    print(f"선생님 이미지 {len(images)}개 중 변경 {len(changed)}개, 변경 없음 {skipped}개")
+    if not changed:
+        return [], skipped, 0, []
+
+    tasks = [(t, r, path, image_hash, model_hash) for t, r, path, image_hash in changed]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if workers == 1:
+        _init_worker(feature_cols, MODEL_PATH)
+        results = [process_teacher_image(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(feature_cols, MODEL_PATH)) as executor:
+            results = list(executor.map(process_teacher_image, tasks))
+
+    documents = []
+    failed = 0
+    unreadable = []
+    for (_, _, path, _), (data, status) in zip(changed, results):
+        if status == 'decode_failed':
+            unreadable.append(path)
+            print(f"오류: 이미지 로드 실패: {path} (저장하지 않고 건너뜁니다)")
+            continue
+        if status != 'ok':
+            failed += 1
+            print(f"얼굴 감지 실패: {data['teacher_id']} 라운드 {data['round_number']} ({status})")
+        else:
+            print(f"처리 완료: 선생님 '{data['teacher_id']}', 라운드 {data['round_number']} Score: {data['overall_score']}")
+        documents.append(data)
+
+    commits = write_documents(db, documents, timestamp)
+    print(f"Firestore '{COLLECTION_NAME}' 저장 완료: 문서 {len(documents)}개, 배치 커밋 {commits}회")
+    return documents, skipped, failed, unreadable
 
-# --- Firestore에 저장할 컬렉션 이름 ---
-COLLECTION_NAME = 'teacher_au_data' # 선생님 AU 데이터 저장 컬렉션
 
 # --- 메인 스크립트 실행 부분 ---
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="선생님 AU 데이터 추출 및 Firestore 업로드 (변경된 이미지만)")
+    parser.add_argument('image_dirs', nargs='*', default=[TEACHERS_IMAGE_BASE_PATH],
+                        help="<선생님>/<선생님><라운드>.png 구조의 폴더 (기본: static/images/teachers)")
+    parser.add_argument('--teacher', action='append', dest='teachers', help="특정 선생님만 처리 (여러 번 지정 가능)")
+    parser.add_argument('--workers', type=int, default=None, help="분석 워커 프로세스 수 (기본: CPU 코어 수)")
+    parser.add_argument('--force', action='store_true', help="해시가 같아도 전부 다시 처리")
+    parser.add_argument('--dry-run', action='store_true', help="Firebase 대신 로컬 가짜 Firestore 에 저장")
+    parser.add_argument('--dry-run-state', default=None, help="--dry-run 시 가짜 Firestore 내용을 저장할 JSON 파일")
+    args = parser.parse_args()
+
     print("선생님 AU 데이터 추출 및 Firestore 업로드를 시작합니다.")
-    
-    all_data_uploaded_successfully = True
-    
-    # 이미 Firebase 앱이 초기화되었는지 확인 (위에서 exit() 하지 않았다면)
-    if not firebase_admin._apps:
-        print("Firebase 앱이 초기화되지 않았습니다. 스크립트를 종료합니다.")
-        exit()
-
-    # feature_cols가 없으면 스크립트 종료 (위에서 exit() 하지 않았다면)
-    if not feature_cols:
-        print("feature_cols이 로드되지 않았습니다. 스크립트를 종료합니다.")
-        exit()
-        
-    for teacher_name in TEACHERS:
-        for round_num in range(1, TOTAL_ROUNDS + 1):
-            image_filename = f"{teacher_name}{round_num}.png"
-            image_path = os.path.join(TEACHERS_IMAGE_BASE_PATH, teacher_name, image_filename)
-            
-            if not os.path.exists(image_path):
-                print(f"경고: 이미지를 찾을 수 없습니다: {image_path}. 이 라운드는 건너뜁니다.")
-                all_data_uploaded_successfully = False
-                continue
-            
-            print(f"처리 중: 선생님 '{teacher_name}', 라운드 {round_num} ({image_path})")
-            
-            image = cv2.imread(image_path)
-            if image is None:
-                print(f"오류: 이미지 로드 실패: {image_path}")
-                all_data_uploaded_successfully = False
-                continue
-            
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            results = face_mesh.process(image_rgb)
-            
-            overall_score = 0.0
-            au_detail_values = {}
-            
-            if results.multi_face_landmarks:
-                landmarks_list = results.multi_face_landmarks[0].landmark # MediaPipe 랜드마크 리스트
-                
-                # AU 계산 (정규화된 랜드마크와 이미지 shape 전달)
-                calculated_au_features = calculate_au(landmarks_list, image.shape, feature_cols=feature_cols) # feature_cols 인자 전달
-                au_detail_values = {k: float(f"{v:.4f}") for k, v in calculated_au_features.items()}
-                
-                # overall_score는 XGBoost 모델로 예측 (모델이 있다면)
-                if overall_score_model is not None and feature_cols: # <-- overall_score_model 사용
-                    user_X = np.array([[calculated_au_features.get(col, 0.0) for col in feature_cols]])
-                    overall_score = float(f"{overall_score_model.predict(user_X)[0]:.4f}")
-                    print(f"   XGBoost 예측 Score: {overall_score}")
-                else:
-                    # 모델이 없으면 AU 상세 값 기반으로 임의 계산 (app.py와 유사하게)
-                    if 'AU12' in au_detail_values:
-                        # AU12 값을 0-100 스케일로 변환 (예시)
-                        # 실제 모델이 없는 경우, 이 값은 단순 참고용
-                        overall_score = float(f"{(au_detail_values['AU12'] * 50):.4f}") 
-                        if overall_score > 100: overall_score = 100
-                        if overall_score < 0: overall_score = 0
-                    else:
-                        overall_score = 0.0
-                    print(f"   (모델 없음) 임의 계산 Score: {overall_score}")
-
-            else:
-                print(f"얼굴 감지 실패: {image_path}")
-                overall_score = 0.0 
-                au_detail_values = {col: 0.0 for col in feature_cols} # 모든 AU를 0으로
-            
-            # Firestore에 데이터 저장
-            try:
-                doc_ref = db.collection(COLLECTION_NAME).add({
-                    'teacher_id': teacher_name,
-                    'round_number': round_num,
-                    'overall_score': overall_score,
-                    'au_detail_values': au_detail_values,
-                    'image_path_static': f'/static/images/teachers/{teacher_name}/{image_filename}', # 웹 경로 저장
-                    'timestamp': firestore.SERVER_TIMESTAMP
-                })
-                print(f"성공: '{teacher_name}', 라운드 {round_num} 데이터 Firestore 저장 완료. 문서 ID: {doc_ref[1].id}")
-            except Exception as e:
-                print(f"오류: '{teacher_name}', 라운드 {round_num} Firestore 저장 실패: {e}")
-                all_data_uploaded_successfully = False
-    
-    if all_data_uploaded_successfully:
-        print("\n모든 선생님 AU 데이터 추출 및 Firestore 업로드 완료.")
+    if args.dry_run:
+        db, timestamp = LocalFirestore(args.dry_run_state), 'SERVER_TIMESTAMP'
     else:
-        print("\n일부 데이터 업로드에 실패했습니다. 로그를 확인해주세요.")
\ No newline at end of file
+        try:
+            db, timestamp = init_firestore()
+        except Exception as e:
+            print(f"[Firebase] Firebase 앱 초기화 실패: {e}")
+            print("Firebase 초기화에 실패했습니다. 스크립트를 종료합니다.")
+            raise SystemExit(1)
+
+    _, _, failed, unreadable = run_ingestion(db, timestamp, args.image_dirs, args.teachers, args.workers, args.force)
+    if unreadable:
+        print(f"\n일부 이미지({len(unreadable)}개)를 읽지 못해 업로드하지 않았습니다: {', '.join(unreadable)}")
+    if failed:
+        print(f"\n일부 이미지({failed}개)에서 얼굴을 찾지 못했습니다. 로그를 확인해주세요.")
+    if not failed and not unreadable:
+        print("\n모든 선생님 AU 데이터 추출 및 Firestore 업로드 완료.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# video_analysis.py
+# 녹화된 재활 세션 영상을 프레임 단위로 읽어 추적 모드 FaceMesh -> AU 특징 -> 점수(묶음 예측) 시계열과 최고 표정 요약을 만드는 모듈
+#
+# 사용법:
+#   python video_analysis.py session.mp4 [--stride 2] [--max-side 640] [--smoothing one_euro]
+#                            [--csv timeseries.csv] [--json summary.json] [--peaks 5] [--peak-gap 1.0]
+import argparse
+import csv
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from au_tracking import SMOOTHING_METHODS, create_filter
+
+
+class VideoAnalysis:
+    """
+    분석된 프레임들의 시계열 (프레임 순서).
+      frame_indices: 원본 영상에서의 프레임 번호, timestamps: 초, face: 얼굴 감지 여부,
+      scores: 점수 (얼굴 없음은 0), features: (N, 특징 수) float32 (얼굴 없음은 0)
+    """
+
+    def __init__(self, frame_indices, timestamps, face, scores, features, fps, source_frames, elapsed):
+        self.frame_indices = frame_indices
+        self.timestamps = timestamps
+        self.face = face
+        self.scores = scores
+        self.features = features
+        self.fps = fps
+        self.source_frames = source_frames # 읽은(건너뛴 것 포함) 원본 프레임 수
+        self.elapsed = elapsed
+
+    def __len__(self):
+        return len(self.frame_indices)
+
+    def peaks(self, count=5, min_gap=1.0):
+        """점수가 가장 높은 순으로, 서로 min_gap 초 이상 떨어진 프레임 위치(시계열 인덱스)를 최대 count 개."""
+        order = np.argsort(-self.scores, kind='stable')
+        chosen = []
+        for i in order:
+            if not self.face[i]:
+                break # 점수 내림차순이므로 이후는 모두 얼굴 없음(0점) 이하
+            if all(abs(self.timestamps[i] - self.timestamps[j]) >= min_gap for j in chosen):
+                chosen.append(int(i))
+                if len(chosen) >= count:
+                    break
+        return chosen
+
+    def summary(self, au_extractor, peaks=5, min_gap=1.0):
+        face_scores = self.scores[self.face]
+        detail = au_extractor.detail_columns
+        summary = {
+            'frames_analyzed': len(self),
+            'source_frames': self.source_frames,
+            'duration_s': round(self.source_frames / self.fps, 3) if self.fps else None,
+            'fps': round(self.fps, 3),
+            'face_ratio': round(float(self.face.mean()), 4) if len(self) else 0.0,
+            'score': None,
+            'peaks': [],
+            'au_max': {},
+            'analysis_s': round(self.elapsed, 3),
+            'frames_per_s': round(len(self) / self.elapsed, 1) if self.elapsed else None,
+        }
+        if len(face_scores):
+            p50, p90 = np.percentile(face_scores, [50, 90])
+            summary['score'] = {
+                'mean': round(float(face_scores.mean()), 4),
+                'p50': round(float(p50), 4),
+                'p90': round(float(p90), 4),
+                'max': round(float(face_scores.max()), 4),
+            }
+            face_features = self.features[self.face]
+            summary['au_max'] = {au_extractor.feature_cols[i]: round(float(face_features[:, i].max()), 4) for i in detail}
+        for i in self.peaks(peaks, min_gap):
+            summary['peaks'].append({
+                'time_s': round(float(self.timestamps[i]), 3),
+                'frame': int(self.frame_indices[i]),
+                'score': round(float(self.scores[i]), 4),
+                'au_detail': au_extractor.detail_values(self.features[i]),
+            })
+        return summary
+
+    def write_csv(self, path, feature_cols):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'time_s', 'face', 'score'] + list(feature_cols))
+            for i in range(len(self)):
+                writer.writerow([int(self.frame_indices[i]), f"{self.timestamps[i]:.3f}", int(self.face[i]),
+                                 f"{self.scores[i]:.6g}"] + [f"{v:.6g}" for v in self.features[i]])
+
+
+class VideoAnalyzer:
+    """
+    영상을 한 프레임씩 읽어 분석합니다. 디코딩한 프레임은 바로 버리므로 메모리는 batch_size 와 결과 시계열 크기에만 비례합니다.
+
+    - stride: stride 프레임마다 하나만 분석 (건너뛰는 프레임은 grab() 만 해 픽셀 변환 비용을 아낌).
+    - 추적 모드 FaceMesh 는 이전 프레임의 얼굴 위치를 이용하므로 영상 하나당 새 인스턴스를 만듭니다.
+    - max_side > 0 이면 FaceMesh 입력만 축소하고, AU 거리는 원본 해상도 기준 픽셀로 계산합니다 (업로드 사진 분석과 같은 기준).
+    - smoothing: AU 거리에 적용할 프레임 간 필터 (au_tracking 과 같은 one_euro / ema / none).
+    - 특징 행 계산과 model.predict 는 batch_size 프레임씩 모아 한 번에 처리합니다.
+    """
+
+    def __init__(self, face_mesh_factory, au_extractor, model, stride=1, batch_size=64, max_side=0, smoothing='none',
+                 min_cutoff=1.0, beta=0.05, alpha=0.5, default_fps=30.0):
+        if stride < 1:
+            raise ValueError("stride 는 1 이상이어야 합니다.")
+        if smoothing not in SMOOTHING_METHODS:
+            raise ValueError(f"알 수 없는 smoothing 방식: {smoothing} (가능: {', '.join(SMOOTHING_METHODS)})")
+        self.face_mesh_factory = face_mesh_factory
+        self.au_extractor = au_extractor
+        self.model = model
+        self.stride = int(stride)
+        self.batch_size = max(1, int(batch_size))
+        self.max_side = max_side
+        self.filter_options = {'method': smoothing, 'min_cutoff': min_cutoff, 'beta': beta, 'alpha': alpha}
+        self.default_fps = default_fps
+
+    def analyze(self, source, on_progress=None):
+        """
+        source: 영상 파일 경로 또는 VideoCapture 와 같은 인터페이스(isOpened/read, 선택적으로 grab/get/release)의 객체.
+        on_progress(source_frames, analyzed_frames) 는 묶음을 처리할 때마다 호출됩니다.
+        """
+        own_capture = isinstance(source, (str, os.PathLike))
+        capture = cv2.VideoCapture(os.fspath(source)) if own_capture else source
+        if not capture.isOpened():
+            raise IOError(f"영상을 열 수 없습니다: {source}")
+        get = getattr(capture, 'get', None)
+        fps = (get(cv2.CAP_PROP_FPS) if get is not None else 0.0) or self.default_fps
+        grab = getattr(capture, 'grab', None) or (lambda: capture.read()[0])
+
+        face_mesh = self.face_mesh_factory()
+        smoothing_filter = create_filter(self.filter_options['method'], min_cutoff=self.filter_options['min_cutoff'],
+                                         beta=self.filter_options['beta'], alpha=self.filter_options['alpha'])
+        num_pairs = len(self.au_extractor.pair_index)
+        batch_distances = np.zeros((self.batch_size, num_pairs), dtype=np.float32)
+        batch_face = np.zeros(self.batch_size, dtype=bool)
+        batch_indices = np.zeros(self.batch_size, dtype=np.int64)
+        filled = 0
+        chunks = {'frame': [], 'face': [], 'score': [], 'features': []}
+
+        def flush():
+            face = batch_face[:filled].copy()
+            rows = self.au_extractor.rows_from_distances(batch_distances[:filled])
+            rows[~face] = 0.0
+            scores = np.zeros(filled, dtype=np.float32)
+            if self.model is not None and self.au_extractor.feature_cols and face.any():
+                scores[face] = self.model.predict(rows[face])
+            chunks['frame'].append(batch_indices[:filled].copy())
+            chunks['face'].append(face)
+            chunks['score'].append(scores)
+            chunks['features'].append(rows)
+
+        started = time.perf_counter()
+        index = 0
+        analyzed = 0
+        try:
+            while True:
+                if index % self.stride:
+                    if not grab():
+                        break
+                    index += 1
+                    continue
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                height, width = frame.shape[:2]
+                if self.max_side and max(width, height) > self.max_side:
+                    scale = self.max_side / max(width, height)
+                    frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                       interpolation=cv2.INTER_AREA)
+                results = face_mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                if results.multi_face_landmarks:
+                    distances = self.au_extractor.distances_from_face_landmarks(results.multi_face_landmarks[0], (width, height))
+                    if smoothing_filter is not None:
+                        distances = smoothing_filter(distances, index / fps)
+                    batch_distances[filled] = distances
+                    batch_face[filled] = True
+                else:
+                    batch_distances[filled] = 0.0
+                    batch_face[filled] = False
+                    if smoothing_filter is not None:
+                        smoothing_filter.reset() # 얼굴을 놓치면 다음 얼굴부터 다시 필터링
+                batch_indices[filled] = index
+                filled += 1
+                analyzed += 1
+                index += 1
+                if filled == self.batch_size:
+                    flush()
+                    filled = 0
+                    if on_progress is not None:
+                        on_progress(index, analyzed)
+            if filled:
+                flush()
+        finally:
+            close = getattr(face_mesh, 'close', None)
+            if close is not None:
+                close()
+            if own_capture:
+                capture.release()
+
+        frame_indices = np.concatenate(chunks['frame']) if chunks['frame'] else np.zeros(0, dtype=np.int64)
+        return VideoAnalysis(
+            frame_indices,
+            (frame_indices / fps).astype(np.float64),
+            np.concatenate(chunks['face']) if chunks['face'] else np.zeros(0, dtype=bool),
+            np.concatenate(chunks['score']) if chunks['score'] else np.zeros(0, dtype=np.float32),
+            np.concatenate(chunks['features']) if chunks['features'] else np.zeros((0, len(self.au_extractor.feature_cols)), dtype=np.float32),
+            fps,
+            index,
+            time.perf_counter() - started,
+        )
+
+
+def main():
+    from au_features import AUFeatureExtractor
+    from face_pipeline import create_tracking_face_mesh
+    from teacher_reference import FEATURE_COLS_PATH, MODEL_PATH
+    from tree_scorer import TreeEnsembleScorer
+
+    parser = argparse.ArgumentParser(description="녹화 영상의 프레임별 AU 특징 / 점수 시계열과 최고 표정 요약")
+    parser.add_argument('video', help="영상 파일")
+    parser.add_argument('--stride', type=int, default=1, help="N 프레임마다 하나만 분석")
+    parser.add_argument('--batch-size', type=int, default=64, help="묶음 예측 크기")
+    parser.add_argument('--max-side', type=int, default=0, help="FaceMesh 입력의 최대 긴 변 (0 이면 원본)")
+    parser.add_argument('--smoothing', choices=SMOOTHING_METHODS, default='none', help="AU 거리 프레임 간 필터")
+    parser.add_argument('--peaks', type=int, default=5, help="요약에 넣을 최고 표정 수")
+    parser.add_argument('--peak-gap', type=float, default=1.0, help="최고 표정 사이 최소 간격(초)")
+    parser.add_argument('--csv', default=None, help="프레임별 시계열 CSV 출력 경로")
+    parser.add_argument('--json', dest='json_path', default=None, help="요약 JSON 출력 경로")
+    args = parser.parse_args()
+
+    with open(FEATURE_COLS_PATH, 'r', encoding='utf-8') as f:
+        feature_cols = json.load(f)
+    au_extractor = AUFeatureExtractor(feature_cols)
+    analyzer = VideoAnalyzer(create_tracking_face_mesh, au_extractor, TreeEnsembleScorer.load(MODEL_PATH),
+                             stride=args.stride, batch_size=args.batch_size, max_side=args.max_side, smoothing=args.smoothing)
+
+    last_report = [time.perf_counter()]
+
+    def progress(source_frames, analyzed):
+        if time.perf_counter() - last_report[0] >= 5.0:
+            last_report[0] = time.perf_counter()
+            print(f"[video_analysis] 프레임 {source_frames} 읽음, {analyzed} 분석")
+
+    analysis = analyzer.analyze(args.video, on_progress=progress)
+    summary = analysis.summary(au_extractor, peaks=args.peaks, min_gap=args.peak_gap)
+    summary['video'] = args.video
+    summary['stride'] = args.stride
+    if args.csv:
+        analysis.write_csv(args.csv, feature_cols)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+# video_stream.py
+# 웹캠 캡처 한 개를 여러 /video_feed 클라이언트에 나눠주는 브로드캐스터
+import asyncio
+import collections
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SyntheticFrameSource:
+    """
+    cv2.VideoCapture 와 같은 인터페이스(isOpened/read/release)의 가짜 카메라.
+    실제 웹캠 없이 스트리밍 루프를 실행/테스트할 때 사용합니다.
+    """
+
+    def __init__(self, width=640, height=480, fps=30.0, max_frames=None):
+        self.width = width
+        self.height = height
+        self.interval = 1.0 / fps if fps else 0.0
+        self.max_frames = max_frames
+        self.count = 0
+        self._opened = True
+        self._next_time = time.perf_counter()
+        self._base = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        if not self._opened or (self.max_frames is not None and self.count >= self.max_frames):
+            return False, None
+        if self.interval:
+            delay = self._next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_time = max(self._next_time + self.interval, time.perf_counter() - self.interval)
+        shifted = np.roll(self._base, self.count * 4, axis=1)
+        frame = cv2.merge([shifted, np.full_like(shifted, self.count % 256), 255 - shifted])
+        self.count += 1
+        return True, frame
+
+    def release(self):
+        self._opened = False
+
+
+# 스트림 출력 설정. width/height 는 0 이면 원본 크기 (지정하면 비율을 유지한 채 그 안에 맞춰 축소), max_fps 0 은 제한 없음
+StreamProfile = namedtuple('StreamProfile', ['width', 'height', 'quality', 'max_fps'])
+
+MIN_ADAPTIVE_QUALITY = 30
+QUALITY_STEP = 10 # 적응 시 품질 단계 (같은 단계의 클라이언트끼리 인코딩 결과를 공유하도록 10 단위)
+
+
+def parse_stream_profile(args, default):
+    """쿼리 파라미터(w, h, q, fps)로 기본 StreamProfile 을 덮어씁니다. 잘못된 값은 무시하고 범위를 제한합니다."""
+    def read(name, fallback, low, high):
+        try:
+            value = int(args.get(name, fallback))
+        except (TypeError, ValueError):
+            return fallback
+        return min(max(value, low), high)
+
+    return StreamProfile(
+        width=read('w', default.width, 0, 1920),
+        height=read('h', default.height, 0, 1080),
+        quality=read('q', default.quality, 10, 95),
+        max_fps=read('fps', default.max_fps, 0, 60),
+    )
+
+
+def fit_size(frame_width, frame_height, width, height):
+    """비율을 유지하며 (width, height) 상자에 들어가는 크기. 확대는 하지 않습니다."""
+    scale = 1.0
+    if width:
+        scale = min(scale, width / frame_width)
+    if height:
+        scale = min(scale, height / frame_height)
+    if scale >= 1.0:
+        return frame_width, frame_height
+    return max(1, int(round(frame_width * scale))), max(1, int(round(frame_height * scale)))
+
+
+class AdaptiveRate:
+    """
+    클라이언트 한 명의 전송 속도 조절기. 소켓 쓰기(yield 후 다음 요청까지 걸린 시간)가 프레임 간격보다 오래
+    걸리는 일이 이어지면 JPEG 품질과 FPS 를 낮추고, 한동안 여유가 있으면 목표 값으로 천천히 되돌립니다.
+    """
+
+    def __init__(self, profile):
+        self.target = profile
+        self.quality = profile.quality
+        self.fps = float(profile.max_fps)
+        self.slow_writes = 0
+        self.fast_writes = 0
+        self.degrades = 0
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps if self.fps > 0 else 0.0
+
+    def on_write(self, seconds):
+        budget = self.interval or (1.0 / 30)
+        if seconds > budget:
+            self.fast_writes = 0
+            self.slow_writes += 1
+            if self.slow_writes >= 2:
+                self.slow_writes = 0
+                self.degrades += 1
+                self.quality = max(MIN_ADAPTIVE_QUALITY, self.quality - QUALITY_STEP)
+                self.fps = max(2.0, (self.fps or 30.0) * 0.75)
+        else:
+            self.slow_writes = 0
+            self.fast_writes += 1
+            if self.fast_writes >= max(10, int(self.fps * 2)): # 약 2초 동안 여유가 있으면 한 단계 회복
+                self.fast_writes = 0
+                self.quality = min(self.target.quality, self.quality + QUALITY_STEP)
+                if self.target.max_fps:
+                    self.fps = min(float(self.target.max_fps), self.fps / 0.75)
+                else:
+                    self.fps = 0.0 if self.fps / 0.75 >= 30 else self.fps / 0.75
+
+
+class FrameBroadcaster:
+    """
+    캡처 스레드 하나가 프레임을 읽어(좌우 반전) 작은 링 버퍼에 넣고, 구독자(클라이언트)들은 각자 가장 최근 프레임을 가져갑니다.
+    JPEG 인코딩은 프레임마다 (크기, 품질) 조합별로 한 번만 하고, 같은 설정의 클라이언트들이 결과를 공유합니다.
+
+    - 캡처 스레드는 구독자를 기다리지 않으므로 느린 클라이언트는 중간 프레임을 건너뛸 뿐 다른 클라이언트를 막지 않습니다.
+    - 클라이언트마다 max_fps 로 전송 간격을 제한하고, 소켓 쓰기가 밀리면 품질/FPS 를 자동으로 낮춥니다 (AdaptiveRate).
+    - 구독자가 없으면 idle_timeout 후 캡처 스레드를 멈추고 카메라를 닫습니다. 다음 구독 시 다시 엽니다.
+    - frames() 는 스레드 서버용(클라이언트마다 스레드 하나가 대기), async_frames() 는 ASGI 서버용(이벤트 루프에서 대기)입니다.
+    """
+
+    def __init__(self, source_factory, default_profile=None, ring_size=2, flip=True, idle_timeout=5.0, wait_timeout=2.0, adaptive=True):
+        self._source_factory = source_factory
+        self.default_profile = default_profile or StreamProfile(0, 0, 80, 0)
+        self.adaptive = adaptive
+        self.flip = flip
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._ring = collections.deque(maxlen=max(1, ring_size)) # (seq, BGR frame)
+        self._seq = 0
+        self._encode_lock = threading.Lock()
+        self._encoded_seq = 0
+        self._encoded = {} # 최신 프레임의 (width, height, quality) -> jpeg bytes
+        self._subscribers = 0
+        self._async_waiters = set() # async_frames 구독자의 (이벤트 루프, asyncio.Event)
+        self._running = False
+        self._stop = False
+        self._thread = None
+        self._stats = {'captured': 0, 'encoded': 0, 'encode_failed': 0, 'delivered': 0, 'dropped': 0,
+                       'bytes_sent': 0, 'degrades': 0, 'capture_starts': 0}
+
+    # --- 캡처 측 ---
+    def _ensure_running(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._stop = False
+            self._stats['capture_starts'] += 1
+            self._thread = threading.Thread(target=self._capture_loop, name='frame-broadcaster', daemon=True)
+            self._thread.start()
+
+    def _capture_loop(self):
+        source = None
+        try:
+            source = self._source_factory()
+            if source is None or not source.isOpened():
+                logger.error("[Video Stream] 웹캠을 열 수 없습니다.")
+                return
+            idle_since = None
+            while True:
+                with self._cond:
+                    if self._stop:
+                        break
+                    subscribers = self._subscribers
+                if subscribers == 0:
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > self.idle_timeout:
+                        break
+                else:
+                    idle_since = None
+
+                success, frame = source.read()
+                if not success:
+                    break
+                if self.flip:
+                    frame = cv2.flip(frame, 1)
+                self._publish(frame)
+        finally:
+            if source is not None:
+                source.release()
+            with self._cond:
+                self._running = False
+                self._thread = None
+                self._cond.notify_all()
+                self._wake_async_waiters()
+
+    def _publish(self, frame):
+        with self._cond:
+            self._stats['captured'] += 1
+            self._seq += 1
+            self._ring.append((self._seq, frame))
+            self._cond.notify_all()
+            self._wake_async_waiters()
+
+    def _wake_async_waiters(self):
+        """self._cond 를 잡은 상태에서 호출. 각 구독자의 이벤트 루프에 깨우기를 예약합니다."""
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass # 이벤트 루프가 이미 닫힘 (구독 해제 직전)
+
+    def _encode(self, seq, frame, width, height, quality):
+        """seq 프레임을 (width, height, quality) 로 인코딩. 같은 프레임/설정은 한 번만 인코딩합니다."""
+        key = (width, height, quality)
+        with self._encode_lock:
+            if self._encoded_seq != seq:
+                if seq < self._encoded_seq:
+                    # 더 새 프레임이 이미 인코딩된 경우(드묾): 캐시를 건드리지 않고 따로 인코딩
+                    return self._encode_frame(frame, width, height, quality)
+                self._encoded_seq = seq
+                self._encoded = {}
+            jpeg = self._encoded.get(key)
+            if jpeg is None:
+                jpeg = self._encode_frame(frame, width, height, quality)
+                if jpeg is not None:
+                    self._encoded[key] = jpeg
+            return jpeg
+
+    def _encode_frame(self, frame, width, height, quality):
+        frame_height, frame_width = frame.shape[:2]
+        size = fit_size(frame_width, frame_height, width, height)
+        if size != (frame_width, frame_height):
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        with self._cond:
+            self._stats['encoded' if ret else 'encode_failed'] += 1
+        return buffer.tobytes() if ret else None
+
+    # --- 구독 측 ---
+    def frames(self, profile=None):
+        """
+        가장 최근 프레임을 profile(StreamProfile) 설정으로 인코딩해 내보내는 제너레이터.
+        클라이언트 연결이 끊기면(close) 구독 해제.
+        """
+        profile = profile or self.default_profile
+        rate = AdaptiveRate(profile)
+        with self._cond:
+            self._subscribers += 1
+        self._ensure_running()
+        last_seq = self._seq
+        next_send = 0.0
+        try:
+            while True:
+                # max_fps: 다음 전송 시각까지 대기 (그 사이 들어온 프레임은 건너뜀)
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                with self._cond:
+                    self._cond.wait_for(lambda: self._seq > last_seq or not self._running, timeout=self.wait_timeout)
+                    if self._seq <= last_seq:
+                        if not self._running:
+                            return # 카메라 종료/실패
+                        continue
+                    seq, frame = self._ring[-1]
+                    self._stats['dropped'] += seq - last_seq - 1
+                    last_seq = seq
+                jpeg = self._encode(seq, frame, profile.width, profile.height, rate.quality)
+                if jpeg is None:
+                    continue
+                started = time.monotonic()
+                next_send = started + rate.interval
+                yield jpeg
+                if self.adaptive:
+                    degrades = rate.degrades
+                    rate.on_write(time.monotonic() - started)
+                with self._cond:
+                    self._stats['delivered'] += 1
+                    self._stats['bytes_sent'] += len(jpeg)
+                    if self.adaptive:
+                        self._stats['degrades'] += rate.degrades - degrades
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    async def async_frames(self, profile=None):
+        """
+        frames() 의 asyncio 버전. 새 프레임을 스레드 대신 asyncio.Event 로 기다리므로 클라이언트 수만큼 스레드가 필요하지 않고,
+        JPEG 인코딩은 기본 실행기에서 합니다. 소켓 쓰기 시간은 다음 프레임을 요청할 때까지(await send) 걸린 시간입니다.
+        """
+        loop = asyncio.get_running_loop()
+        profile = profile or self.default_profile
+        rate = AdaptiveRate(profile)
+        event = asyncio.Event()
+        waiter = (loop, event)
+        with self._cond:
+            self._subscribers += 1
+            self._async_waiters.add(waiter)
+        self._ensure_running()
+        last_seq = self._seq
+        next_send = 0.0
+        try:
+            while True:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                with self._cond:
+                    if self._seq > last_seq:
+                        seq, frame = self._ring[-1]
+                        self._stats['dropped'] += seq - last_seq - 1
+                        last_seq = seq
+                    elif not self._running:
+                        return # 카메라 종료/실패
+                    else:
+                        seq = None
+                        event.clear() # 이 시점 이후의 _publish 만 깨움
+                if seq is None:
+                    try:
+                        await asyncio.wait_for(event.wait(), self.wait_timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                jpeg = await loop.run_in_executor(None, self._encode, seq, frame, profile.width, profile.height, rate.quality)
+                if jpeg is None:
+                    continue
+                started = time.monotonic()
+                next_send = started + rate.interval
+                yield jpeg
+                if self.adaptive:
+                    degrades = rate.degrades
+                    rate.on_write(time.monotonic() - started)
+                with self._cond:
+                    self._stats['delivered'] += 1
+                    self._stats['bytes_sent'] += len(jpeg)
+                    if self.adaptive:
+                        self._stats['degrades'] += rate.degrades - degrades
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+                self._async_waiters.discard(waiter)
+
+    def raw_frames(self, max_fps=0):
+        """
+        인코딩 없이 (seq, BGR frame) 을 내보내는 제너레이터 (서버 측 분석용). 구독자로 집계되므로
+        /video_feed 클라이언트가 없어도 카메라가 켜져 있습니다. max_fps 로 받는 간격을 제한합니다.
+        """
+        interval = 1.0 / max_fps if max_fps else 0.0
+        with self._cond:
+            self._subscribers += 1
+        self._ensure_running()
+        last_seq = self._seq
+        next_read = 0.0
+        try:
+            while True:
+                delay = next_read - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                with self._cond:
+                    self._cond.wait_for(lambda: self._seq > last_seq or not self._running, timeout=self.wait_timeout)
+                    if self._seq <= last_seq:
+                        if not self._running:
+                            return
+                        continue
+                    seq, frame = self._ring[-1]
+                    last_seq = seq
+                next_read = time.monotonic() + interval
+                yield seq, frame
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def latest_frame(self):
+        """(seq, BGR frame) 또는 아직 프레임이 없으면 (0, None)."""
+        with self._cond:
+            if not self._ring:
+                return 0, None
+            return self._ring[-1]
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, subscribers=self._subscribers, running=self._running, seq=self._seq)
+
+    def stop(self, timeout=2.0):
+        with self._cond:
+            self._stop = True
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)